@@ -0,0 +1,111 @@
+"""
+Vistas de alertas que se mantienen al recalcular los estados (ver actualizar_estados en estados.py).
+
+- Stock: un conjunto de codigos por estado de alerta (CRITICO y ADVERTENCIA).
+- Vencimientos: un calendario fecha de vencimiento -> codigos, con las fechas ordenadas.
+  No depende del dia de hoy, asi que "vencidos" o "vencen en los proximos N dias" son una
+  busqueda binaria sobre las fechas, sin recorrer el catalogo ni recalcular nada al cambiar el dia.
+
+Solo se tocan los productos cuyos estados se recalcularon; las vistas se rearman cuando se
+recalcula todo (primera carga o recarga desde disco).
+"""
+import bisect
+
+import numpy as np
+import pandas as pd
+
+ESTADOS_ALERTA_STOCK = ("🔴 CRITICO", "🟡 ADVERTENCIA")
+
+class VistasAlertas:
+    """
+    stock: estado -> set de codigos. _dias: fechas de vencimiento ordenadas; _por_dia: fecha -> set
+    de codigos; _dia_por_codigo: codigo -> su fecha (para moverlo de dia al cambiar).
+    """
+
+    def __init__(self):
+        self.vaciar()
+
+    def vaciar(self):
+        self.stock = {estado: set() for estado in ESTADOS_ALERTA_STOCK}
+        self._dias = []
+        self._por_dia = {}
+        self._dia_por_codigo = {}
+
+    # --- Cambios ---
+
+    def actualizar_stock(self, codigos, estados):
+        """
+        Nuevos estados de stock de esos productos (arrays alineados).
+        """
+        codigos = np.asarray(codigos, dtype=object)
+        estados = np.asarray(estados, dtype=object)
+        todos = set(codigos.tolist())
+        for estado, conjunto in self.stock.items():
+            conjunto -= todos
+            conjunto |= set(codigos[estados == estado].tolist())
+
+    def _quitar_vencimiento(self, codigo):
+        dia = self._dia_por_codigo.pop(codigo, None)
+        if dia is None:
+            return
+        codigos_dia = self._por_dia[dia]
+        codigos_dia.discard(codigo)
+        if not codigos_dia:
+            del self._por_dia[dia]
+            self._dias.pop(bisect.bisect_left(self._dias, dia))
+
+    def actualizar_vencimientos(self, codigos, fechas):
+        """
+        Nueva Fecha_Vencimiento de esos productos (NaT: sin vencimiento, sale del calendario).
+        """
+        dias = pd.to_datetime(pd.Series(fechas)).dt.normalize().tolist()
+        for codigo, dia in zip(list(codigos), dias):
+            if self._dia_por_codigo.get(codigo) == dia:
+                continue
+            self._quitar_vencimiento(codigo)
+            if pd.isna(dia):
+                continue
+            if dia not in self._por_dia:
+                self._por_dia[dia] = set()
+                bisect.insort(self._dias, dia)
+            self._por_dia[dia].add(codigo)
+            self._dia_por_codigo[codigo] = dia
+
+    def quitar(self, codigo):
+        """
+        Saca de todas las vistas un producto eliminado.
+        """
+        for conjunto in self.stock.values():
+            conjunto.discard(codigo)
+        self._quitar_vencimiento(codigo)
+
+    # --- Consultas ---
+
+    def en_alerta_stock(self):
+        return set().union(*self.stock.values())
+
+    def vencen_hasta(self, hasta, desde=None):
+        """
+        Codigos que vencen entre desde y hasta (inclusive), del que vence primero al ultimo.
+        Sin desde, incluye los ya vencidos.
+        """
+        inicio = 0 if desde is None else bisect.bisect_left(self._dias, pd.Timestamp(desde).normalize())
+        fin = bisect.bisect_right(self._dias, pd.Timestamp(hasta).normalize())
+        return [codigo for dia in self._dias[inicio:fin] for codigo in sorted(self._por_dia[dia])]
+
+    def contar_vencen(self, hasta, desde=None):
+        inicio = 0 if desde is None else bisect.bisect_left(self._dias, pd.Timestamp(desde).normalize())
+        fin = bisect.bisect_right(self._dias, pd.Timestamp(hasta).normalize())
+        return sum(len(self._por_dia[dia]) for dia in self._dias[inicio:fin])
+
+    def resumen(self, hoy, dias):
+        """
+        Cantidades para la barra lateral: stock critico, en advertencia, vencidos y que vencen en los proximos dias.
+        """
+        hoy = pd.Timestamp(hoy).normalize()
+        return {
+            "criticos": len(self.stock["🔴 CRITICO"]),
+            "advertencia": len(self.stock["🟡 ADVERTENCIA"]),
+            "vencidos": self.contar_vencen(hoy - pd.Timedelta(days=1)),
+            "por_vencer": self.contar_vencen(hoy + pd.Timedelta(days=dias), desde=hoy),
+        }
@@ -0,0 +1,605 @@
+"""
+Almacen de datos compartido: la copia en memoria de Productos, Movimientos, Usuarios y lotes,
+con sus indices y vistas, y el escritor unico que la guarda (ver escritura.py).
+
+Lo usan la app de Streamlit (un almacen por proceso, compartido por todas las sesiones) y la API
+HTTP (api.py), que aplican las mismas reglas de productos, movimientos y lotes FEFO.
+Con varias ubicaciones (ver ubicaciones.py) cada almacen es el de una sola ubicacion: envia y
+recibe transferencias por las bandejas de las demas.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from alertas import VistasAlertas
+from archivo_movimientos import MINIMO_FILAS_PARTE, ArchivoMovimientos
+from busqueda_productos import IndiceBusqueda
+from escritura import Cambios, ColaEscritura, bloqueo_de
+from esquema import concatenar, memoria_mb
+from estados import actualizar_estados
+from historial import IndiceHistorial
+from importacion import TIPO_TRANSFERENCIA, aplicar_movimientos, validar_movimientos
+from indice_productos import Catalogo, IndiceProductos
+from lotes import LibroLotes, StockInsuficiente, sincronizar_producto
+from metricas import METRICAS
+from reconstruccion import HistorialStock
+from reposicion import calcular_reposicion
+from resumen_diario import ResumenDiario
+from ubicaciones import (alta_recibida, ids_recibidos, lineas_envio, motivo_envio, movimientos_recibidos,
+                         nuevo_id_transferencia)
+
+log = logging.getLogger(__name__)
+
+@METRICAS.cronometrar("load_data")
+def load_data(almacenamiento, avisos=log):
+    """
+    Carga productos, movimientos y usuarios desde el almacenamiento configurado (CSV o SQLite).
+    Los problemas se informan con avisos.info / avisos.error (st en la app, un logger fuera de ella).
+    """
+    try:
+        if not almacenamiento.existen_usuarios():
+            avisos.info("Creando usuarios por defecto...")
+        df_usuarios = almacenamiento.leer_usuarios()
+        df_productos = almacenamiento.leer_productos()
+        df_movimientos = almacenamiento.leer_movimientos()
+    except FileNotFoundError:
+        avisos.error(f"Error: No se encontraron {almacenamiento.descripcion}.")
+        return None, None, None
+    except KeyError as e:
+        avisos.error(f"Error: Falta una columna de fecha esencial: {e}")
+        return None, None, None
+
+    # Ya en el esquema compacto (ver esquema.py)
+    log.info("Datos cargados: productos %.1f MB, movimientos %.1f MB", memoria_mb(df_productos), memoria_mb(df_movimientos))
+    return df_productos, df_movimientos, df_usuarios
+
+class AlmacenDatos:
+    """
+    Copia unica de Productos, Movimientos y Usuarios compartida por todas las sesiones del proceso.
+    Detecta cambios hechos desde fuera (otro proceso, edicion manual) y los aplica: si solo se
+    agregaron movimientos se leen unicamente los nuevos.
+    Los cambios se aplican en memoria y se encolan al escritor unico (escritura.py); cada metodo
+    de escritura devuelve la confirmacion que hay que esperar, sin tener el lock. Todo cambio se
+    hace dentro de escritura(), que serializa los procesos que comparten el almacenamiento.
+    avisos recibe los mensajes de error de la carga (st en la app, un logger en la API).
+    ubicacion (ubicaciones.Ubicacion) es la ubicacion del almacenamiento, o None si hay una sola.
+    """
+
+    def __init__(self, almacenamiento, avisos=log, ubicacion=None):
+        self.lock = threading.RLock()
+        self.almacenamiento = almacenamiento
+        self.avisos = avisos
+        self.ubicacion = ubicacion
+        self.df_productos = None
+        self.df_movimientos = None
+        self.df_usuarios = None
+        self.libro_lotes = None
+        self.indice_productos = IndiceProductos()
+        self._catalogo = None
+        self.busqueda = IndiceBusqueda()
+        self.alertas = VistasAlertas()
+        self._foto_estados = None
+        self._recargar = False
+        self.historial_stock = None
+        self.indice_historial = IndiceHistorial()
+        self.resumen_diario = None
+        self.archivo = ArchivoMovimientos(almacenamiento.directorio_historial)
+        self._dia_archivo = None
+        self.escritor = ColaEscritura(self.lock, self._foto_para_guardar, self._guardar)
+        self.bloqueo = bloqueo_de(almacenamiento.archivo_bloqueo)
+
+    def _cargar_lotes(self):
+        df_lotes = self.almacenamiento.leer_lotes()
+        if df_lotes is None:
+            # Primera vez con lotes: se migran las columnas Stock_Viejo_Restante / Fecha_Vencimiento_Pendiente
+            self.libro_lotes = LibroLotes.desde_productos(self.df_productos)
+            self.almacenamiento.guardar_lotes(self.libro_lotes)
+        else:
+            self.libro_lotes = LibroLotes.desde_dataframe(df_lotes)
+
+    def refrescar(self):
+        """
+        Carga los datos la primera vez y despues aplica solo lo que cambio en disco.
+        Devuelve True si hay datos disponibles.
+        """
+        with self.lock:
+            # Mientras el escritor tenga cambios sin guardar, la memoria esta mas al dia que el disco
+            if self.escritor.ocupada():
+                return True
+            if not self._leer_disco():
+                return False
+            if self.ubicacion is not None and self.ubicacion.bandeja.hay_nuevas():
+                with self.escritura():
+                    self._recibir_transferencias()
+            self._archivar()
+            return True
+
+    @contextmanager
+    def escritura(self):
+        """
+        Para cambiar datos: toma el lock y el bloqueo entre procesos del almacenamiento y aplica lo
+        que cambio en disco, asi los cambios parten de lo ultimo guardado por cualquier proceso.
+        El bloqueo sigue tomado hasta que el escritor guardo lo encolado adentro: otro proceso no
+        lee el disco sin esos cambios ni guarda encima de ellos su copia en memoria.
+        Se puede anidar. Adentro no hay que esperar confirmaciones (el escritor necesita el lock).
+        """
+        with self.lock:
+            with METRICAS.medir("bloqueo_procesos"):
+                self.bloqueo.tomar()
+            try:
+                self._leer_disco()
+                yield
+            finally:
+                self.escritor.al_vaciarse(self.bloqueo.soltar)
+
+    def _leer_disco(self):
+        """
+        Aplica lo que cambio en disco; la primera vez (o despues de una escritura fallida) lo carga
+        todo. No lee nada mientras el escritor tenga cambios sin guardar. Devuelve False si no hay datos.
+        """
+        with self.lock:
+            if self.escritor.ocupada():
+                return True
+
+            if self.df_productos is None or self._recargar:
+                self._recargar = False
+                self._foto_estados = None
+                self.historial_stock = None
+                self.indice_historial = IndiceHistorial()
+                self.resumen_diario = None
+                df_productos, df_movimientos, df_usuarios = load_data(self.almacenamiento, self.avisos)
+                if df_productos is None:
+                    return False
+                self.df_productos, self.df_movimientos, self.df_usuarios = df_productos, df_movimientos, df_usuarios
+                METRICAS.contar("filas_leidas", len(df_productos), tabla="productos")
+                METRICAS.contar("filas_leidas", len(df_movimientos), tabla="movimientos")
+                self.indice_productos.reconstruir(self.df_productos)
+                self.busqueda.reconstruir(self.df_productos)
+                self._cargar_lotes()
+                if self.ubicacion is not None:
+                    # Las transferencias leidas antes pueden no haber llegado a disco: se vuelven a
+                    # comparar todas con los movimientos recien cargados
+                    self.ubicacion.bandeja.releer()
+                return True
+
+            try:
+                if self.almacenamiento.productos_cambiaron():
+                    with METRICAS.medir("leer_productos"):
+                        self.df_productos = self.almacenamiento.leer_productos()
+                    METRICAS.contar("filas_leidas", len(self.df_productos), tabla="productos")
+                    self.indice_productos.reconstruir(self.df_productos)
+                    self.busqueda.reconstruir(self.df_productos)
+                    # Cada cambio de lotes viene junto con un cambio de productos
+                    self._cargar_lotes()
+                    # Los estados guardados pueden ser de otro dia: se recalculan todos
+                    self._foto_estados = None
+
+                if self.almacenamiento.movimientos_cambiaron():
+                    with METRICAS.medir("leer_movimientos_nuevos"):
+                        df_nuevos = self.almacenamiento.leer_movimientos_nuevos(self.df_movimientos.columns)
+                    if df_nuevos is None:
+                        with METRICAS.medir("leer_movimientos"):
+                            self.df_movimientos = self.almacenamiento.leer_movimientos()
+                        METRICAS.contar("filas_leidas", len(self.df_movimientos), tabla="movimientos")
+                        self.historial_stock = None
+                        self.indice_historial = IndiceHistorial()
+                        self.resumen_diario = None
+                    elif not df_nuevos.empty:
+                        METRICAS.contar("filas_leidas", len(df_nuevos), tabla="movimientos")
+                        self.df_movimientos = concatenar(self.df_movimientos, df_nuevos)
+                        self._actualizar_resumen()
+            except KeyError as e:
+                self.avisos.error(f"Error: Falta una columna de fecha esencial: {e}")
+            return True
+
+    def _archivar(self):
+        """
+        Pasa al archivo Parquet los movimientos que faltan: cuando se juntan MINIMO_FILAS_PARTE
+        o una vez por dia. Solo se llama con el disco al dia (sin escrituras pendientes).
+        """
+        hoy = datetime.now().date()
+        minimo = MINIMO_FILAS_PARTE if hoy == self._dia_archivo else 1
+        self.archivo.sincronizar(self.df_movimientos, minimo)
+        self._dia_archivo = hoy
+
+    def historial(self, desde=None, hasta=None, codigos=None, columnas=None):
+        """
+        Movimientos entre desde y hasta (inclusive), opcionalmente de algunos productos.
+        Lo archivado se lee del Parquet con los filtros aplicados al leer; las filas que todavia
+        no se archivaron se filtran en memoria.
+        """
+        with self.lock:
+            df_cola = self.df_movimientos.iloc[self.archivo.filas:]
+            df_archivado = self.archivo.leer(desde, hasta, codigos, columnas) if self.archivo.filas else None
+
+        mascara = pd.Series(True, index=df_cola.index)
+        if desde is not None:
+            mascara &= df_cola["Fecha"] >= pd.Timestamp(desde)
+        if hasta is not None:
+            mascara &= df_cola["Fecha"] <= pd.Timestamp(hasta)
+        if codigos is not None:
+            mascara &= df_cola["Codigo_Producto"].isin(codigos)
+        df_cola = df_cola.loc[mascara, [c for c in (columnas or df_cola.columns) if c in df_cola.columns]]
+
+        if df_archivado is None or df_archivado.empty:
+            return df_cola.reset_index(drop=True)
+        return pd.concat([df_archivado, df_cola], ignore_index=True)
+
+    def contar_historial(self, desde=None, hasta=None, codigos=None):
+        with self.lock:
+            self.indice_historial.actualizar(self.df_movimientos)
+            return self.indice_historial.contar(self.df_movimientos, desde, hasta, codigos)
+
+    def pagina_historial(self, numero, tamano, desde=None, hasta=None, codigos=None, columnas=None):
+        """
+        Una pagina del historial en orden de fecha descendente y el total de filas del filtro (ver historial.py).
+        """
+        with self.lock:
+            self.indice_historial.actualizar(self.df_movimientos)
+            return self.indice_historial.pagina(self.df_movimientos, numero, tamano, desde, hasta, codigos, columnas)
+
+    def _actualizar_resumen(self):
+        """
+        Suma al resumen diario los movimientos nuevos. Se arma recien la primera vez que se pide
+        (pagina de analitica); despues se mantiene con cada movimiento registrado.
+        """
+        if self.resumen_diario is None:
+            return
+        with METRICAS.medir("resumen_diario"):
+            self.resumen_diario.actualizar(self.df_movimientos)
+
+    def consumo_diario(self, desde=None, hasta=None):
+        """
+        Totales diarios por producto y por responsable entre desde y hasta (ver resumen_diario.py).
+        """
+        with self.lock:
+            resumen = self._resumen_al_dia()
+            return resumen.productos(desde, hasta), resumen.responsables(desde, hasta)
+
+    def _resumen_al_dia(self):
+        if self.resumen_diario is None:
+            self.resumen_diario = ResumenDiario()
+        self._actualizar_resumen()
+        return self.resumen_diario
+
+    def reposicion(self, ventana, plazo, cobertura):
+        """
+        Demanda, dias de cobertura, riesgo de vencimiento y cantidad sugerida de todos los productos
+        (ver reposicion.py). Se copia lo necesario con el lock tomado y se calcula fuera de el.
+        """
+        with self.lock:
+            resumen = self._resumen_al_dia()
+            hoy = pd.Timestamp(datetime.now().date())
+            df_consumo = resumen.productos(hoy - pd.Timedelta(days=ventana - 1), hoy)
+            primeros = resumen.primeros_movimientos()
+            df_lotes = self.libro_lotes.a_dataframe()
+            df_productos = self.df_productos[["Codigo", "Nombre", "Categoria", "Stock_Actual", "Stock_Minimo",
+                                              "Fecha_Vencimiento"]]
+        with METRICAS.medir("reposicion"):
+            return calcular_reposicion(df_productos, df_consumo, df_lotes, hoy, primeros, ventana, plazo, cobertura)
+
+    def catalogo(self):
+        """
+        Nombres, categorias y mapas nombre <-> codigo del catalogo actual (ver Catalogo en
+        indice_productos.py). Se vuelven a armar solo si el catalogo cambio desde la ultima llamada.
+        """
+        with self.lock:
+            if self._catalogo is None or self._catalogo.version != self.indice_productos.version:
+                self._catalogo = Catalogo(self.df_productos, self.indice_productos)
+            return self._catalogo
+
+    def buscar_productos(self, texto):
+        """
+        Filas de df_productos que coinciden con texto (nombre, descripcion o categoria), de la mas
+        parecida a la menos parecida (ver busqueda_productos.py).
+        """
+        with self.lock:
+            filas = [self.indice_productos.fila(codigo) for codigo in self.busqueda.buscar(texto)]
+            return self.df_productos.loc[filas]
+
+    def actualizar_estados(self):
+        """
+        Refresca los estados de los productos que cambiaron desde la ultima llamada.
+        """
+        with self.lock, METRICAS.medir("update_statuses"):
+            self._foto_estados = actualizar_estados(self.df_productos, self._foto_estados, self.alertas)
+            return self.df_productos
+
+    def productos_en_alerta(self, dias):
+        """
+        Productos con stock critico o en advertencia, y productos vencidos o que vencen en los proximos
+        dias (del que vence primero al ultimo). Salen de las vistas de alertas, sin recorrer el catalogo.
+        """
+        with self.lock:
+            hoy = pd.Timestamp(datetime.now().date())
+            filas_stock = sorted(self.indice_productos.fila(codigo) for codigo in self.alertas.en_alerta_stock())
+            filas_venc = [self.indice_productos.fila(codigo) for codigo in self.alertas.vencen_hasta(hoy + pd.Timedelta(days=dias))]
+            return self.df_productos.loc[filas_stock], self.df_productos.loc[filas_venc]
+
+    def resumen_alertas(self, dias):
+        with self.lock:
+            return self.alertas.resumen(datetime.now().date(), dias)
+
+    def stock_en_fecha(self, fecha):
+        """
+        Stock de cada producto al cierre de fecha, desde el checkpoint anterior (ver reconstruccion.py).
+        La primera vez carga los checkpoints; los de fin de mes que falten se crean cuando el
+        escritor esta libre (asi no compiten con sus escrituras).
+        """
+        with self.lock:
+            if self.historial_stock is None:
+                self.historial_stock = HistorialStock(self.almacenamiento.leer_checkpoints())
+            if not self.escritor.ocupada():
+                hoy = pd.Timestamp(datetime.now().date())
+                df_nuevos = self.historial_stock.crear_faltantes(self.df_productos, self.df_movimientos, hoy)
+                if df_nuevos is not None:
+                    self.almacenamiento.guardar_checkpoints(df_nuevos)
+            return self.historial_stock.stock_en_fecha(fecha, self.df_productos, self.df_movimientos)
+
+    def _foto_para_guardar(self, cambios):
+        """
+        Copia lo que el escritor tiene que guardar para un lote de cambios (se llama con el lock tomado).
+        Con copy-on-write (pandas 3) las selecciones y copy(deep=False) no duplican datos: si despues
+        se modifica df_productos en el lugar, pandas copia recien ahi las columnas tocadas.
+        df_movimientos no se copia: nunca se modifica en el lugar, solo se reemplaza (ver concatenar).
+        """
+        with self.lock:
+            codigos = cambios.productos | cambios.eliminados
+            if self.almacenamiento.reescribe_todo:
+                df_productos = self.df_productos.copy(deep=False)
+                df_lotes = self.libro_lotes.a_dataframe()
+            else:
+                df_productos = self.df_productos[self.df_productos['Codigo'].isin(cambios.productos)]
+                df_lotes = self.libro_lotes.a_dataframe(codigos)
+            # Un codigo eliminado y vuelto a crear en el mismo lote no se borra
+            eliminados = cambios.eliminados - set(self.df_productos['Codigo'])
+            df_nuevos = pd.concat(cambios.movimientos, ignore_index=True) if cambios.movimientos else None
+            return dict(df_productos=df_productos, df_lotes=df_lotes, codigos=codigos, eliminados=eliminados,
+                        df_nuevos=df_nuevos, df_movimientos=self.df_movimientos, transferencias=cambios.transferencias)
+
+    def _guardar(self, foto):
+        """
+        Lo llama el hilo escritor: una sola escritura por lote. Si falla, la memoria ya no coincide
+        con el disco y se vuelve a cargar todo en el proximo refresco.
+        Las transferencias se anotan en la bandeja de su destino despues de guardar la salida: si la
+        salida no se pudo guardar, el destino no recibe nada.
+        """
+        transferencias = foto.pop("transferencias")
+        try:
+            with METRICAS.medir("save_data"):
+                self.almacenamiento.confirmar(**foto)
+        except Exception:
+            METRICAS.contar("escrituras_fallidas")
+            with self.lock:
+                self._recargar = True
+            raise
+        METRICAS.contar("escrituras")
+        if foto["df_nuevos"] is not None:
+            METRICAS.contar("movimientos_guardados", len(foto["df_nuevos"]))
+        for destino, df_envio in transferencias:
+            self.ubicacion.bandeja_de(destino).anexar(df_envio)
+            METRICAS.contar("transferencias_enviadas", destino=destino)
+
+    def guardar_producto(self, idx):
+        """
+        Guarda los cambios hechos en la fila idx de df_productos. Quien llama debe estar dentro de
+        escritura() desde antes de buscar la fila (igual en agregar_producto, eliminar_producto y
+        agregar_movimientos).
+        """
+        with self.lock:
+            codigo = self.df_productos.at[idx, 'Codigo']
+            fila = self.df_productos.loc[idx]
+            self.indice_productos.actualizar(idx, codigo, fila['Nombre'])
+            self.busqueda.actualizar(codigo, fila['Nombre'], fila.get('Descripcion', ""), fila.get('Categoria', ""))
+            return self.escritor.encolar(Cambios(productos=[codigo]))
+
+    def crear_producto(self, nombre, categoria, descripcion="", stock_inicial=0, stock_minimo=0, costo=0,
+                       precio_venta=0, fecha_vencimiento=pd.NaT):
+        """
+        Crea un producto con el codigo siguiente al mayor y Fecha_Entrada de hoy.
+        Devuelve (codigo, confirmacion). Lanza ValueError si falta el nombre o la categoria, si el
+        stock, el minimo, el costo o el precio son negativos, o si ya existe un producto con ese
+        nombre (sin importar mayusculas).
+        """
+        nombre, categoria = str(nombre).strip(), str(categoria).strip()
+        if not nombre:
+            raise ValueError("El campo 'Nombre del Producto' no puede estar vacio.")
+        if not categoria:
+            raise ValueError("Falta la categoria del producto.")
+        numeros = {"Stock_Inicial": stock_inicial, "Stock_Minimo": stock_minimo, "Costo": costo, "Precio_Venta": precio_venta}
+        for campo, valor in numeros.items():
+            if valor < 0:
+                raise ValueError(f"El campo '{campo}' no puede ser negativo.")
+        with self.escritura():
+            if self.indice_productos.existe_nombre(nombre):
+                raise ValueError(f"Error: Ya existe un producto con el nombre '{nombre}'.")
+            if self.ubicacion is not None:
+                # Con varias ubicaciones el codigo no puede chocar con uno dado en otra
+                nuevo_codigo = self.ubicacion.siguiente_codigo(self.df_productos['Codigo'])
+            else:
+                nuevo_codigo = 1 if self.df_productos.empty else self.df_productos['Codigo'].max() + 1
+            nuevo_producto = pd.DataFrame({
+                "Codigo": [nuevo_codigo],
+                "Nombre": [nombre],
+                "Categoria": [categoria],
+                "Descripcion": [descripcion],
+                "Stock_Inicial": [stock_inicial],
+                "Stock_Actual": [stock_inicial],
+                "Stock_Minimo": [stock_minimo],
+                "Fecha_Entrada": [pd.to_datetime(datetime.now().date())],
+                "Fecha_Vencimiento": [pd.to_datetime(fecha_vencimiento)],
+                "Costo": [costo],
+                "Precio_Venta": [precio_venta]
+            })
+            # Sin .fillna(0): las fechas vacias quedan NaT y no el numero 0
+            return nuevo_codigo, self.agregar_producto(nuevo_producto)
+
+    def agregar_producto(self, nuevo_producto):
+        """
+        Agrega la fila nueva; su stock inicial entra como primer lote.
+        """
+        with self.lock:
+            self.df_productos = concatenar(self.df_productos, nuevo_producto)
+            idx = self.df_productos.index[-1]
+            codigo = self.df_productos.at[idx, 'Codigo']
+            stock_inicial = self.df_productos.at[idx, 'Stock_Actual']
+            if stock_inicial > 0:
+                self.libro_lotes.agregar(codigo, stock_inicial, self.df_productos.at[idx, 'Fecha_Vencimiento'])
+            sincronizar_producto(self.df_productos, idx, self.libro_lotes)
+            fila = self.df_productos.loc[idx]
+            self.indice_productos.agregar(idx, codigo, fila['Nombre'])
+            self.busqueda.agregar(codigo, fila['Nombre'], fila.get('Descripcion', ""), fila.get('Categoria', ""))
+            return self.escritor.encolar(Cambios(productos=[codigo]))
+
+    def eliminar_producto(self, idx):
+        with self.lock:
+            codigo = self.df_productos.at[idx, 'Codigo']
+            self.df_productos = self.df_productos.drop(index=idx).reset_index(drop=True)
+            self.libro_lotes.eliminar(codigo)
+            self.indice_productos.eliminar(codigo, self.df_productos)
+            self.busqueda.eliminar(codigo)
+            self.alertas.quitar(codigo)
+            return self.escritor.encolar(Cambios(eliminados=[codigo]))
+
+    def agregar_movimientos(self, df_nuevos, indices):
+        """
+        Agrega movimientos al historial compartido y encola los productos tocados (indices) en la misma escritura.
+        Quien llama debe estar dentro de escritura() desde antes de leer el stock (ver registrar_movimientos).
+        """
+        with self.lock:
+            self.df_movimientos = concatenar(self.df_movimientos, df_nuevos)
+            self._actualizar_resumen()
+            codigos = self.df_productos.loc[list(indices), 'Codigo']
+            return self.escritor.encolar(Cambios(productos=codigos, movimientos=df_nuevos))
+
+    def registrar_movimientos(self, df_archivo, responsable_por_defecto="", parcial=False, grupos=None):
+        """
+        Valida movimientos en texto (columnas de importacion.py) contra el stock compartido mas
+        reciente, los aplica a productos y lotes (FEFO) y los guarda en una sola escritura.
+        Sin parcial, un error en cualquier fila deja todo sin aplicar. Con parcial se descartan las
+        filas con error (y las de su mismo grupo, si se pasa grupos alineado con df_archivo) y el
+        resto se vuelve a validar, porque sin ellas el stock proyectado cambia.
+        Devuelve (df_nuevos, filas, errores, confirmacion): filas son las posiciones de df_archivo
+        aplicadas, en orden; errores usa la numeracion de validar_movimientos sobre df_archivo.
+        """
+        with self.escritura():
+            fecha_actual = pd.to_datetime(datetime.now().date())
+            filas = np.arange(len(df_archivo))
+            descartes = []
+            while True:
+                df_nuevos, errores = validar_movimientos(df_archivo.iloc[filas], self.df_productos,
+                                                         responsable_por_defecto, fecha_actual)
+                if errores.empty or not parcial or (errores["Fila"] == 0).any():
+                    break
+                # Fila 2 = primera fila de la seleccion: se traduce a la fila de df_archivo
+                posiciones = filas[errores["Fila"].to_numpy() - 2]
+                descartes.append(errores.assign(Fila=posiciones + 2))
+                if grupos is not None:
+                    grupos = np.asarray(grupos)
+                    posiciones = filas[np.isin(grupos[filas], grupos[posiciones])]
+                filas = np.setdiff1d(filas, posiciones)
+                if not len(filas):
+                    break
+            if descartes:
+                errores = pd.concat(descartes).sort_values("Fila", kind="stable").reset_index(drop=True)
+            if not len(filas) or (errores["Fila"] == 0).any() or (not parcial and not errores.empty):
+                return None, [], errores, None
+
+            indices = aplicar_movimientos(self.df_productos, self.libro_lotes, df_nuevos)
+            confirmacion = self.agregar_movimientos(df_nuevos, indices)
+            self.actualizar_estados()
+            return df_nuevos, filas.tolist(), errores, confirmacion
+
+    # --- Transferencias entre ubicaciones (ver ubicaciones.py) ---
+
+    def transferir(self, codigo, cantidad, destino, responsable):
+        """
+        Envia cantidad unidades del producto a la ubicacion destino. Salen en orden FEFO: un
+        movimiento Transferencia negativo por lote tocado, con su vencimiento y el id de la
+        transferencia como Id_Transaccion, y las mismas lineas van a la bandeja del destino en la
+        misma escritura.
+        Devuelve (df_nuevos, confirmacion). Lanza ValueError si el destino o los datos no son
+        validos y StockInsuficiente si no alcanza el stock.
+        """
+        if self.ubicacion is None:
+            raise ValueError("Este proceso no tiene ubicacion (GESTOR_UBICACION): no hay a donde transferir.")
+        if destino == self.ubicacion.nombre:
+            raise ValueError("El destino debe ser otra ubicacion.")
+        if destino not in self.ubicacion.otras():
+            raise ValueError(f"La ubicacion '{destino}' no existe.")
+        responsable = str(responsable).strip()
+        if not responsable:
+            raise ValueError("Falta el responsable.")
+        if cantidad != int(cantidad) or cantidad <= 0:
+            raise ValueError("La cantidad debe ser un entero mayor a cero.")
+        cantidad = int(cantidad)
+
+        with self.escritura():
+            idx = self.indice_productos.fila(codigo)
+            if idx is None:
+                raise ValueError(f"No existe el producto {codigo}.")
+            stock_actual = self.df_productos.at[idx, 'Stock_Actual']
+            if cantidad > stock_actual:
+                raise StockInsuficiente(stock_actual)
+
+            consumidos, pendiente = self.libro_lotes.consumir(codigo, cantidad)
+            if pendiente:
+                # Stock que no esta en ningun lote (un Ajuste lo dejo descuadrado): sale sin vencimiento
+                consumidos.append((pd.NaT, pendiente))
+            self.df_productos.at[idx, 'Stock_Actual'] = stock_actual - cantidad
+            sincronizar_producto(self.df_productos, idx, self.libro_lotes)
+
+            id_transferencia = nuevo_id_transferencia()
+            df_nuevos = pd.DataFrame({
+                "Fecha": pd.Timestamp(datetime.now().date()),
+                "Codigo_Producto": codigo,
+                "Tipo": TIPO_TRANSFERENCIA,
+                "Cantidad": [-unidades for _, unidades in consumidos],
+                "Responsable": responsable,
+                "Motivo": motivo_envio(id_transferencia, destino),
+                "Vencimiento_Lote": pd.to_datetime([fecha for fecha, _ in consumidos]),
+                "Id_Transaccion": id_transferencia,
+            })
+            df_envio = lineas_envio(id_transferencia, self.ubicacion.nombre, df_nuevos, self.df_productos.loc[idx])
+
+            self.df_movimientos = concatenar(self.df_movimientos, df_nuevos)
+            self._actualizar_resumen()
+            confirmacion = self.escritor.encolar(Cambios(productos=[codigo], movimientos=df_nuevos,
+                                                         transferencias=[(destino, df_envio)]))
+            self.actualizar_estados()
+            return df_nuevos, confirmacion
+
+    def _recibir_transferencias(self):
+        """
+        Aplica las transferencias nuevas de la bandeja de esta ubicacion (se llama desde refrescar,
+        dentro de escritura()). Se saltean las que ya estan en Movimientos (las recibio este u otro
+        proceso de la misma ubicacion): escritura() ya aplico lo ultimo guardado.
+        Los productos que esta ubicacion no tiene se dan de alta con stock 0.
+        """
+        if self.ubicacion is None:
+            return
+        bandeja = self.ubicacion.bandeja
+        df_bandeja = bandeja.leer_nuevas()
+        if df_bandeja.empty:
+            return
+        recibidas = ids_recibidos(self.df_movimientos)
+        ids = [i for i in df_bandeja["Id_Transferencia"].unique() if i not in recibidas]
+        df_bandeja = df_bandeja[df_bandeja["Id_Transferencia"].isin(ids)]
+        if df_bandeja.empty:
+            return
+
+        hoy = pd.Timestamp(datetime.now().date())
+        df_bandeja = df_bandeja.astype({"Codigo_Producto": self.df_productos['Codigo'].dtype})
+        nuevos = df_bandeja.drop_duplicates("Codigo_Producto")
+        for _, linea in nuevos[~nuevos["Codigo_Producto"].isin(self.df_productos['Codigo'])].iterrows():
+            self.agregar_producto(alta_recibida(linea, hoy))
+
+        df_nuevos = movimientos_recibidos(df_bandeja, hoy)
+        indices = aplicar_movimientos(self.df_productos, self.libro_lotes, df_nuevos)
+        self.agregar_movimientos(df_nuevos, indices)
+        METRICAS.contar("transferencias_recibidas", len(ids))
+        log.info("Transferencias recibidas en %s: %d", self.ubicacion.nombre, len(ids))
@@ -0,0 +1,814 @@
+"""
+Capa de almacenamiento del Gestor de Inventario.
+
+Hay dos implementaciones con la misma interfaz:
+- AlmacenamientoCSV: Productos.csv / Movimientos.csv separados por ';' (formato original).
+- AlmacenamientoSQLite: una base SQLite embebida con indices por codigo, nombre y fecha.
+
+Se elige con la variable de entorno GESTOR_ALMACENAMIENTO ("csv" por defecto o "sqlite").
+Para pasar los CSV existentes a SQLite:
+
+    python almacenamiento.py importar --bd inventario.db
+"""
+import argparse
+import io
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from esquema import compactar_movimientos, compactar_productos, concatenar
+from instantaneas import (DIRECTORIO_INSTANTANEAS, MINIMO_FILAS_NUEVAS, contar_lectura, guardar_instantanea,
+                          leer_instantanea, ruta_instantanea)
+from lotes import COLUMNAS_LOTES, LibroLotes
+
+ARCHIVO_PRODUCTOS = "Productos.csv"
+ARCHIVO_MOVIMIENTOS = "Movimientos.csv"
+ARCHIVO_USUARIOS = "usuarios.csv"
+ARCHIVO_LOTES = "Lotes.csv"
+ARCHIVO_CHECKPOINTS = "Checkpoints.csv"
+DIRECTORIO_HISTORIAL = "historial_movimientos"
+ARCHIVO_BD = "inventario.db"
+# Bloqueo entre procesos que escriben los mismos datos (ver escritura.BloqueoEntreProcesos)
+ARCHIVO_BLOQUEO = "inventario.lock"
+FORMATO_FECHA = "%d-%m-%Y"
+
+# Columnas calculadas en memoria (update_statuses); SQLite no las guarda
+COLUMNAS_DERIVADAS = ["Estado (Stock)", "Estado (Vencimiento)"]
+COLUMNAS_FECHA_PRODUCTO = ["Fecha_Entrada", "Fecha_Vencimiento", "Fecha_Vencimiento_Pendiente"]
+# Vencimiento_Lote: fecha del lote que trajo cada Entrada (vacia en Salidas y Ajustes)
+COLUMNAS_FECHA_MOVIMIENTO = ["Fecha", "Vencimiento_Lote"]
+# Casi siempre vacia: sin el tipo, read_csv la adivina por bloques (numero en unos, texto en otros)
+TIPOS_MOVIMIENTO_CSV = {"Id_Transaccion": str}
+
+USUARIOS_POR_DEFECTO = {'email': ['admin@gestor.com'], 'password': ['admin'], 'rol': ['Admin']}
+
+# Filas que se formatean y escriben por vez al guardar un CSV: acota la memoria extra de una
+# reescritura completa del historial
+FILAS_POR_BLOQUE = 100_000
+
+# --- PREPARACION DE DATAFRAMES (COMUN A TODOS LOS ALMACENAMIENTOS) ---
+
+def preparar_productos(df_productos):
+    """
+    Migra columnas y tipos de Productos.csv (incluye columnas FEFO: Stock Viejo y Fecha Pendiente).
+    Lanza KeyError si falta una columna de fecha esencial.
+    """
+    df_productos.columns = df_productos.columns.str.strip()
+
+    # --- MIGRACION DE COLUMNAS ---
+    if "Precio_Unitario" in df_productos.columns and "Precio_Venta" not in df_productos.columns:
+        df_productos = df_productos.rename(columns={"Precio_Unitario": "Precio_Venta"})
+    elif "Precio_Venta" not in df_productos.columns:
+        df_productos["Precio_Venta"] = 0
+
+    if "Costo" not in df_productos.columns:
+        df_productos["Costo"] = 0
+
+    # --- NUEVO: Columnas para FEFO Automatico ---
+    if "Stock_Viejo_Restante" not in df_productos.columns:
+        df_productos["Stock_Viejo_Restante"] = 0
+
+    if "Fecha_Vencimiento_Pendiente" not in df_productos.columns:
+        df_productos["Fecha_Vencimiento_Pendiente"] = pd.NaT # Fecha vacia por defecto
+
+    # Rellenar vacios
+    df_productos["Costo"] = df_productos["Costo"].fillna(0)
+    df_productos["Precio_Venta"] = df_productos["Precio_Venta"].fillna(0)
+    df_productos["Stock_Viejo_Restante"] = df_productos["Stock_Viejo_Restante"].fillna(0)
+    # --- FIN NUEVO ---
+
+    df_productos["Fecha_Entrada"] = pd.to_datetime(df_productos["Fecha_Entrada"], dayfirst=True, errors='coerce').dt.normalize()
+    df_productos["Fecha_Vencimiento"] = pd.to_datetime(df_productos["Fecha_Vencimiento"], dayfirst=True, errors='coerce').dt.normalize()
+    # --- NUEVO: Convertir fecha pendiente ---
+    df_productos["Fecha_Vencimiento_Pendiente"] = pd.to_datetime(df_productos["Fecha_Vencimiento_Pendiente"], dayfirst=True, errors='coerce').dt.normalize()
+
+    if "Descripcion" not in df_productos.columns:
+        df_productos["Descripcion"] = ""
+    df_productos["Descripcion"] = df_productos["Descripcion"].fillna("")
+
+    return compactar_productos(df_productos)
+
+def preparar_movimientos(df_movimientos):
+    """
+    Normaliza Movimientos.csv (columnas Motivo, Id_Transaccion y Fecha) y lo pasa al esquema compacto (esquema.py).
+    Sirve tambien para filas leidas por partes.
+    Lanza KeyError si falta la columna Fecha.
+    """
+    if "Motivo" not in df_movimientos.columns:
+        df_movimientos["Motivo"] = ""
+    df_movimientos["Motivo"] = df_movimientos["Motivo"].fillna("")
+    if "Id_Transaccion" not in df_movimientos.columns:
+        df_movimientos["Id_Transaccion"] = ""
+    df_movimientos["Id_Transaccion"] = df_movimientos["Id_Transaccion"].fillna("")
+
+    df_movimientos.columns = df_movimientos.columns.str.strip()
+    df_movimientos["Fecha"] = pd.to_datetime(df_movimientos["Fecha"], dayfirst=True, errors='coerce').dt.normalize()
+    if "Vencimiento_Lote" in df_movimientos.columns:
+        df_movimientos["Vencimiento_Lote"] = pd.to_datetime(df_movimientos["Vencimiento_Lote"], dayfirst=True, errors='coerce').dt.normalize()
+    return compactar_movimientos(df_movimientos)
+
+def preparar_lotes(df_lotes):
+    df_lotes.columns = df_lotes.columns.str.strip()
+    df_lotes["Fecha_Vencimiento"] = pd.to_datetime(df_lotes["Fecha_Vencimiento"], dayfirst=True, errors='coerce').dt.normalize()
+    # Archivos viejos guardaron las cantidades como float ("5.0")
+    df_lotes["Cantidad"] = df_lotes["Cantidad"].fillna(0).astype("int64")
+    return df_lotes
+
+def preparar_checkpoints(df_checkpoints):
+    df_checkpoints = preparar_lotes(df_checkpoints)
+    df_checkpoints["Fecha_Checkpoint"] = pd.to_datetime(df_checkpoints["Fecha_Checkpoint"], dayfirst=True, errors='coerce').dt.normalize()
+    return df_checkpoints
+
+def formatear_fechas(serie):
+    """
+    Fechas como texto FORMATO_FECHA, "" si faltan. Son dias sin hora y se repiten mucho: cada fecha
+    distinta se formatea una sola vez y el texto se reparte por posicion (strftime fila a fila era
+    lo que mas tardaba al guardar).
+    """
+    # to_datetime: una columna vacia (sin lotes, sin movimientos) no trae tipo de fecha
+    posiciones, unicas = pd.factorize(pd.to_datetime(serie))
+    textos = np.append(pd.DatetimeIndex(unicas).strftime(FORMATO_FECHA).to_numpy(dtype=object), "")
+    # Las fechas vacias vienen con posicion -1: el "" agregado al final
+    return textos[posiciones]
+
+def escribir_csv(f, df, columnas_fecha=(), encabezado=True):
+    """
+    Escribe df en f separado por ';', por bloques de FILAS_POR_BLOQUE filas y con las fechas
+    formateadas con formatear_fechas. df no se copia: cada bloque es una vista con las columnas de
+    fecha reemplazadas (assign solo crea esas; el resto se comparte, copy-on-write de pandas).
+    """
+    columnas_fecha = [c for c in columnas_fecha if c in df.columns]
+    for inicio in range(0, max(len(df), 1), FILAS_POR_BLOQUE):
+        bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE]
+        bloque = bloque.assign(**{c: formatear_fechas(bloque[c]) for c in columnas_fecha})
+        bloque.to_csv(f, sep=";", index=False, header=encabezado and inicio == 0, lineterminator="\n")
+
+def reemplazar_archivo(ruta, escribir):
+    """
+    Escritura atomica: escribir(f) llena un temporal junto a ruta, se fuerza a disco y se renombra
+    encima. Un corte a mitad de camino deja el archivo anterior intacto, nunca uno a medias.
+    El temporal es propio del proceso y del hilo: dos escritores nunca comparten (ni borran) el mismo.
+    """
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporal, "w", encoding="utf-8", newline="") as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+def _lineas_completas(datos):
+    """
+    Corta datos despues del ultimo salto de linea: una linea que otro proceso esta escribiendo se
+    deja para la proxima lectura.
+    """
+    return datos[:datos.rfind(b"\n") + 1]
+
+# --- ALMACENAMIENTO CSV ---
+
+class AlmacenamientoCSV:
+    """
+    Productos.csv y Movimientos.csv separados por ';'.
+    Movimientos.csv se trata como un registro: los movimientos nuevos se agregan al final y
+    las lecturas posteriores solo parsean las lineas agregadas desde la ultima vez.
+    Las lecturas completas parten de instantaneas Feather (ver instantaneas.py) guardadas en
+    directorio_instantaneas (None = sin instantaneas).
+    """
+
+    descripcion = "los archivos 'Productos.csv' o 'Movimientos.csv'"
+
+    # Un CSV no permite tocar una sola fila: cada escritura reescribe Productos.csv y Lotes.csv completos
+    reescribe_todo = True
+
+    # Bytes finales de Movimientos.csv que se recuerdan para comprobar que el archivo solo crecio
+    TAMANO_COLA = 64
+
+    def __init__(self, archivo_productos=ARCHIVO_PRODUCTOS, archivo_movimientos=ARCHIVO_MOVIMIENTOS,
+                 archivo_usuarios=ARCHIVO_USUARIOS, archivo_lotes=ARCHIVO_LOTES, archivo_checkpoints=ARCHIVO_CHECKPOINTS,
+                 directorio_instantaneas=DIRECTORIO_INSTANTANEAS, directorio_historial=DIRECTORIO_HISTORIAL):
+        self.archivo_productos = archivo_productos
+        self.archivo_movimientos = archivo_movimientos
+        self.archivo_usuarios = archivo_usuarios
+        self.archivo_lotes = archivo_lotes
+        self.archivo_checkpoints = archivo_checkpoints
+        # Copia Parquet del historial para consultas filtradas (ver archivo_movimientos.py)
+        self.directorio_historial = directorio_historial
+        self.directorio_instantaneas = directorio_instantaneas
+        self.archivo_bloqueo = os.path.join(os.path.dirname(archivo_productos), ARCHIVO_BLOQUEO)
+        self._firma_productos = None
+        self._firma_movimientos = None
+        self._offset_movimientos = 0
+        self._cola_movimientos = b""
+        self._recargar_movimientos = False
+
+    def _firma(self, archivo):
+        try:
+            info = os.stat(archivo)
+        except FileNotFoundError:
+            return None
+        return (info.st_size, info.st_mtime_ns)
+
+    def _leer_cola(self, hasta):
+        with open(self.archivo_movimientos, "rb") as f:
+            f.seek(max(0, hasta - self.TAMANO_COLA))
+            return f.read(min(hasta, self.TAMANO_COLA))
+
+    def _sincronizar_movimientos(self):
+        self._firma_movimientos = self._firma(self.archivo_movimientos)
+        self._offset_movimientos = self._firma_movimientos[0]
+        self._cola_movimientos = self._leer_cola(self._offset_movimientos)
+        self._recargar_movimientos = False
+
+    # --- Instantaneas ---
+
+    def _leer_preparado(self, archivo, preparar):
+        """
+        Lee un CSV que se reescribe completo (Productos, Lotes) desde su instantanea si el archivo
+        no cambio desde que se tomo; si cambio, lo parsea y la vuelve a guardar.
+        Devuelve (df, firma del archivo leido).
+        """
+        firma = self._firma(archivo)
+        if self.directorio_instantaneas is None or firma is None:
+            return preparar(pd.read_csv(archivo, sep=";")), firma
+        ruta = ruta_instantanea(self.directorio_instantaneas, archivo)
+        df, metadatos = leer_instantanea(ruta)
+        acierto = df is not None and metadatos.get("firma") == list(firma)
+        contar_lectura(ruta, acierto)
+        if not acierto:
+            df = preparar(pd.read_csv(archivo, sep=";"))
+            guardar_instantanea(ruta, df, firma=list(firma))
+        return df, firma
+
+    def _guardar_instantanea_movimientos(self, df_movimientos, offset):
+        guardar_instantanea(ruta_instantanea(self.directorio_instantaneas, self.archivo_movimientos),
+                            df_movimientos, tamano=offset, cola=self._leer_cola(offset).hex())
+
+    def _movimientos_desde_instantanea(self):
+        """
+        Historial de la instantanea mas las lineas agregadas a Movimientos.csv despues de tomarla.
+        Devuelve (df, offset leido), o (None, None) si los bytes que cubre la instantanea cambiaron
+        (el archivo fue reescrito) y hay que leerlo completo.
+        """
+        ruta = ruta_instantanea(self.directorio_instantaneas, self.archivo_movimientos)
+        df_movimientos, metadatos = leer_instantanea(ruta)
+        tamano = None if df_movimientos is None else metadatos["tamano"]
+        if (tamano is None or tamano > self._firma(self.archivo_movimientos)[0]
+                or self._leer_cola(tamano).hex() != metadatos["cola"]):
+            contar_lectura(ruta, False)
+            return None, None
+        contar_lectura(ruta, True)
+
+        with open(self.archivo_movimientos, "rb") as f:
+            f.seek(tamano)
+            datos = _lineas_completas(f.read())
+        if not datos.strip():
+            return df_movimientos, tamano + len(datos)
+        df_nuevos = preparar_movimientos(pd.read_csv(io.BytesIO(datos), sep=";", header=None, names=list(df_movimientos.columns),
+                                                   dtype=TIPOS_MOVIMIENTO_CSV))
+        df_movimientos = concatenar(df_movimientos, df_nuevos)
+        # Pocas lineas nuevas se parsean en cada arranque; muchas, se suman a la instantanea
+        if len(df_nuevos) >= MINIMO_FILAS_NUEVAS:
+            self._guardar_instantanea_movimientos(df_movimientos, tamano + len(datos))
+        return df_movimientos, tamano + len(datos)
+
+    # --- Lectura ---
+
+    def existen_usuarios(self):
+        return os.path.exists(self.archivo_usuarios)
+
+    def leer_usuarios(self):
+        try:
+            df_usuarios = pd.read_csv(self.archivo_usuarios, sep=";")
+        except FileNotFoundError:
+            df_usuarios = pd.DataFrame(USUARIOS_POR_DEFECTO)
+            df_usuarios.to_csv(self.archivo_usuarios, sep=";", index=False)
+        df_usuarios.columns = df_usuarios.columns.str.strip()
+        return df_usuarios
+
+    def leer_productos(self):
+        df_productos, self._firma_productos = self._leer_preparado(self.archivo_productos, preparar_productos)
+        return df_productos
+
+    def leer_movimientos(self):
+        df_movimientos = None
+        if self.directorio_instantaneas is not None and os.path.exists(self.archivo_movimientos):
+            df_movimientos, offset = self._movimientos_desde_instantanea()
+        if df_movimientos is None:
+            # Se leen los bytes una sola vez para que el offset coincida exactamente con lo parseado
+            with open(self.archivo_movimientos, "rb") as f:
+                datos = _lineas_completas(f.read())
+            df_movimientos = preparar_movimientos(pd.read_csv(io.BytesIO(datos), sep=";", encoding="utf-8-sig",
+                                                               dtype=TIPOS_MOVIMIENTO_CSV))
+            offset = len(datos)
+            if self.directorio_instantaneas is not None:
+                self._guardar_instantanea_movimientos(df_movimientos, offset)
+        self._firma_movimientos = self._firma(self.archivo_movimientos)
+        self._offset_movimientos = offset
+        self._cola_movimientos = self._leer_cola(offset)
+        self._recargar_movimientos = False
+        return df_movimientos
+
+    def leer_lotes(self):
+        """
+        Devuelve la tabla de lotes, o None si todavia no existe (hay que migrar desde los productos).
+        """
+        try:
+            return self._leer_preparado(self.archivo_lotes, preparar_lotes)[0]
+        except FileNotFoundError:
+            return None
+
+    def leer_checkpoints(self):
+        """
+        Checkpoints de stock por lote (ver reconstruccion.py), o None si todavia no hay.
+        """
+        try:
+            return preparar_checkpoints(pd.read_csv(self.archivo_checkpoints, sep=";"))
+        except FileNotFoundError:
+            return None
+
+    def productos_cambiaron(self):
+        firma = self._firma(self.archivo_productos)
+        return firma is not None and firma != self._firma_productos
+
+    def movimientos_cambiaron(self):
+        firma = self._firma(self.archivo_movimientos)
+        return firma is not None and firma != self._firma_movimientos
+
+    def leer_movimientos_nuevos(self, columnas):
+        """
+        Devuelve solo las lineas completas agregadas a Movimientos.csv desde la ultima lectura.
+        Devuelve None si el archivo fue reescrito (o achicado) y hay que leerlo completo.
+        """
+        firma = self._firma(self.archivo_movimientos)
+        tamano = firma[0]
+        if (self._recargar_movimientos or tamano < self._offset_movimientos
+                or self._leer_cola(self._offset_movimientos) != self._cola_movimientos):
+            return None
+
+        with open(self.archivo_movimientos, "rb") as f:
+            f.seek(self._offset_movimientos)
+            datos = f.read(tamano - self._offset_movimientos)
+        datos = _lineas_completas(datos)
+        self._firma_movimientos = firma
+        if not datos.strip():
+            return pd.DataFrame(columns=columnas)
+
+        df_nuevos = pd.read_csv(io.BytesIO(datos), sep=";", header=None, names=list(columnas), dtype=TIPOS_MOVIMIENTO_CSV)
+        self._offset_movimientos += len(datos)
+        self._cola_movimientos = self._leer_cola(self._offset_movimientos)
+        return preparar_movimientos(df_nuevos)
+
+    # --- Escritura ---
+
+    def guardar_productos(self, df_productos):
+        """
+        Guarda solo Productos.csv, incluyendo las columnas FEFO.
+        """
+        reemplazar_archivo(self.archivo_productos, lambda f: escribir_csv(f, df_productos, COLUMNAS_FECHA_PRODUCTO))
+        self._firma_productos = self._firma(self.archivo_productos)
+
+    def _escribir_lotes(self, df_lotes):
+        """
+        Reescribe Lotes.csv (solo lotes vivos, asi que su tamano no crece con el historial).
+        """
+        reemplazar_archivo(self.archivo_lotes, lambda f: escribir_csv(f, df_lotes, ["Fecha_Vencimiento"]))
+
+    def guardar_lotes(self, libro):
+        self._escribir_lotes(libro.a_dataframe())
+
+    def guardar_checkpoints(self, df_checkpoints):
+        """
+        Agrega checkpoints nuevos al final de Checkpoints.csv (los anteriores no cambian).
+        """
+        nuevo = not os.path.exists(self.archivo_checkpoints)
+        with open(self.archivo_checkpoints, "a", encoding="utf-8", newline="") as f:
+            escribir_csv(f, df_checkpoints, ["Fecha_Checkpoint", "Fecha_Vencimiento"], encabezado=nuevo)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def guardar_movimientos(self, df_movimientos):
+        """
+        Reescribe Movimientos.csv completo a partir del DataFrame en memoria (compactacion).
+        Solo se usa cuando el archivo no admite agregar lineas (encabezado distinto o linea cortada).
+        """
+        if "Motivo" not in df_movimientos.columns:
+            df_movimientos = df_movimientos.assign(Motivo="")
+        reemplazar_archivo(self.archivo_movimientos, lambda f: escribir_csv(f, df_movimientos, COLUMNAS_FECHA_MOVIMIENTO))
+        self._sincronizar_movimientos()
+
+    def anexar_movimientos(self, df_nuevos, df_movimientos):
+        """
+        Agrega solo las filas nuevas al final de Movimientos.csv, sin reescribir el historial.
+        df_movimientos es el historial completo en memoria (ya incluye las filas nuevas).
+        """
+        columnas = list(df_movimientos.columns)
+        try:
+            with open(self.archivo_movimientos, "r", encoding="utf-8-sig") as f:
+                encabezado = [c.strip() for c in f.readline().rstrip("\r\n").split(";")]
+            with open(self.archivo_movimientos, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                termina_en_salto = f.read(1) == b"\n"
+        except OSError:
+            encabezado = None
+
+        # Si el archivo no coincide con lo que hay en memoria, se compacta una sola vez
+        if encabezado != columnas:
+            self.guardar_movimientos(df_movimientos)
+            return
+
+        # Si otro proceso agrego lineas que aun no leimos (o quedo una a medias sin leer), la
+        # proxima lectura sera completa
+        al_dia = not self.movimientos_cambiaron() and self._offset_movimientos == self._firma_movimientos[0]
+
+        with open(self.archivo_movimientos, "a", encoding="utf-8", newline="") as f:
+            if not termina_en_salto:
+                f.write("\n")
+            # Las columnas que falten en df_nuevos quedan vacias
+            escribir_csv(f, df_nuevos.reindex(columns=columnas), COLUMNAS_FECHA_MOVIMIENTO, encabezado=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if al_dia:
+            self._sincronizar_movimientos()
+        else:
+            self._recargar_movimientos = True
+
+    def confirmar(self, df_productos, df_lotes, codigos, eliminados, df_nuevos, df_movimientos):
+        """
+        Guarda un lote de cambios del escritor (ver escritura.py). df_productos y df_lotes son completos.
+        Los movimientos van primero: si el proceso se corta antes de reemplazar Productos.csv,
+        el historial tiene el movimiento y el stock queda como antes, nunca al reves.
+        """
+        if df_nuevos is not None:
+            self.anexar_movimientos(df_nuevos, df_movimientos)
+        if codigos or eliminados:
+            self._escribir_lotes(df_lotes)
+            self.guardar_productos(df_productos)
+
+# --- ALMACENAMIENTO SQLITE ---
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS productos (
+    Codigo INTEGER PRIMARY KEY,
+    Nombre TEXT NOT NULL,
+    Categoria TEXT,
+    Descripcion TEXT,
+    Stock_Inicial NUMERIC,
+    Stock_Actual NUMERIC,
+    Stock_Minimo NUMERIC,
+    Fecha_Entrada TEXT,
+    Fecha_Vencimiento TEXT,
+    Costo NUMERIC,
+    Precio_Venta NUMERIC,
+    Stock_Viejo_Restante NUMERIC,
+    Fecha_Vencimiento_Pendiente TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos (Nombre);
+CREATE INDEX IF NOT EXISTS idx_productos_nombre_normalizado ON productos (lower(trim(Nombre)));
+
+CREATE TABLE IF NOT EXISTS movimientos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Fecha TEXT,
+    Codigo_Producto INTEGER,
+    Tipo TEXT,
+    Cantidad NUMERIC,
+    Responsable TEXT,
+    Motivo TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_movimientos_producto_fecha ON movimientos (Codigo_Producto, Fecha);
+CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos (Fecha);
+
+CREATE TABLE IF NOT EXISTS lotes (
+    Codigo_Producto INTEGER NOT NULL,
+    Fecha_Vencimiento TEXT,
+    Cantidad NUMERIC
+);
+CREATE INDEX IF NOT EXISTS idx_lotes_producto_vencimiento ON lotes (Codigo_Producto, Fecha_Vencimiento);
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    Fecha_Checkpoint TEXT NOT NULL,
+    Movimientos_Hasta INTEGER NOT NULL,
+    Codigo_Producto INTEGER NOT NULL,
+    Fecha_Vencimiento TEXT,
+    Cantidad NUMERIC,
+    Stock NUMERIC
+);
+CREATE INDEX IF NOT EXISTS idx_checkpoints_fecha ON checkpoints (Fecha_Checkpoint);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    email TEXT PRIMARY KEY,
+    password TEXT,
+    rol TEXT
+);
+
+-- Contador de cambios por tabla: permite a cada proceso saber si otro escribio
+CREATE TABLE IF NOT EXISTS versiones (
+    tabla TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO versiones VALUES ('productos', 0), ('movimientos', 0);
+
+CREATE TRIGGER IF NOT EXISTS tr_productos_insert AFTER INSERT ON productos
+BEGIN UPDATE versiones SET version = version + 1 WHERE tabla = 'productos'; END;
+CREATE TRIGGER IF NOT EXISTS tr_productos_update AFTER UPDATE ON productos
+BEGIN UPDATE versiones SET version = version + 1 WHERE tabla = 'productos'; END;
+CREATE TRIGGER IF NOT EXISTS tr_productos_delete AFTER DELETE ON productos
+BEGIN UPDATE versiones SET version = version + 1 WHERE tabla = 'productos'; END;
+CREATE TRIGGER IF NOT EXISTS tr_movimientos_insert AFTER INSERT ON movimientos
+BEGIN UPDATE versiones SET version = version + 1 WHERE tabla = 'movimientos'; END;
+CREATE TRIGGER IF NOT EXISTS tr_movimientos_cambio AFTER UPDATE ON movimientos
+BEGIN UPDATE versiones SET version = version + 1 WHERE tabla = 'movimientos'; END;
+CREATE TRIGGER IF NOT EXISTS tr_movimientos_delete AFTER DELETE ON movimientos
+BEGIN UPDATE versiones SET version = version + 1 WHERE tabla = 'movimientos'; END;
+"""
+
+def _valor_sql(valor):
+    """
+    Convierte un valor de pandas/numpy a un tipo que sqlite3 sabe guardar (fechas en ISO).
+    """
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.strftime("%Y-%m-%d")
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+class AlmacenamientoSQLite:
+    """
+    Base SQLite embebida (sin servicio aparte). Productos indexados por Codigo y Nombre,
+    movimientos por producto y fecha. Cada operacion de la app es una transaccion que
+    toca solo las filas afectadas.
+    """
+
+    reescribe_todo = False
+
+    def __init__(self, ruta=ARCHIVO_BD, crear=False):
+        self.ruta = ruta
+        self.crear = crear
+        self.descripcion = f"la base de datos '{ruta}' (importala con: python almacenamiento.py importar)"
+        self.directorio_historial = f"{os.path.splitext(ruta)[0]}_historial"
+        self.archivo_bloqueo = f"{ruta}.lock"
+        self._con = None
+        self._columnas = {}
+        self._version_productos = None
+        self._version_movimientos = None
+        self._ultimo_id = None
+
+    @property
+    def con(self):
+        if self._con is None:
+            if not self.crear and not os.path.exists(self.ruta):
+                raise FileNotFoundError(self.ruta)
+            # Las sesiones de Streamlit corren en hilos distintos; el acceso lo serializa AlmacenDatos
+            self._con = sqlite3.connect(self.ruta, check_same_thread=False, isolation_level=None)
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute("PRAGMA synchronous=NORMAL")
+            self._con.executescript(ESQUEMA_SQLITE)
+        return self._con
+
+    def _leer_versiones(self):
+        return dict(self.con.execute("SELECT tabla, version FROM versiones").fetchall())
+
+    @contextmanager
+    def _transaccion(self):
+        """
+        Ejecuta el bloque en una transaccion. Si nadie mas escribio desde nuestra ultima lectura,
+        nuestros propios cambios quedan marcados como ya vistos (no provocan una recarga).
+        """
+        self.con.execute("BEGIN IMMEDIATE")
+        try:
+            antes = self._leer_versiones()
+            yield
+            despues = self._leer_versiones()
+            self.con.execute("COMMIT")
+        except BaseException:
+            self.con.execute("ROLLBACK")
+            raise
+        if antes["productos"] == self._version_productos:
+            self._version_productos = despues["productos"]
+        if antes["movimientos"] == self._version_movimientos:
+            self._version_movimientos = despues["movimientos"]
+            self._ultimo_id = self.con.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos").fetchone()[0]
+        else:
+            self._ultimo_id = None
+
+    def _columnas_tabla(self, tabla):
+        if tabla not in self._columnas:
+            self._columnas[tabla] = [fila[1] for fila in self.con.execute(f"PRAGMA table_info({tabla})")]
+        return self._columnas[tabla]
+
+    def _asegurar_columnas(self, tabla, columnas):
+        """
+        Agrega a la tabla las columnas del DataFrame que todavia no existen (migracion liviana).
+        """
+        existentes = self._columnas_tabla(tabla)
+        for columna in columnas:
+            if columna not in existentes:
+                self.con.execute(f'ALTER TABLE {tabla} ADD COLUMN "{columna}"')
+                existentes.append(columna)
+
+    def _columnas_guardables(self, df, tabla):
+        columnas = [c for c in df.columns if c not in COLUMNAS_DERIVADAS and c != "id"]
+        self._asegurar_columnas(tabla, columnas)
+        return columnas
+
+    def _filas(self, df, columnas):
+        return [tuple(_valor_sql(v) for v in fila) for fila in df[columnas].itertuples(index=False, name=None)]
+
+    def _upsert_productos(self, df_productos, columnas):
+        lista = ", ".join(f'"{c}"' for c in columnas)
+        marcas = ", ".join("?" for _ in columnas)
+        actualizar = ", ".join(f'"{c}" = excluded."{c}"' for c in columnas if c != "Codigo")
+        self.con.executemany(
+            f"INSERT INTO productos ({lista}) VALUES ({marcas}) ON CONFLICT(Codigo) DO UPDATE SET {actualizar}",
+            self._filas(df_productos, columnas)
+        )
+
+    def _escribir_lotes(self, df_lotes, codigos=None):
+        if codigos is None:
+            self.con.execute("DELETE FROM lotes")
+        else:
+            codigos = [_valor_sql(c) for c in codigos]
+            self.con.executemany("DELETE FROM lotes WHERE Codigo_Producto = ?", [(c,) for c in codigos])
+        self.con.executemany(
+            "INSERT INTO lotes (Codigo_Producto, Fecha_Vencimiento, Cantidad) VALUES (?, ?, ?)",
+            self._filas(df_lotes, COLUMNAS_LOTES)
+        )
+
+    def _insertar_movimientos(self, df_nuevos):
+        columnas = self._columnas_guardables(df_nuevos, "movimientos")
+        lista = ", ".join(f'"{c}"' for c in columnas)
+        marcas = ", ".join("?" for _ in columnas)
+        self.con.executemany(f"INSERT INTO movimientos ({lista}) VALUES ({marcas})", self._filas(df_nuevos, columnas))
+
+    # --- Lectura ---
+
+    def existen_usuarios(self):
+        return self.con.execute("SELECT COUNT(*) FROM usuarios").fetchone()[0] > 0
+
+    def leer_usuarios(self):
+        if not self.existen_usuarios():
+            with self._transaccion():
+                self.con.executemany("INSERT INTO usuarios (email, password, rol) VALUES (?, ?, ?)",
+                                     list(zip(*USUARIOS_POR_DEFECTO.values())))
+        return pd.read_sql_query("SELECT email, password, rol FROM usuarios", self.con)
+
+    def leer_productos(self):
+        self._version_productos = self._leer_versiones()["productos"]
+        df_productos = pd.read_sql_query("SELECT * FROM productos ORDER BY Codigo", self.con)
+        for columna in COLUMNAS_FECHA_PRODUCTO:
+            df_productos[columna] = pd.to_datetime(df_productos[columna], format="%Y-%m-%d", errors='coerce')
+        return preparar_productos(df_productos)
+
+    def _leer_movimientos_desde(self, ultimo_id):
+        df = pd.read_sql_query("SELECT * FROM movimientos WHERE id > ? ORDER BY id", self.con, params=(ultimo_id,))
+        if not df.empty:
+            self._ultimo_id = int(df["id"].iloc[-1])
+        df = df.drop(columns="id")
+        for columna in COLUMNAS_FECHA_MOVIMIENTO:
+            if columna in df.columns:
+                df[columna] = pd.to_datetime(df[columna], format="%Y-%m-%d", errors='coerce')
+        return preparar_movimientos(df)
+
+    def leer_movimientos(self):
+        self._version_movimientos = self._leer_versiones()["movimientos"]
+        self._ultimo_id = 0
+        return self._leer_movimientos_desde(0)
+
+    def leer_lotes(self):
+        df_lotes = pd.read_sql_query("SELECT Codigo_Producto, Fecha_Vencimiento, Cantidad FROM lotes", self.con)
+        if df_lotes.empty and self.con.execute("SELECT COUNT(*) FROM productos WHERE Stock_Actual > 0").fetchone()[0] > 0:
+            return None
+        df_lotes["Fecha_Vencimiento"] = pd.to_datetime(df_lotes["Fecha_Vencimiento"], format="%Y-%m-%d", errors='coerce')
+        return df_lotes
+
+    def leer_checkpoints(self):
+        df = pd.read_sql_query("SELECT * FROM checkpoints", self.con)
+        if df.empty:
+            return None
+        for columna in ["Fecha_Checkpoint", "Fecha_Vencimiento"]:
+            df[columna] = pd.to_datetime(df[columna], format="%Y-%m-%d", errors='coerce')
+        return df
+
+    def productos_cambiaron(self):
+        return self._leer_versiones()["productos"] != self._version_productos
+
+    def movimientos_cambiaron(self):
+        return self._leer_versiones()["movimientos"] != self._version_movimientos
+
+    def leer_movimientos_nuevos(self, columnas):
+        """
+        Devuelve los movimientos con id mayor al ultimo leido (usa la clave primaria).
+        Devuelve None si hubo cambios que no son solo agregados y hay que leer todo.
+        """
+        if self._ultimo_id is None:
+            return None
+        versiones = self._leer_versiones()
+        df_nuevos = self._leer_movimientos_desde(self._ultimo_id)
+        self._version_movimientos = versiones["movimientos"]
+        return df_nuevos.reindex(columns=columnas)
+
+    # --- Escritura ---
+
+    def guardar_lotes(self, libro):
+        with self._transaccion():
+            self._escribir_lotes(libro.a_dataframe())
+
+    def guardar_checkpoints(self, df_checkpoints):
+        columnas = list(df_checkpoints.columns)
+        lista = ", ".join(columnas)
+        marcas = ", ".join("?" for _ in columnas)
+        with self._transaccion():
+            self.con.executemany(f"INSERT INTO checkpoints ({lista}) VALUES ({marcas})", self._filas(df_checkpoints, columnas))
+
+    def confirmar(self, df_productos, df_lotes, codigos, eliminados, df_nuevos, df_movimientos):
+        """
+        Guarda un lote de cambios del escritor en una sola transaccion. df_productos trae solo
+        las filas tocadas y df_lotes solo los lotes de codigos.
+        """
+        with self._transaccion():
+            if eliminados:
+                self.con.executemany("DELETE FROM productos WHERE Codigo = ?", [(_valor_sql(c),) for c in eliminados])
+            if not df_productos.empty:
+                self._upsert_productos(df_productos, self._columnas_guardables(df_productos, "productos"))
+            if codigos:
+                self._escribir_lotes(df_lotes, codigos)
+            if df_nuevos is not None:
+                self._insertar_movimientos(df_nuevos)
+
+# --- SELECCION E IMPORTACION ---
+
+def crear_almacenamiento(directorio=None, crear=False):
+    """
+    Devuelve el almacenamiento configurado con GESTOR_ALMACENAMIENTO ("csv" o "sqlite").
+    La ruta de la base SQLite se toma de GESTOR_BD (por defecto 'inventario.db').
+    Con directorio (la carpeta de una ubicacion, ver ubicaciones.py) los datos van dentro de el;
+    los usuarios de los CSV siguen en el directorio de trabajo, comunes a todas las ubicaciones.
+    crear: la base SQLite se crea si no existe (los CSV se crean al guardar).
+    """
+    tipo = os.environ.get("GESTOR_ALMACENAMIENTO", "csv").strip().lower()
+    if tipo == "sqlite":
+        ruta = os.environ.get("GESTOR_BD", ARCHIVO_BD)
+        ruta = ruta if directorio is None else os.path.join(directorio, os.path.basename(ruta))
+        return AlmacenamientoSQLite(ruta, crear)
+    if directorio is None:
+        return AlmacenamientoCSV()
+    return AlmacenamientoCSV(
+        archivo_productos=os.path.join(directorio, ARCHIVO_PRODUCTOS),
+        archivo_movimientos=os.path.join(directorio, ARCHIVO_MOVIMIENTOS),
+        archivo_lotes=os.path.join(directorio, ARCHIVO_LOTES),
+        archivo_checkpoints=os.path.join(directorio, ARCHIVO_CHECKPOINTS),
+        directorio_instantaneas=os.path.join(directorio, DIRECTORIO_INSTANTANEAS),
+        directorio_historial=os.path.join(directorio, DIRECTORIO_HISTORIAL),
+    )
+
+def importar_csv_a_sqlite(ruta_bd=ARCHIVO_BD, origen=None):
+    """
+    Copia productos, movimientos y usuarios de los CSV a una base SQLite nueva (una sola vez).
+    La lectura pasa por preparar_productos, asi que Precio_Unitario se migra a Precio_Venta.
+    Si no hay Lotes.csv, los lotes se migran desde las columnas FEFO de los productos.
+    """
+    if os.path.exists(ruta_bd):
+        raise FileExistsError(f"La base '{ruta_bd}' ya existe; no se sobrescribe.")
+    origen = origen or AlmacenamientoCSV()
+
+    df_productos = origen.leer_productos()
+    df_movimientos = origen.leer_movimientos()
+    df_usuarios = origen.leer_usuarios()
+    df_lotes = origen.leer_lotes()
+    libro = LibroLotes.desde_productos(df_productos) if df_lotes is None else LibroLotes.desde_dataframe(df_lotes)
+
+    destino = AlmacenamientoSQLite(ruta_bd, crear=True)
+    with destino._transaccion():
+        destino._upsert_productos(df_productos, destino._columnas_guardables(df_productos, "productos"))
+        destino._insertar_movimientos(df_movimientos)
+        destino._escribir_lotes(libro.a_dataframe())
+        destino.con.executemany(
+            "INSERT OR REPLACE INTO usuarios (email, password, rol) VALUES (?, ?, ?)",
+            destino._filas(df_usuarios, ["email", "password", "rol"])
+        )
+    return len(df_productos), len(df_movimientos), len(df_usuarios)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Herramientas de almacenamiento del Gestor de Inventario")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_importar = sub.add_parser("importar", help="Importa los CSV a una base SQLite nueva")
+    p_importar.add_argument("--bd", default=ARCHIVO_BD)
+    p_importar.add_argument("--productos", default=ARCHIVO_PRODUCTOS)
+    p_importar.add_argument("--movimientos", default=ARCHIVO_MOVIMIENTOS)
+    p_importar.add_argument("--usuarios", default=ARCHIVO_USUARIOS)
+    args = parser.parse_args()
+
+    if args.comando == "importar":
+        origen = AlmacenamientoCSV(args.productos, args.movimientos, args.usuarios)
+        n_prod, n_mov, n_usr = importar_csv_a_sqlite(args.bd, origen)
+        print(f"Importados {n_prod} productos, {n_mov} movimientos y {n_usr} usuarios en '{args.bd}'.")
@@ -0,0 +1,387 @@
+"""
+API HTTP local para registrar movimientos y consultar stock sin pasar por la app (terminales de
+venta, lectores de codigos). Corre como proceso aparte, sobre el mismo almacenamiento que la app
+(GESTOR_ALMACENAMIENTO / GESTOR_BD y, con varias ubicaciones, GESTOR_UBICACION):
+
+    python api.py --host 127.0.0.1 --port 8502
+
+Aplica las mismas reglas que la app: los movimientos pasan por AlmacenDatos.registrar_movimientos
+(validacion de importacion.py y lotes FEFO) y los productos nuevos por AlmacenDatos.crear_producto.
+Los dos escriben dentro de AlmacenDatos.escritura: con la app (u otra API) escribiendo a la vez,
+cada proceso relee el disco y guarda con el bloqueo entre procesos tomado (ver escritura.py).
+
+Los pedidos se atienden de forma asincronica. Los movimientos que llegan dentro de una ventana
+corta se validan y aplican juntos (un solo pd.concat del historial y una pasada por los lotes de
+cada producto) y el escritor unico los guarda en una sola escritura. Si un movimiento tiene errores,
+se rechaza todo su pedido y el resto del lote se aplica igual.
+
+- GET  /salud
+- GET  /productos?buscar=texto&limite=100
+- GET  /productos/{codigo}       el producto y sus lotes
+- POST /productos                {"Nombre", "Categoria", "Descripcion", "Stock_Inicial", "Stock_Minimo",
+                                  "Costo", "Precio_Venta", "Fecha_Vencimiento"}
+- POST /movimientos              un movimiento o una lista (todos o ninguno), con las columnas de
+                                 Movimientos.csv: {"Codigo_Producto", "Tipo", "Cantidad", "Responsable",
+                                 "Motivo", "Vencimiento_Lote", "Fecha", "Id_Transaccion"}
+- POST /transferencias           {"Codigo_Producto", "Cantidad", "Destino", "Responsable"}: envia stock
+                                 a otra ubicacion (ver ubicaciones.py)
+
+Con la variable GESTOR_API_TOKEN definida, cada pedido debe traer "Authorization: Bearer <token>".
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from almacen_datos import AlmacenDatos
+from almacenamiento import crear_almacenamiento
+from importacion import COLUMNAS_IMPORTADAS
+from lotes import StockInsuficiente
+from metricas import METRICAS
+from ubicaciones import Ubicacion
+
+log = logging.getLogger("api")
+
+# Tiempo que se esperan mas movimientos antes de aplicar un lote (segundos)
+VENTANA_LOTE = 0.01
+
+# Filas maximas por lote: con mas, el lote se aplica sin esperar el fin de la ventana
+MAXIMO_LOTE = 5000
+
+# Tiempo maximo que un pedido espera la confirmacion del escritor (segundos)
+TIEMPO_MAX_ESCRITURA = 30
+
+TOKEN = os.environ.get("GESTOR_API_TOKEN", "")
+
+COLUMNAS_PRODUCTO_API = ["Codigo", "Nombre", "Categoria", "Descripcion", "Stock_Actual", "Stock_Minimo",
+                         "Precio_Venta", "Fecha_Vencimiento", "Estado (Stock)", "Estado (Vencimiento)"]
+
+def _json(df):
+    """
+    Respuesta JSON con las filas de df (fechas en formato ISO).
+    """
+    return Response(df.to_json(orient="records", date_format="iso", date_unit="s", force_ascii=False),
+                    media_type="application/json")
+
+async def _esperar_escritura(confirmacion):
+    """
+    Espera la confirmacion del escritor sin bloquear el bucle. shield: si se agota el tiempo no se
+    cancela el Future del escritor (que lo va a completar igual).
+    """
+    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(confirmacion)), TIEMPO_MAX_ESCRITURA)
+
+def _error(estado, mensaje, **extra):
+    return JSONResponse({"error": mensaje, **extra}, status_code=estado)
+
+class LoteadorMovimientos:
+    """
+    Junta los movimientos de los pedidos que llegan dentro de VENTANA_LOTE y los aplica en un hilo
+    (el lock del almacen es de threading). La confirmacion de la escritura se espera aparte, asi el
+    lote siguiente se aplica mientras el anterior se guarda y el escritor los une si puede.
+    """
+
+    def __init__(self, almacen, ventana=VENTANA_LOTE, maximo=MAXIMO_LOTE):
+        self.almacen = almacen
+        self.ventana = ventana
+        self.maximo = maximo
+        self._cola = None
+        self._tarea = None
+
+    def iniciar(self):
+        self._cola = asyncio.Queue()
+        self._tarea = asyncio.create_task(self._trabajar())
+
+    async def detener(self):
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+
+    async def registrar(self, movimientos):
+        """
+        Encola los movimientos de un pedido (lista de dicts) y espera su resultado.
+        """
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((movimientos, futuro))
+        return await futuro
+
+    async def _juntar_lote(self):
+        lote = [await self._cola.get()]
+        filas = len(lote[0][0])
+        bucle = asyncio.get_running_loop()
+        limite = bucle.time() + self.ventana
+        while filas < self.maximo:
+            restante = limite - bucle.time()
+            if restante <= 0:
+                break
+            try:
+                pedido = await asyncio.wait_for(self._cola.get(), restante)
+            except asyncio.TimeoutError:
+                break
+            lote.append(pedido)
+            filas += len(pedido[0])
+        return lote
+
+    async def _trabajar(self):
+        while True:
+            lote = await self._juntar_lote()
+            try:
+                with METRICAS.medir("api_lote_movimientos"):
+                    resultados, confirmacion = await asyncio.to_thread(self._aplicar, [m for m, _ in lote])
+            except Exception as e:
+                log.exception("No se pudo aplicar un lote de movimientos")
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                continue
+            METRICAS.contar("api_movimientos", sum(len(m) for m, _ in lote))
+            asyncio.create_task(self._confirmar(lote, resultados, confirmacion))
+
+    async def _confirmar(self, lote, resultados, confirmacion):
+        try:
+            if confirmacion is not None:
+                await _esperar_escritura(confirmacion)
+        except Exception as e:
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        for (_, futuro), resultado in zip(lote, resultados):
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+    def _aplicar(self, pedidos):
+        """
+        Valida y aplica todos los movimientos del lote de una vez. Devuelve (resultados, confirmacion):
+        por pedido, la lista de filas aplicadas con el stock que dejo cada una o sus errores.
+        """
+        movimientos = [m for pedido in pedidos for m in pedido]
+        grupos = np.repeat(np.arange(len(pedidos)), [len(pedido) for pedido in pedidos])
+        inicio = np.concatenate([[0], np.cumsum([len(pedido) for pedido in pedidos])])
+        df_archivo = pd.DataFrame({
+            columna: ["" if m.get(columna) is None else str(m.get(columna)) for m in movimientos]
+            for columna in COLUMNAS_IMPORTADAS
+        })
+
+        with self.almacen.lock:
+            df_nuevos, filas, errores, confirmacion = self.almacen.registrar_movimientos(
+                df_archivo, parcial=True, grupos=grupos
+            )
+            stock_final = None
+            if df_nuevos is not None:
+                posiciones = [self.almacen.indice_productos.fila(c) for c in df_nuevos["Codigo_Producto"].tolist()]
+                stock_final = self.almacen.df_productos.loc[posiciones, "Stock_Actual"].to_numpy()
+
+        resultados = [{"aceptado": True, "movimientos": []} for _ in pedidos]
+        if df_nuevos is not None:
+            # Stock despues de cada fila: el final menos lo que movieron las filas siguientes del producto
+            delta = np.where(df_nuevos["Tipo"] == "Salida", -1, 1) * df_nuevos["Cantidad"].to_numpy()
+            por_producto = pd.Series(delta).groupby(df_nuevos["Codigo_Producto"].to_numpy())
+            despues = stock_final - (por_producto.transform("sum").to_numpy() - por_producto.cumsum().to_numpy())
+            for fila, codigo, tipo, cantidad, stock in zip(filas, df_nuevos["Codigo_Producto"].tolist(),
+                                                           df_nuevos["Tipo"].tolist(), df_nuevos["Cantidad"].tolist(),
+                                                           despues.tolist()):
+                pedido = grupos[fila]
+                resultados[pedido]["movimientos"].append(
+                    {"Codigo_Producto": codigo, "Tipo": tipo, "Cantidad": cantidad, "Stock_Actual": stock})
+
+        for fila, mensaje in zip(errores["Fila"].tolist(), errores["Error"].tolist()):
+            # Fila 0: falta una columna obligatoria en todo el lote
+            pedidos_error = range(len(pedidos)) if fila == 0 else [grupos[fila - 2]]
+            for pedido in pedidos_error:
+                resultado = resultados[pedido]
+                resultado["aceptado"] = False
+                resultado["movimientos"] = []
+                resultado.setdefault("errores", []).append(
+                    {"Movimiento": None if fila == 0 else int(fila - 2 - inicio[pedido]), "Error": mensaje})
+        return resultados, confirmacion
+
+# --- ENDPOINTS ---
+
+def _autorizado(request):
+    if not TOKEN:
+        return True
+    recibido = request.headers.get("authorization", "")
+    return hmac.compare_digest(recibido, f"Bearer {TOKEN}")
+
+def _fecha(texto):
+    """
+    Fecha en formato DD-MM-YYYY (como en los CSV) o AAAA-MM-DD. Vacia: NaT.
+    """
+    texto = str(texto or "").strip()
+    if not texto:
+        return pd.NaT
+    return pd.to_datetime(texto, dayfirst=texto[4:5] != "-").normalize()
+
+async def salud(request):
+    return JSONResponse({"estado": "ok"})
+
+async def listar_productos(request):
+    if not _autorizado(request):
+        return _error(401, "No autorizado.")
+    buscar = request.query_params.get("buscar", "")
+    try:
+        limite = int(request.query_params.get("limite", 100))
+    except ValueError:
+        return _error(400, "limite debe ser un numero entero.")
+
+    def leer():
+        with almacen.lock:
+            almacen.refrescar()
+            almacen.actualizar_estados()
+            df = almacen.buscar_productos(buscar) if buscar else almacen.df_productos
+            return df[[c for c in COLUMNAS_PRODUCTO_API if c in df.columns]].head(limite)
+
+    return _json(await asyncio.to_thread(leer))
+
+async def ver_producto(request):
+    if not _autorizado(request):
+        return _error(401, "No autorizado.")
+    try:
+        codigo = int(request.path_params["codigo"])
+    except ValueError:
+        return _error(400, "El codigo debe ser un numero entero.")
+
+    def leer():
+        with almacen.lock:
+            almacen.refrescar()
+            almacen.actualizar_estados()
+            idx = almacen.indice_productos.fila(codigo)
+            if idx is None:
+                return None
+            columnas = [c for c in COLUMNAS_PRODUCTO_API if c in almacen.df_productos.columns]
+            producto = json.loads(almacen.df_productos.loc[[idx], columnas].to_json(
+                orient="records", date_format="iso", date_unit="s", force_ascii=False))[0]
+            producto["Lotes"] = [{"Fecha_Vencimiento": None if pd.isna(fecha) else fecha.isoformat(),
+                                  "Cantidad": int(cantidad)}
+                                 for fecha, cantidad in almacen.libro_lotes.lotes(codigo)]
+            return producto
+
+    producto = await asyncio.to_thread(leer)
+    if producto is None:
+        return _error(404, f"No existe el producto {codigo}.")
+    return JSONResponse(producto)
+
+async def crear_producto(request):
+    if not _autorizado(request):
+        return _error(401, "No autorizado.")
+    try:
+        datos = await request.json()
+        if not isinstance(datos, dict):
+            raise ValueError
+    except ValueError:
+        return _error(400, "El cuerpo debe ser un objeto JSON.")
+
+    def crear():
+        return almacen.crear_producto(
+            datos.get("Nombre", ""), datos.get("Categoria", ""), datos.get("Descripcion", ""),
+            int(datos.get("Stock_Inicial", 0)), int(datos.get("Stock_Minimo", 0)),
+            int(datos.get("Costo", 0)), int(datos.get("Precio_Venta", 0)), _fecha(datos.get("Fecha_Vencimiento")),
+        )
+
+    try:
+        codigo, confirmacion = await asyncio.to_thread(crear)
+    except (ValueError, TypeError) as e:
+        return _error(422, str(e))
+    try:
+        await _esperar_escritura(confirmacion)
+    except Exception as e:
+        return _error(503, f"No se pudo guardar en disco: {e}")
+    return JSONResponse({"Codigo": int(codigo)}, status_code=201)
+
+async def registrar_movimientos(request):
+    if not _autorizado(request):
+        return _error(401, "No autorizado.")
+    try:
+        datos = await request.json()
+    except ValueError:
+        return _error(400, "El cuerpo debe ser JSON.")
+    uno = isinstance(datos, dict)
+    movimientos = [datos] if uno else datos
+    if not isinstance(movimientos, list) or not movimientos or not all(isinstance(m, dict) for m in movimientos):
+        return _error(400, "Se espera un movimiento (objeto) o una lista de movimientos.")
+
+    try:
+        resultado = await loteador.registrar(movimientos)
+    except Exception as e:
+        return _error(503, f"No se pudo guardar en disco: {e}")
+    if not resultado["aceptado"]:
+        return JSONResponse(resultado, status_code=422)
+    if uno:
+        return JSONResponse(resultado["movimientos"][0], status_code=201)
+    return JSONResponse(resultado, status_code=201)
+
+async def transferir(request):
+    if not _autorizado(request):
+        return _error(401, "No autorizado.")
+    try:
+        datos = await request.json()
+        if not isinstance(datos, dict):
+            raise ValueError
+    except ValueError:
+        return _error(400, "El cuerpo debe ser un objeto JSON.")
+
+    try:
+        codigo, cantidad = int(datos.get("Codigo_Producto")), int(datos.get("Cantidad"))
+    except (TypeError, ValueError):
+        return _error(422, "Codigo_Producto y Cantidad deben ser numeros enteros.")
+    try:
+        df_nuevos, confirmacion = await asyncio.to_thread(
+            almacen.transferir, codigo, cantidad, str(datos.get("Destino", "")), datos.get("Responsable", ""))
+    except (ValueError, StockInsuficiente) as e:
+        return _error(422, str(e))
+    try:
+        await _esperar_escritura(confirmacion)
+    except Exception as e:
+        return _error(503, f"No se pudo guardar en disco: {e}")
+    lotes = [{"Vencimiento_Lote": None if pd.isna(fecha) else fecha.isoformat(), "Cantidad": int(-cantidad)}
+             for fecha, cantidad in zip(df_nuevos["Vencimiento_Lote"], df_nuevos["Cantidad"])]
+    return JSONResponse({"Motivo": df_nuevos["Motivo"].iloc[0], "Lotes": lotes}, status_code=201)
+
+# --- APLICACION ---
+
+ubicacion = Ubicacion.actual()
+almacen = AlmacenDatos(crear_almacenamiento() if ubicacion is None else ubicacion.almacenamiento(),
+                       avisos=log, ubicacion=ubicacion)
+loteador = LoteadorMovimientos(almacen)
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    if not await asyncio.to_thread(almacen.refrescar):
+        raise RuntimeError(f"No se pudieron cargar {almacen.almacenamiento.descripcion}.")
+    loteador.iniciar()
+    yield
+    await loteador.detener()
+
+app = Starlette(
+    routes=[
+        Route("/salud", salud),
+        Route("/productos", listar_productos),
+        Route("/productos", crear_producto, methods=["POST"]),
+        Route("/productos/{codigo}", ver_producto),
+        Route("/movimientos", registrar_movimientos, methods=["POST"]),
+        Route("/transferencias", transferir, methods=["POST"]),
+    ],
+    lifespan=ciclo_de_vida,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API HTTP local de movimientos y stock del inventario")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -1,357 +1,541 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
-import time 
+
+from almacen_datos import AlmacenDatos
+from almacenamiento import FORMATO_FECHA, crear_almacenamiento
+from esquema import asignar_categoria
+from estados import DIAS_PROXIMO_VENCIMIENTO
+from importacion import TIPOS_MOVIMIENTO, leer_archivo_movimientos, nuevo_id_transaccion, stock_proyectado, validar_movimientos
+from lotes import StockInsuficiente, aplicar_movimiento
+from metricas import ARCHIVO_METRICAS, METRICAS
+from reposicion import DIAS_COBERTURA_OBJETIVO, PLAZO_REPOSICION, VENTANA_DEMANDA
+from ubicaciones import Ubicacion, consolidado
 
 # --- 1. CONFIGURACION INICIAL ---
 st.set_page_config(layout="wide", page_title="Gestor de Inventario")
 
 # --- 2. GESTION DE DATOS (CARGAR Y GUARDAR) ---
 
-def load_data():
+# Tiempo maximo que una sesion espera la confirmacion del escritor (segundos)
+TIEMPO_MAX_ESCRITURA = 30
+
+def esperar_escritura(confirmacion):
     """
-    Carga archivos y prepara columnas para logica FEFO automatica (Stock Viejo y Fecha Pendiente).
+    Espera a que el escritor guarde el cambio en disco. No se debe llamar con el lock del almacen tomado.
+    Devuelve False (y muestra el error) si no se pudo guardar.
     """
     try:
-        df_productos = pd.read_csv("Productos.csv", sep=";")
-        df_movimientos = pd.read_csv("Movimientos.csv", sep=";")
-    except FileNotFoundError:
-        st.error("Error: No se encontraron los archivos 'Productos.csv' o 'Movimientos.csv'.")
-        return None, None, None
-    
-    try:
-        df_usuarios = pd.read_csv("usuarios.csv", sep=";")
-    except FileNotFoundError:
-        st.info("Creando archivo 'usuarios.csv' por defecto...")
-        default_users = {'email': ['admin@gestor.com'], 'password': ['admin'], 'rol': ['Admin']}
-        df_usuarios = pd.DataFrame(default_users)
-        df_usuarios.to_csv("usuarios.csv", sep=";", index=False)
-        
-    if "Motivo" not in df_movimientos.columns:
-        df_movimientos["Motivo"] = ""
-    df_movimientos["Motivo"] = df_movimientos["Motivo"].fillna("")
-    
-    df_productos.columns = df_productos.columns.str.strip()
-    df_movimientos.columns = df_movimientos.columns.str.strip()
-    df_usuarios.columns = df_usuarios.columns.str.strip()
-    
-    # --- MIGRACION DE COLUMNAS ---
-    if "Precio_Unitario" in df_productos.columns and "Precio_Venta" not in df_productos.columns:
-        df_productos = df_productos.rename(columns={"Precio_Unitario": "Precio_Venta"})
-    elif "Precio_Venta" not in df_productos.columns:
-        df_productos["Precio_Venta"] = 0 
-
-    if "Costo" not in df_productos.columns:
-        df_productos["Costo"] = 0
-    
-    # --- NUEVO: Columnas para FEFO Automatico ---
-    if "Stock_Viejo_Restante" not in df_productos.columns:
-        df_productos["Stock_Viejo_Restante"] = 0
-    
-    if "Fecha_Vencimiento_Pendiente" not in df_productos.columns:
-        df_productos["Fecha_Vencimiento_Pendiente"] = pd.NaT # Fecha vacia por defecto
-
-    # Rellenar vacios
-    df_productos["Costo"] = df_productos["Costo"].fillna(0)
-    df_productos["Precio_Venta"] = df_productos["Precio_Venta"].fillna(0)
-    df_productos["Stock_Viejo_Restante"] = df_productos["Stock_Viejo_Restante"].fillna(0)
-    # --- FIN NUEVO ---
-
-    try:
-        df_productos["Fecha_Entrada"] = pd.to_datetime(df_productos["Fecha_Entrada"], dayfirst=True, errors='coerce').dt.normalize()
-        df_productos["Fecha_Vencimiento"] = pd.to_datetime(df_productos["Fecha_Vencimiento"], dayfirst=True, errors='coerce').dt.normalize()
-        # --- NUEVO: Convertir fecha pendiente ---
-        df_productos["Fecha_Vencimiento_Pendiente"] = pd.to_datetime(df_productos["Fecha_Vencimiento_Pendiente"], dayfirst=True, errors='coerce').dt.normalize()
-        
-        df_movimientos["Fecha"] = pd.to_datetime(df_movimientos["Fecha"], dayfirst=True, errors='coerce').dt.normalize()
-    except KeyError as e:
-        st.error(f"Error: Falta una columna de fecha esencial: {e}")
-        return None, None, None
-
-    if "Descripcion" not in df_productos.columns:
-        df_productos["Descripcion"] = ""
-    df_productos["Descripcion"] = df_productos["Descripcion"].fillna("") 
-
-    return df_productos, df_movimientos, df_usuarios
+        confirmacion.result(timeout=TIEMPO_MAX_ESCRITURA)
+    except Exception as e:
+        st.error(f"Error: No se pudo guardar en disco: {e}")
+        return False
+    return True
 
-def save_data(df_productos, df_movimientos):
+@st.cache_resource
+def obtener_almacen():
     """
-    Guarda los DataFrames de vuelta a CSV, incluyendo las nuevas columnas FEFO.
+    Devuelve el almacen de datos del proceso (uno solo para todas las sesiones). Con
+    GESTOR_UBICACION, el de esa ubicacion (ver ubicaciones.py).
     """
-    date_format_string = "%d-%m-%Y"
-    
-    df_prod_save = df_productos.copy()
-    df_mov_save = df_movimientos.copy()
+    ubicacion = Ubicacion.actual()
+    almacenamiento = crear_almacenamiento() if ubicacion is None else ubicacion.almacenamiento()
+    return AlmacenDatos(almacenamiento, avisos=st, ubicacion=ubicacion)
 
-    df_prod_save["Fecha_Entrada"] = df_prod_save["Fecha_Entrada"].dt.strftime(date_format_string)
-    
-    # Formatear Fecha Vencimiento Principal
-    df_prod_save["Fecha_Vencimiento"] = df_prod_save["Fecha_Vencimiento"].apply(
-        lambda x: x.strftime(date_format_string) if pd.notnull(x) else ""
-    )
-    
-    # --- NUEVO: Formatear Fecha Pendiente ---
-    df_prod_save["Fecha_Vencimiento_Pendiente"] = df_prod_save["Fecha_Vencimiento_Pendiente"].apply(
-        lambda x: x.strftime(date_format_string) if pd.notnull(x) else ""
-    )
-    
-    df_mov_save["Fecha"] = df_mov_save["Fecha"].dt.strftime(date_format_string)
-    
-    if "Motivo" not in df_mov_save.columns:
-        df_mov_save["Motivo"] = ""
-    df_mov_save["Motivo"] = df_mov_save["Motivo"].fillna("")
+# --- 3. FUNCIONES DE LAS PAGINAS ---
 
-    df_prod_save.to_csv("Productos.csv", sep=";", index=False)
-    df_mov_save.to_csv("Movimientos.csv", sep=";", index=False)
+# Las paginas de uso continuo se dividen en fragmentos (st.fragment): un cambio en un widget del
+# fragmento vuelve a ejecutar solo ese fragmento, sin el codigo principal ni el resto de la pagina.
+# Por eso los fragmentos toman los datos del almacen (almacen_al_dia) y no por parametro: los
+# parametros serian los del ultimo rerun completo. El resumen de alertas de la barra lateral se
+# pone al dia en el siguiente rerun completo.
 
-def update_statuses(df_productos):
+def almacen_al_dia():
     """
-    Calcula y actualiza las columnas de 'Estado (Stock)' y 'Estado (Vencimiento)'
+    El almacen con los cambios de disco aplicados y los estados al dia, como lo deja el codigo
+    principal en cada rerun completo.
     """
-    if df_productos.empty:
-        return df_productos
+    almacen = obtener_almacen()
+    with almacen.lock:
+        almacen.refrescar()
+        almacen.actualizar_estados()
+    return almacen
 
-    today = pd.to_datetime(datetime.now().date())
-    
-    df_productos['Estado (Stock)'] = df_productos.apply(
-        lambda row: "🔴 CRITICO" if row['Stock_Actual'] < row['Stock_Minimo'] 
-                      else ("🟡 ADVERTENCIA" if row['Stock_Actual'] < (row['Stock_Minimo'] * 1.5) 
-                            else "🟢 OPTIMO"),
-        axis=1
-    )
-    
-    df_productos['Fecha_Vencimiento'] = pd.to_datetime(df_productos['Fecha_Vencimiento']).dt.normalize()
-    
-    dias_para_vencer = (df_productos['Fecha_Vencimiento'] - today).dt.days
-    
-    df_productos['Estado (Vencimiento)'] = "🟢 OK"
-    df_productos.loc[dias_para_vencer <= 7, 'Estado (Vencimiento)'] = "🟡 PROXIMO A VENCER"
-    df_productos.loc[dias_para_vencer < 0, 'Estado (Vencimiento)'] = "🔴 VENCIDO"
-    df_productos.loc[pd.isna(df_productos['Fecha_Vencimiento']), 'Estado (Vencimiento)'] = "⚪ N/A"
-    
-    return df_productos
+def guardar_aviso(mensaje):
+    """
+    Guarda un mensaje de exito para mostrarlo despues del proximo st.rerun (con mostrar_aviso).
+    """
+    st.session_state.aviso = mensaje
 
-# --- 3. FUNCIONES DE LAS PAGINAS ---
+def mostrar_aviso():
+    mensaje = st.session_state.pop('aviso', None)
+    if mensaje:
+        st.success(mensaje)
 
-def mostrar_inventario(df_productos):
+@METRICAS.cronometrar("pagina", pagina="mostrar_inventario")
+def mostrar_inventario():
     st.header("Estado del Inventario")
-    
+    alertas_inventario()
+    st.divider()
+    tabla_inventario()
+    st.divider()
+    stock_en_fecha()
+
+@st.fragment
+@METRICAS.cronometrar("fragmento", fragmento="alertas_inventario")
+def alertas_inventario():
     st.subheader("Alertas ⚠️")
     col1, col2 = st.columns(2)
     
+    dias = st.session_state.get('alertas_dias', DIAS_PROXIMO_VENCIMIENTO)
+    alert_stock, alert_venc = almacen_al_dia().productos_en_alerta(dias)
+    
     with col1:
         st.write("Stock Critico/Advertencia")
-        alert_stock = df_productos[df_productos['Estado (Stock)'].isin(["🔴 CRITICO", "🟡 ADVERTENCIA"])]
         st.dataframe(alert_stock[["Nombre", "Stock_Actual", "Stock_Minimo", "Estado (Stock)"]], use_container_width=True)
 
     with col2:
         st.write("Vencimiento Proximo/Vencido")
-        alert_venc = df_productos[df_productos['Estado (Vencimiento)'].isin(["🔴 VENCIDO", "🟡 PROXIMO A VENCER"])]
+        st.number_input("Vencen en los proximos (dias):", min_value=0, max_value=365, value=DIAS_PROXIMO_VENCIMIENTO, key='alertas_dias')
         st.dataframe(alert_venc[["Nombre", "Fecha_Vencimiento", "Estado (Vencimiento)"]], use_container_width=True,
                          column_config={"Fecha_Vencimiento": st.column_config.DateColumn("Fecha Vencimiento", format="DD-MM-YYYY")})
-    
-    st.divider()
+
+@st.fragment
+@METRICAS.cronometrar("fragmento", fragmento="tabla_inventario")
+def tabla_inventario():
     st.subheader("Inventario Completo")
+    almacen = almacen_al_dia()
     
     col_f1, col_f2 = st.columns([1, 2])
     with col_f1:
-        if "Categoria" in df_productos.columns and not df_productos["Categoria"].empty:
-            categorias = ["Todas"] + sorted(list(df_productos["Categoria"].dropna().unique()))
-        else:
-            categorias = ["Todas"]
+        categorias = ["Todas"] + almacen.catalogo().categorias
         cat_filter = st.selectbox("Filtrar por Categoria:", options=categorias)
     
     with col_f2:
-        search_term = st.text_input("Buscar por Nombre:", placeholder="Ej: Leche Entera")
+        search_term = st.text_input("Buscar (nombre, descripcion o categoria):", placeholder="Ej: Leche Entera")
 
-    df_display = df_productos.copy()
+    # Con busqueda, las filas vienen ordenadas de la mas parecida a la menos parecida
+    df_display = almacen.buscar_productos(search_term) if search_term else almacen.df_productos
     if cat_filter != "Todas":
         df_display = df_display[df_display["Categoria"] == cat_filter]
-    if search_term:
-        df_display = df_display[df_display["Nombre"].str.contains(search_term, case=False)]
 
-    st.dataframe(df_display, use_container_width=True,
-                 column_config={
-                     "Fecha_Entrada": st.column_config.DateColumn("Fecha Entrada", format="DD-MM-YYYY"),
-                     "Fecha_Vencimiento": st.column_config.DateColumn("Fecha Vencimiento", format="DD-MM-YYYY"),
-                     "Precio_Venta": st.column_config.NumberColumn("Precio Venta", format="$ %d"),
-                     "Costo": st.column_config.NumberColumn("Costo", format="$ %d")
-                 })
+    with METRICAS.medir("render_tabla", tabla="inventario"):
+        st.dataframe(df_display, use_container_width=True,
+                     column_config={
+                         "Fecha_Entrada": st.column_config.DateColumn("Fecha Entrada", format="DD-MM-YYYY"),
+                         "Fecha_Vencimiento": st.column_config.DateColumn("Fecha Vencimiento", format="DD-MM-YYYY"),
+                         "Precio_Venta": st.column_config.NumberColumn("Precio Venta", format="$ %d"),
+                         "Costo": st.column_config.NumberColumn("Costo", format="$ %d")
+                     })
+    METRICAS.contar("filas_mostradas", len(df_display), tabla="inventario")
+
+@st.fragment
+def stock_en_fecha():
+    if st.checkbox("📅 Consultar el stock en una fecha pasada"):
+        fecha_consulta = st.date_input("Stock al cierre del dia:", datetime.now(), format="DD/MM/YYYY")
+        almacen = almacen_al_dia()
+        with st.spinner("Reconstruyendo el stock..."):
+            stock_fecha = almacen.stock_en_fecha(fecha_consulta)
+        df_productos = almacen.df_productos
+        df_fecha = df_productos[["Codigo", "Nombre", "Categoria", "Stock_Actual"]].assign(
+            **{"Stock en la Fecha": df_productos["Codigo"].map(stock_fecha).fillna(0)})
+        st.dataframe(df_fecha, use_container_width=True, hide_index=True)
+
+# Columnas de la fila del producto que se muestra despues de registrar un movimiento
+COLUMNAS_PRODUCTO_MOVIDO = ["Codigo", "Nombre", "Stock_Actual", "Stock_Minimo", "Estado (Stock)",
+                            "Fecha_Vencimiento", "Estado (Vencimiento)"]
 
-def registrar_movimiento(df_productos, df_movimientos, product_map_name_to_id, product_map_id_to_name):
+@METRICAS.cronometrar("pagina", pagina="registrar_movimiento")
+def registrar_movimiento():
     st.header("Registrar Nuevo Movimiento")
     
     col_f1, col_form, col_f3 = st.columns([1, 2, 1])
     
     with col_form:
+        if st.toggle("🛒 Modo carrito (varias lineas en una sola transaccion)", key='modo_carrito'):
+            carrito_movimientos()
+        else:
+            formulario_movimiento()
+        importar_movimientos()
+        transferir_producto()
+
+    st.divider()
+    historial_movimientos()
+
+@st.fragment
+@METRICAS.cronometrar("fragmento", fragmento="formulario_movimiento")
+def formulario_movimiento():
+    """
+    Alta de un movimiento. Cambiar el tipo o registrar (con teclado o lector de codigos) solo
+    vuelve a dibujar el formulario y la fila del producto movido, no el historial ni las alertas.
+    """
+    tipo_movimiento = st.radio(
+        "Tipo de Movimiento:", 
+        ["Entrada", "Salida", "Ajuste"], 
+        horizontal=True,
+        key='tipo_movimiento'
+    )
+    
+    with st.form("nuevo_movimiento_form"):
+        col_m1, col_m2 = st.columns(2)
         
-        tipo_movimiento = st.radio(
-            "Tipo de Movimiento:", 
-            ["Entrada", "Salida", "Ajuste"], 
-            horizontal=True,
-            key='tipo_movimiento'
-        )
+        with col_m1:
+            producto_nombre = st.selectbox(
+                "Producto:", 
+                options=obtener_almacen().catalogo().nombres
+            )
+            responsable = st.text_input("Responsable:", placeholder="Ej: Vendedor1")
         
-        with st.form("nuevo_movimiento_form"):
-            col_m1, col_m2 = st.columns(2)
+        with col_m2:
+            if st.session_state.tipo_movimiento == "Ajuste":
+                cantidad = st.number_input("Cantidad (Positiva o Negativa):", step=1)
+            else:
+                cantidad = st.number_input("Cantidad:", min_value=1, step=1)
             
-            with col_m1:
-                producto_nombre = st.selectbox(
-                    "Producto:", 
-                    options=df_productos["Nombre"]
-                )
-                responsable = st.text_input("Responsable:", placeholder="Ej: Vendedor1")
+            motivo = ""
+            if st.session_state.tipo_movimiento == "Ajuste":
+                motivo = st.text_input("Motivo del Ajuste:", placeholder="Ej: Merma por rotura")
             
-            with col_m2:
-                if st.session_state.tipo_movimiento == "Ajuste":
-                    cantidad = st.number_input("Cantidad (Positiva o Negativa):", step=1)
-                else:
-                    cantidad = st.number_input("Cantidad:", min_value=1, step=1)
-                
-                motivo = ""
-                if st.session_state.tipo_movimiento == "Ajuste":
-                    motivo = st.text_input("Motivo del Ajuste:", placeholder="Ej: Merma por rotura")
-                
-                fecha_vencimiento_nueva = None
-                if st.session_state.tipo_movimiento == "Entrada":
-                    fecha_vencimiento_nueva = st.date_input("Vencimiento del Nuevo Lote:", datetime.now())
-
-            submitted = st.form_submit_button("Registrar Movimiento")
-
-        if submitted:
-            if not responsable:
-                st.warning("El campo 'Responsable' no puede estar vacio.")
-            elif st.session_state.tipo_movimiento == "Ajuste" and not motivo:
-                st.warning("Debe ingresar un motivo para el ajuste.")
-            elif st.session_state.tipo_movimiento == "Ajuste" and cantidad == 0:
-                st.warning("La cantidad del ajuste no puede ser cero.")
-            else:
-                codigo_producto = product_map_name_to_id[producto_nombre]
-                fecha_actual = pd.to_datetime(datetime.now().date())
-                
-                idx = df_productos.index[df_productos['Codigo'] == codigo_producto].tolist()[0]
-                
-                stock_actual = df_productos.at[idx, 'Stock_Actual']
-                fecha_venc_actual = df_productos.at[idx, 'Fecha_Vencimiento']
-                stock_viejo_restante = df_productos.at[idx, 'Stock_Viejo_Restante']
-                fecha_venc_pendiente = df_productos.at[idx, 'Fecha_Vencimiento_Pendiente']
-                
-                nuevo_stock = stock_actual
-                mensaje_extra = "" 
-                
-                # --- LOGICA DE MOVIMIENTOS ---
-                if tipo_movimiento == "Salida":
-                    if cantidad > stock_actual:
-                        st.error(f"Error: No hay stock suficiente. Stock actual: {stock_actual}")
-                        return 
-                    
-                    nuevo_stock = stock_actual - cantidad
-                    
-                    # Logica FEFO Salida
-                    if stock_viejo_restante > 0:
-                        stock_viejo_restante -= cantidad
-                        st.session_state.df_productos.at[idx, 'Stock_Viejo_Restante'] = max(0, stock_viejo_restante)
-                        
-                        if stock_viejo_restante <= 0 and pd.notnull(fecha_venc_pendiente):
-                            st.session_state.df_productos.at[idx, 'Fecha_Vencimiento'] = fecha_venc_pendiente
-                            st.session_state.df_productos.at[idx, 'Fecha_Vencimiento_Pendiente'] = pd.NaT
-                            st.session_state.df_productos.at[idx, 'Stock_Viejo_Restante'] = 0
-                            
-                            nueva_fecha_str = fecha_venc_pendiente.strftime('%d-%m-%Y')
-                            mensaje_extra = f"🎉 ¡Se termino el lote antiguo! La fecha de vencimiento se actualizo automaticamente a: {nueva_fecha_str}"
-                
-                elif tipo_movimiento == "Entrada":
-                    nuevo_stock = stock_actual + cantidad
-                    st.session_state.df_productos.at[idx, 'Fecha_Entrada'] = fecha_actual
-                    
-                    fecha_nueva_dt = pd.to_datetime(fecha_vencimiento_nueva).normalize()
-                    
-                    if stock_actual <= 0 or pd.isna(fecha_venc_actual):
-                        st.session_state.df_productos.at[idx, 'Fecha_Vencimiento'] = fecha_nueva_dt
-                        st.session_state.df_productos.at[idx, 'Fecha_Vencimiento_Pendiente'] = pd.NaT
-                        st.session_state.df_productos.at[idx, 'Stock_Viejo_Restante'] = 0
-                        mensaje_extra = "Stock estaba en 0. Fecha de vencimiento actualizada."
-                    else:
-                        if fecha_venc_actual <= fecha_nueva_dt:
-                            st.session_state.df_productos.at[idx, 'Stock_Viejo_Restante'] = stock_actual
-                            st.session_state.df_productos.at[idx, 'Fecha_Vencimiento_Pendiente'] = fecha_nueva_dt
-                            
-                            fecha_fmt = fecha_venc_actual.strftime('%d-%m-%Y')
-                            mensaje_extra = f"⚠️ Se mantiene fecha antigua ({fecha_fmt}). El sistema recordara cambiarla cuando vendas las {stock_actual} unidades viejas."
-                        else:
-                            st.session_state.df_productos.at[idx, 'Fecha_Vencimiento'] = fecha_nueva_dt
-                            mensaje_extra = "⚠️ La nueva entrada vence antes que lo que tenias. Se actualizo la fecha principal."
-                
-                elif tipo_movimiento == "Ajuste":
-                    nuevo_stock = stock_actual + cantidad 
-                    
-                    # --- CORRECCIÓN: LOGICA FEFO PARA AJUSTES ---
-                    # Si hay un lote antiguo activo, el ajuste impacta primero ahi
-                    if stock_viejo_restante > 0:
-                        # Aplicamos el ajuste al contador del lote viejo
-                        # (Si cantidad es +1, suma; si es -1, resta)
-                        stock_viejo_restante += cantidad
-                        
-                        # Guardamos, asegurando que no sea negativo
-                        nuevo_remanente = max(0, stock_viejo_restante)
-                        st.session_state.df_productos.at[idx, 'Stock_Viejo_Restante'] = nuevo_remanente
-                        
-                        # Si el ajuste consumio el lote viejo (o lo dejo en 0)
-                        if nuevo_remanente == 0 and pd.notnull(fecha_venc_pendiente):
-                            st.session_state.df_productos.at[idx, 'Fecha_Vencimiento'] = fecha_venc_pendiente
-                            st.session_state.df_productos.at[idx, 'Fecha_Vencimiento_Pendiente'] = pd.NaT
-                            st.session_state.df_productos.at[idx, 'Stock_Viejo_Restante'] = 0
-                            
-                            nueva_fecha_str = fecha_venc_pendiente.strftime('%d-%m-%Y')
-                            mensaje_extra = f"ℹ️ El ajuste afecto al lote antiguo y este se termino. Fecha actualizada a: {nueva_fecha_str}"
-                    # --- FIN CORRECCIÓN ---
-
-                with st.spinner("Registrando y guardando..."):
-                    st.session_state.df_productos.at[idx, 'Stock_Actual'] = nuevo_stock
-                    
-                    nuevo_movimiento = pd.DataFrame({
-                        "Fecha": [fecha_actual],
-                        "Codigo_Producto": [codigo_producto],
-                        "Tipo": [tipo_movimiento],
-                        "Cantidad": [cantidad],
-                        "Responsable": [responsable],
-                        "Motivo": [motivo]
-                    })
-                    
-                    st.session_state.df_movimientos = pd.concat(
-                        [st.session_state.df_movimientos, nuevo_movimiento], 
-                        ignore_index=True
-                    )
-                    
-                    save_data(st.session_state.df_productos, st.session_state.df_movimientos)
-                    
-                    st.success(f"¡Movimiento '{tipo_movimiento}' de {cantidad} unidad(es) registrado! Stock Nuevo: {nuevo_stock}.")
-                    if mensaje_extra:
-                        st.info(mensaje_extra)
-                        
-                    st.session_state.df_productos = update_statuses(st.session_state.df_productos)
-                    
-                    st.button("✖️ Cerrar Notificacion y Limpiar")
+            fecha_vencimiento_nueva = None
+            if st.session_state.tipo_movimiento == "Entrada":
+                fecha_vencimiento_nueva = st.date_input("Vencimiento del Nuevo Lote:", datetime.now())
 
-    st.divider()
-    st.header("Historial de Movimientos")
+        submitted = st.form_submit_button("Registrar Movimiento")
+
+    if not submitted:
+        return
+    if not responsable:
+        st.warning("El campo 'Responsable' no puede estar vacio.")
+        return
+    if st.session_state.tipo_movimiento == "Ajuste" and not motivo:
+        st.warning("Debe ingresar un motivo para el ajuste.")
+        return
+    if st.session_state.tipo_movimiento == "Ajuste" and cantidad == 0:
+        st.warning("La cantidad del ajuste no puede ser cero.")
+        return
+
+    almacen = obtener_almacen()
+    # Se relee el estado compartido: otra sesion u otro proceso pudo cambiarlo desde que se dibujo el formulario
+    with almacen.escritura():
+        df_productos = almacen.df_productos
+        
+        codigo_producto = almacen.indice_productos.codigo_por_nombre.get(producto_nombre)
+        idx = almacen.indice_productos.fila(codigo_producto)
+        if idx is None:
+            st.error("Error: El producto ya no existe. Por favor, refresca la pagina.")
+            return
+        fecha_actual = pd.to_datetime(datetime.now().date())
+    
+        # --- LOGICA DE MOVIMIENTOS (FEFO por lotes, ver lotes.py) ---
+        try:
+            nuevo_stock, mensaje_extra = aplicar_movimiento(
+                df_productos, idx, almacen.libro_lotes, tipo_movimiento, cantidad,
+                fecha_actual, fecha_vencimiento_nueva
+            )
+        except StockInsuficiente as e:
+            st.error(str(e))
+            return
+
+        nuevo_movimiento = pd.DataFrame({
+            "Fecha": [fecha_actual],
+            "Codigo_Producto": [codigo_producto],
+            "Tipo": [tipo_movimiento],
+            "Cantidad": [cantidad],
+            "Responsable": [responsable],
+            "Motivo": [motivo],
+            "Vencimiento_Lote": [pd.to_datetime(fecha_vencimiento_nueva) if tipo_movimiento == "Entrada" else pd.NaT]
+        })
     
-    df_historial = df_movimientos.copy()
+        # Solo se agrega la linea nueva al historial; el historial no se reescribe
+        confirmacion = almacen.agregar_movimientos(nuevo_movimiento, [idx])
+        df_fila = almacen.actualizar_estados().loc[[idx], COLUMNAS_PRODUCTO_MOVIDO]
+
+    with st.spinner("Registrando y guardando..."):
+        guardado = esperar_escritura(confirmacion)
+
+    if guardado:
+        st.success(f"¡Movimiento '{tipo_movimiento}' de {cantidad} unidad(es) registrado! Stock Nuevo: {nuevo_stock}.")
+        if mensaje_extra:
+            st.info(mensaje_extra)
+        st.dataframe(df_fila, use_container_width=True, hide_index=True,
+                     column_config={"Fecha_Vencimiento": st.column_config.DateColumn("Fecha Vencimiento", format="DD-MM-YYYY")})
     
+        st.button("✖️ Cerrar Notificacion y Limpiar")
+
+def agregar_linea_carrito(producto_nombre, tipo, cantidad, motivo, vencimiento):
+    """
+    Agrega una linea al carrito de la sesion, con las mismas columnas (en texto) que un archivo de
+    importacion: el carrito se valida y se registra como un archivo chico.
+    """
+    st.session_state.carrito.append({
+        "Codigo_Producto": obtener_almacen().catalogo().codigo_por_nombre.get(producto_nombre),
+        "Tipo": tipo,
+        "Cantidad": cantidad,
+        "Motivo": motivo,
+        "Vencimiento_Lote": vencimiento.strftime(FORMATO_FECHA) if tipo == "Entrada" and vencimiento else "",
+    })
+
+def validar_carrito(df_carrito, responsable, df_productos):
+    """
+    Stock de cada producto despues de cada linea y los errores de cada linea (texto vacio si no
+    tiene), contra el stock actual. Es la misma validacion que se repite al registrar.
+    """
+    _, errores = validar_movimientos(df_carrito, df_productos, responsable)
+    # Fila 2 = primera linea (numeracion de archivo, ver validar_movimientos); Fila 0 = todo el carrito
+    errores = errores[errores["Fila"] > 0]
+    por_linea = errores.groupby(errores["Fila"] - 2)["Error"].agg(" ".join)
+    mensajes = pd.Series(range(len(df_carrito))).map(por_linea).fillna("")
+
+    cantidad = pd.to_numeric(df_carrito["Cantidad"], errors='coerce')
+    delta = cantidad * np.where(df_carrito["Tipo"] == "Salida", -1, 1)
+    despues = stock_proyectado(df_productos, df_carrito["Codigo_Producto"], delta)
+    return despues, mensajes
+
+def registrar_carrito():
+    """
+    Callback de "Registrar carrito": vuelve a validar todas las lineas contra el stock compartido
+    mas reciente y las registra juntas (una escritura y un solo refresco de estados), todas con
+    el mismo Id_Transaccion. Corre antes de dibujar el fragmento, asi el carrito ya se ve vacio;
+    el resultado queda en st.session_state.carrito_resultado.
+    """
+    almacen = obtener_almacen()
+    id_transaccion = nuevo_id_transaccion()
+    df_carrito = pd.DataFrame(st.session_state.carrito).assign(Id_Transaccion=id_transaccion)
+    responsable = st.session_state.get('carrito_responsable', "")
+    with almacen.lock:
+        df_nuevos, _, errores, confirmacion = almacen.registrar_movimientos(df_carrito, responsable)
+        if df_nuevos is not None:
+            filas = [almacen.indice_productos.fila(c) for c in df_nuevos["Codigo_Producto"].unique()]
+            df_filas = almacen.df_productos.loc[filas, COLUMNAS_PRODUCTO_MOVIDO]
+    if df_nuevos is None:
+        # Otra sesion cambio el stock desde la ultima validacion: el carrito queda como estaba
+        st.session_state.carrito_resultado = {"errores": errores}
+        return
+    try:
+        confirmacion.result(timeout=TIEMPO_MAX_ESCRITURA)
+    except Exception as e:
+        st.session_state.carrito_resultado = {"error": f"Error: No se pudo guardar en disco: {e}"}
+        return
+    st.session_state.carrito = []
+    st.session_state.carrito_resultado = {
+        "mensaje": f"¡Transaccion {id_transaccion}: {len(df_nuevos)} movimiento(s) de "
+                   f"{df_nuevos['Codigo_Producto'].nunique()} producto(s) registrados!",
+        "productos": df_filas,
+    }
+
+@st.fragment
+@METRICAS.cronometrar("fragmento", fragmento="carrito_movimientos")
+def carrito_movimientos():
+    """
+    Modo carrito: las lineas se acumulan en la sesion y cada una se valida contra el stock
+    proyectado (una Salida cuenta lo que entra o sale antes en el mismo carrito). Al registrar,
+    todas se aplican juntas o ninguna.
+    """
+    almacen = obtener_almacen()
+    if 'carrito' not in st.session_state:
+        st.session_state.carrito = []
+
+    resultado = st.session_state.pop('carrito_resultado', None)
+    if resultado and "mensaje" in resultado:
+        st.success(resultado["mensaje"])
+        st.dataframe(resultado["productos"], use_container_width=True, hide_index=True,
+                     column_config={"Fecha_Vencimiento": st.column_config.DateColumn("Fecha Vencimiento", format="DD-MM-YYYY")})
+    elif resultado and "error" in resultado:
+        st.error(resultado["error"])
+    elif resultado:
+        errores = resultado["errores"]
+        st.error(f"No se registro nada: {len(errores)} error(es) con el stock actual.")
+        st.dataframe(errores.assign(Fila=errores["Fila"] - 1).rename(columns={"Fila": "Linea"}),
+                     use_container_width=True, hide_index=True)
+
+    responsable = st.text_input("Responsable:", placeholder="Ej: Vendedor1", key='carrito_responsable')
+    tipo_movimiento = st.radio("Tipo de la linea:", TIPOS_MOVIMIENTO, horizontal=True, key='carrito_tipo')
+
+    with st.form("carrito_linea_form", clear_on_submit=True):
+        col_c1, col_c2 = st.columns(2)
+        with col_c1:
+            producto_nombre = st.selectbox("Producto:", options=almacen.catalogo().nombres)
+            motivo = ""
+            if tipo_movimiento == "Ajuste":
+                motivo = st.text_input("Motivo del Ajuste:", placeholder="Ej: Merma por rotura")
+        with col_c2:
+            if tipo_movimiento == "Ajuste":
+                cantidad = st.number_input("Cantidad (Positiva o Negativa):", step=1)
+            else:
+                cantidad = st.number_input("Cantidad:", min_value=1, step=1)
+            vencimiento = None
+            if tipo_movimiento == "Entrada":
+                vencimiento = st.date_input("Vencimiento del Nuevo Lote:", datetime.now())
+        if st.form_submit_button("➕ Agregar linea"):
+            agregar_linea_carrito(producto_nombre, tipo_movimiento, cantidad, motivo, vencimiento)
+
+    if not st.session_state.carrito:
+        st.caption("El carrito esta vacio.")
+        return
+
+    df_carrito = pd.DataFrame(st.session_state.carrito)
+    stock_despues, errores = validar_carrito(df_carrito, responsable, almacen.df_productos)
+    with METRICAS.medir("render_tabla", tabla="carrito"):
+        st.dataframe(pd.DataFrame({
+            "Linea": range(1, len(df_carrito) + 1),
+            "Producto": df_carrito["Codigo_Producto"].map(almacen.catalogo().nombre_por_codigo),
+            "Tipo": df_carrito["Tipo"],
+            "Cantidad": df_carrito["Cantidad"],
+            "Vencimiento_Lote": df_carrito["Vencimiento_Lote"],
+            "Motivo": df_carrito["Motivo"],
+            "Stock despues": stock_despues,
+            "Error": errores,
+        }), use_container_width=True, hide_index=True)
+
+    hay_errores = (errores != "").any()
+    if hay_errores:
+        st.warning("Corrige o quita las lineas con error antes de registrar.")
+    col_b1, col_b2, col_b3 = st.columns(3)
+    col_b1.button(f"✅ Registrar carrito ({len(df_carrito)} lineas)", type="primary", disabled=hay_errores,
+                  on_click=registrar_carrito)
+    col_b2.button("↩️ Quitar ultima linea", on_click=lambda: st.session_state.carrito.pop())
+    col_b3.button("🗑️ Vaciar carrito", on_click=lambda: st.session_state.carrito.clear())
+
+@st.fragment
+@METRICAS.cronometrar("fragmento", fragmento="historial_movimientos")
+def historial_movimientos():
+    """
+    Historial paginado. Los movimientos registrados desde el formulario aparecen la proxima vez que
+    se toca un filtro del historial o se vuelve a ejecutar la pagina.
+    """
+    st.header("Historial de Movimientos")
+    almacen = almacen_al_dia()
+    catalogo = almacen.catalogo()
+
+    hoy = datetime.now().date()
+    df_movimientos = almacen.df_movimientos
+    ultima_fecha = df_movimientos["Fecha"].max() if not df_movimientos.empty else pd.NaT
+    desde_defecto = (ultima_fecha if pd.notnull(ultima_fecha) else pd.Timestamp(hoy)) - pd.Timedelta(days=30)
+
+    col_h1, col_h2, col_h3 = st.columns([2, 3, 1])
+    with col_h1:
+        rango = st.date_input("Rango de fechas:", (desde_defecto.date(), hoy), format="DD/MM/YYYY", key='historial_rango')
+    with col_h2:
+        productos_filtro = st.multiselect("Productos:", options=catalogo.nombres_ordenados, placeholder="Todos")
+    with col_h3:
+        tamano_pagina = st.selectbox("Filas por pagina:", options=[50, 100, 500], key='historial_tamano')
+
+    # Mientras se elige el rango, date_input devuelve solo la fecha inicial
+    desde = rango[0] if len(rango) > 0 else None
+    hasta = rango[1] if len(rango) > 1 else None
+    codigos = [catalogo.codigo_por_nombre[nombre] for nombre in productos_filtro] or None
+
     try:
-        df_historial["Nombre Producto"] = df_historial["Codigo_Producto"].map(product_map_id_to_name)
         column_order = ["Fecha", "Nombre Producto", "Tipo", "Cantidad", "Motivo", "Responsable", "Codigo_Producto"]
+        columnas = [c for c in column_order if c != "Nombre Producto"]
+        total = almacen.contar_historial(desde, hasta, codigos)
+        total_paginas = max(1, -(-total // tamano_pagina))
+        # Si el filtro achico el resultado, se vuelve a la ultima pagina que existe
+        if st.session_state.get('historial_pagina', 1) > total_paginas:
+            st.session_state.historial_pagina = total_paginas
+        numero_pagina = st.number_input(f"Pagina (de {total_paginas}):", min_value=1, max_value=total_paginas, step=1, key='historial_pagina')
+        df_historial, total = almacen.pagina_historial(numero_pagina - 1, tamano_pagina, desde, hasta, codigos, columnas)
+
+        # Los nombres se buscan solo para las filas visibles
+        df_historial["Nombre Producto"] = df_historial["Codigo_Producto"].map(catalogo.nombre_por_codigo)
+        primera = (numero_pagina - 1) * tamano_pagina
+        st.caption(f"Mostrando {min(primera + 1, total)}-{primera + len(df_historial)} de {total} movimientos.")
         
-        st.dataframe(
-            df_historial[column_order].sort_values(by="Fecha", ascending=False), 
-            use_container_width=True,
-            column_config={ "Fecha": st.column_config.DateColumn("Fecha", format="DD-MM-YYYY") }
-        )
+        with METRICAS.medir("render_tabla", tabla="historial"):
+            st.dataframe(
+                df_historial[column_order], 
+                use_container_width=True,
+                hide_index=True,
+                column_config={ "Fecha": st.column_config.DateColumn("Fecha", format="DD-MM-YYYY") }
+            )
+        METRICAS.contar("filas_mostradas", len(df_historial), tabla="historial")
     except KeyError as e:
         st.warning("No se pudo cargar el historial de movimientos.")
 
-def anadir_nuevo_producto(df_productos):
+@st.fragment
+def transferir_producto():
+    """
+    Envio de stock a otra ubicacion (ver ubicaciones.py): sale de los lotes que vencen primero y el
+    destino lo recibe con esos mismos vencimientos la proxima vez que refresca.
+    Solo se muestra si hay otras ubicaciones.
+    """
+    almacen = obtener_almacen()
+    if almacen.ubicacion is None or not almacen.ubicacion.otras():
+        return
+    with st.expander(f"🚚 Transferir a otra ubicacion (desde {almacen.ubicacion.nombre})"):
+        with st.form("transferencia_form"):
+            col_t1, col_t2 = st.columns(2)
+            with col_t1:
+                producto_nombre = st.selectbox("Producto:", options=almacen.catalogo().nombres, key='transferencia_producto')
+                responsable = st.text_input("Responsable:", placeholder="Ej: Bodega", key='transferencia_responsable')
+            with col_t2:
+                destino = st.selectbox("Ubicacion destino:", options=almacen.ubicacion.otras(), key='transferencia_destino')
+                cantidad = st.number_input("Cantidad:", min_value=1, step=1, key='transferencia_cantidad')
+            submitted = st.form_submit_button("Transferir")
+
+    if not submitted:
+        return
+    codigo = almacen.indice_productos.codigo_por_nombre.get(producto_nombre)
+    try:
+        df_nuevos, confirmacion = almacen.transferir(codigo, cantidad, destino, responsable)
+    except StockInsuficiente as e:
+        st.error(str(e))
+        return
+    except ValueError as e:
+        st.warning(str(e))
+        return
+
+    with st.spinner("Registrando y guardando..."):
+        guardado = esperar_escritura(confirmacion)
+    if guardado:
+        st.success(f"¡Transferencia de {cantidad} unidad(es) de '{producto_nombre}' a {destino} registrada! "
+                   f"Salio de {len(df_nuevos)} lote(s).")
+
+@st.fragment
+@METRICAS.cronometrar("pagina", pagina="importar_movimientos")
+def importar_movimientos():
+    """
+    Importacion masiva desde CSV o XLSX (ver importacion.py): se valida todo el archivo y,
+    si no hay errores, se aplica y se guarda en una sola escritura.
+    """
+    with st.expander("📥 Importar movimientos desde archivo (CSV o XLSX)"):
+        st.caption("Columnas: Codigo_Producto; Tipo; Cantidad; Responsable; Motivo (obligatorio en Ajustes); "
+                   "Vencimiento_Lote (Entradas, DD-MM-YYYY); Fecha e Id_Transaccion (opcionales).")
+        archivo = st.file_uploader("Archivo de movimientos:", type=["csv", "xlsx"], key='archivo_movimientos')
+        responsable_defecto = st.text_input("Responsable (para filas sin responsable):", placeholder="Ej: Proveedor1")
+        importar = st.button("Validar e Importar", disabled=archivo is None)
+
+    if not importar or archivo is None:
+        return
+
+    try:
+        df_archivo = leer_archivo_movimientos(archivo.getvalue(), archivo.name)
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        st.error(f"Error: No se pudo leer el archivo: {e}")
+        return
+
+    if df_archivo.empty:
+        st.warning("El archivo no tiene movimientos.")
+        return
+
+    almacen = obtener_almacen()
+    # Se valida contra el stock compartido mas reciente
+    df_nuevos, filas, errores, confirmacion = almacen.registrar_movimientos(df_archivo, responsable_defecto)
+    if not errores.empty:
+        st.error(f"No se importo nada: {len(errores)} error(es) en el archivo.")
+        st.dataframe(errores, use_container_width=True, hide_index=True)
+        return
+
+    with st.spinner(f"Importando {len(df_nuevos)} movimientos..."):
+        if not esperar_escritura(confirmacion):
+            return
+    st.success(f"¡Se importaron {len(df_nuevos)} movimientos de {df_nuevos['Codigo_Producto'].nunique()} producto(s)!")
+
+@METRICAS.cronometrar("pagina", pagina="anadir_nuevo_producto")
+def anadir_nuevo_producto():
     st.header("Anadir Nuevo Producto al Inventario")
+    mostrar_aviso()
     
     col1, col_form, col3 = st.columns([1, 2, 1])
 
@@ -359,10 +543,7 @@ def anadir_nuevo_producto(df_productos):
         st.subheader("Detalles del Nuevo Producto")
         sin_vencimiento = st.checkbox("Este producto no tiene vencimiento")
 
-        if df_productos.empty or "Categoria" not in df_productos.columns:
-            categorias_existentes = []
-        else:
-            categorias_existentes = sorted(list(df_productos["Categoria"].dropna().unique()))
+        categorias_existentes = obtener_almacen().catalogo().categorias
         
         opcion_nueva = "+ Anadir Nueva Categoria"
         opciones_categoria = categorias_existentes + [opcion_nueva]
@@ -415,9 +596,8 @@ def anadir_nuevo_producto(df_productos):
             col_form.warning("El campo 'Nombre del Producto' no puede estar vacio.")
             return
         
-        # Creamos listas en minusculas para comparar
-        nombres_existentes = df_productos["Nombre"].astype(str).str.strip().str.lower().values
-        if nombre.strip().lower() in nombres_existentes:
+        # Indice de nombres normalizados (sin mayusculas ni espacios en los extremos)
+        if obtener_almacen().indice_productos.existe_nombre(nombre):
             col_form.warning(f"Error: Ya existe un producto con el nombre '{nombre}'.")
             return
         # --- FIN CORRECCION ---
@@ -438,53 +618,42 @@ def anadir_nuevo_producto(df_productos):
                 col_form.warning(f"Error: La categoria '{categoria_final}' ya existe. Por favor, seleccionala de la lista.")
                 return 
             
+        almacen = obtener_almacen()
         with col_form:
-            with st.spinner("Anadiendo producto..."):
-                
-                if df_productos.empty:
-                    nuevo_codigo = 1
-                else:
-                    nuevo_codigo = df_productos['Codigo'].max() + 1
-                
-                fecha_venc_final = pd.NaT if sin_vencimiento else pd.to_datetime(fecha_vencimiento)
-                fecha_entrada = pd.to_datetime(datetime.now().date())
-                
-                nuevo_producto = pd.DataFrame({
-                    "Codigo": [nuevo_codigo],
-                    "Nombre": [nombre],
-                    "Categoria": [categoria_final],
-                    "Descripcion": [descripcion], 
-                    "Stock_Inicial": [stock_inicial],
-                    "Stock_Actual": [stock_inicial],
-                    "Stock_Minimo": [stock_minimo],
-                    "Fecha_Entrada": [fecha_entrada],
-                    "Fecha_Vencimiento": [fecha_venc_final],
-                    "Costo": [costo],
-                    "Precio_Venta": [precio_venta]
-                })
-                
-                # --- CORRECCION CRITICA: Eliminado .fillna(0) ---
-                # Esto evita que las fechas vacias se conviertan en el numero 0 y causen el error
-                st.session_state.df_productos = pd.concat(
-                    [st.session_state.df_productos, nuevo_producto],
-                    ignore_index=True
+            fecha_venc_final = pd.NaT if sin_vencimiento else pd.to_datetime(fecha_vencimiento)
+            try:
+                nuevo_codigo, confirmacion = almacen.crear_producto(
+                    nombre, categoria_final, descripcion, stock_inicial, stock_minimo, costo, precio_venta, fecha_venc_final
                 )
-                # --- FIN CORRECCION ---
-                
-                save_data(st.session_state.df_productos, st.session_state.df_movimientos)
-                
-                st.success(f"¡Producto '{nombre}' (Codigo: {nuevo_codigo}) anadido con exito!")
-                time.sleep(2)
-                st.rerun()
+            except ValueError as e:
+                # Otra sesion pudo crear el mismo nombre mientras se completaba el formulario
+                st.warning(str(e))
+                return
 
-def gestionar_productos(df_productos):
+            with st.spinner("Anadiendo producto..."):
+                if not esperar_escritura(confirmacion):
+                    return
+            # Se vuelve a dibujar la pagina para dejar el formulario vacio; el aviso se muestra arriba
+            guardar_aviso(f"¡Producto '{nombre}' (Codigo: {nuevo_codigo}) anadido con exito!")
+            st.rerun()
+
+@st.fragment
+@METRICAS.cronometrar("pagina", pagina="gestionar_productos")
+def gestionar_productos():
+    """
+    Toda la pagina es un fragmento: elegir un producto o una categoria no vuelve a ejecutar la app.
+    """
     st.header("Gestionar Productos Existentes")
+    mostrar_aviso()
 
+    almacen = almacen_al_dia()
+    df_productos = almacen.df_productos
     if df_productos.empty:
         st.warning("No hay productos en el inventario para gestionar.")
         return
+    catalogo = almacen.catalogo()
 
-    lista_nombres = [""] + list(df_productos["Nombre"])
+    lista_nombres = [""] + catalogo.nombres
     
     if 'producto_seleccionado' not in st.session_state:
         st.session_state.producto_seleccionado = ""
@@ -502,18 +671,17 @@ def gestionar_productos(df_productos):
     nombre_producto = st.session_state.producto_seleccionado
     
     if nombre_producto:
-        try:
-            idx = df_productos.index[df_productos['Nombre'] == nombre_producto].tolist()[0]
-            producto_data = df_productos.loc[idx]
-        except IndexError:
+        idx = almacen.indice_productos.fila_por_nombre(nombre_producto)
+        if idx is None:
             st.error("Error: No se pudo encontrar el producto. Por favor, refresca la pagina.")
             st.session_state.producto_seleccionado = ""
             st.rerun()
             return
+        producto_data = df_productos.loc[idx]
 
         st.subheader(f"Editando: {nombre_producto}")
         
-        categorias_existentes = sorted(list(df_productos["Categoria"].dropna().unique()))
+        categorias_existentes = catalogo.categorias
         opcion_nueva = "+ Anadir Nueva Categoria"
         opciones_categoria = categorias_existentes + [opcion_nueva]
         
@@ -582,17 +750,26 @@ def gestionar_productos(df_productos):
                     st.warning(f"Error: La categoria '{categoria_final}' ya existe. Por favor, seleccionala de la lista.")
                     return 
                 
-            with st.spinner("Guardando cambios..."):
-                st.session_state.df_productos.at[idx, "Descripcion"] = descripcion
-                st.session_state.df_productos.at[idx, "Categoria"] = categoria_final
-                st.session_state.df_productos.at[idx, "Stock_Minimo"] = stock_minimo
-                st.session_state.df_productos.at[idx, "Costo"] = costo
-                st.session_state.df_productos.at[idx, "Precio_Venta"] = precio_venta
+            almacen = obtener_almacen()
+            with almacen.escritura():
+                # El indice se vuelve a buscar: otra sesion pudo eliminar productos entretanto
+                df_productos = almacen.df_productos
+                idx = almacen.indice_productos.fila_por_nombre(nombre_producto)
+                if idx is None:
+                    st.error("Error: El producto ya no existe. Por favor, refresca la pagina.")
+                    return
                 
-                save_data(st.session_state.df_productos, st.session_state.df_movimientos)
-                st.success(f"¡Producto '{nombre_producto}' actualizado con exito!")
-                time.sleep(1)
-                st.rerun()
+                df_productos.at[idx, "Descripcion"] = descripcion
+                asignar_categoria(df_productos, idx, "Categoria", categoria_final)
+                df_productos.at[idx, "Stock_Minimo"] = stock_minimo
+                df_productos.at[idx, "Costo"] = costo
+                df_productos.at[idx, "Precio_Venta"] = precio_venta
+                
+                confirmacion = almacen.guardar_producto(idx)
+            with st.spinner("Guardando cambios..."):
+                if not esperar_escritura(confirmacion):
+                    return
+            st.success(f"¡Producto '{nombre_producto}' actualizado con exito!")
 
         st.divider()
         st.subheader("Zona de Peligro: Eliminar Producto")
@@ -601,15 +778,191 @@ def gestionar_productos(df_productos):
         confirm_delete = st.checkbox("Si, estoy seguro de que quiero eliminar este producto.")
         
         if st.button("Eliminar Producto Permanentemente", disabled=not confirm_delete, type="primary"):
+            almacen = obtener_almacen()
+            with almacen.escritura():
+                idx = almacen.indice_productos.fila_por_nombre(nombre_producto)
+                if idx is None:
+                    st.error("Error: El producto ya no existe. Por favor, refresca la pagina.")
+                    return
+                confirmacion = almacen.eliminar_producto(idx)
             with st.spinner("Eliminando producto..."):
-                st.session_state.df_productos = st.session_state.df_productos.drop(index=idx).reset_index(drop=True)
-                
-                save_data(st.session_state.df_productos, st.session_state.df_movimientos)
-                st.success(f"¡Producto '{nombre_producto}' eliminado con exito!")
-                
-                st.session_state.producto_seleccionado = ""
-                time.sleep(2)
-                st.rerun()
+                if not esperar_escritura(confirmacion):
+                    return
+            # Rerun completo: el producto sale de las listas y del resumen de alertas
+            guardar_aviso(f"¡Producto '{nombre_producto}' eliminado con exito!")
+            st.session_state.producto_seleccionado = ""
+            st.rerun()
+
+@METRICAS.cronometrar("pagina", pagina="mostrar_analitica")
+def mostrar_analitica(df_productos):
+    """
+    Rotacion y consumo por producto y categoria, desde los totales diarios (ver resumen_diario.py).
+    """
+    st.header("Analitica de Consumo")
+
+    hoy = datetime.now().date()
+    col1, col2 = st.columns(2)
+    with col1:
+        rango = st.date_input("Periodo:", value=(hoy - pd.Timedelta(days=90), hoy), key="analitica_rango")
+    with col2:
+        categorias = almacen.catalogo().categorias
+        seleccion = st.multiselect("Categorias:", categorias, key="analitica_categorias")
+
+    if not isinstance(rango, (list, tuple)) or len(rango) != 2:
+        st.info("Selecciona la fecha de inicio y la de fin del periodo.")
+        return
+    desde, hasta = rango
+    dias = (hasta - desde).days + 1
+
+    df_dia, df_responsables = almacen.consumo_diario(desde, hasta)
+    productos = df_productos.set_index("Codigo")[["Nombre", "Categoria"]]
+    df_dia["Categoria"] = df_dia["Codigo_Producto"].map(productos["Categoria"])
+    if seleccion:
+        df_dia = df_dia[df_dia["Categoria"].isin(seleccion)]
+
+    if df_dia.empty:
+        st.info("No hay movimientos en el periodo seleccionado.")
+        return
+
+    salidas, mermas = df_dia["Salidas"].sum(), df_dia["Mermas"].sum()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Unidades salidas", f"{salidas:,.0f}")
+    col2.metric("Salidas por dia", f"{salidas / dias:,.1f}")
+    col3.metric("Tasa de merma", f"{mermas / (salidas + mermas):.1%}" if salidas + mermas else "-")
+
+    st.subheader("Unidades salidas por dia")
+    df_grafico = df_dia.pivot_table(index="Fecha", columns="Categoria", values="Salidas", aggfunc="sum")
+    df_grafico = df_grafico.reindex(pd.date_range(desde, hasta), fill_value=0).fillna(0)
+    st.line_chart(df_grafico)
+
+    def tabla_consumo(df, clave):
+        df = df.groupby(clave)[["Salidas", "Entradas", "Mermas", "Ajustes", "Movimientos"]].sum()
+        df["Salidas por dia"] = df["Salidas"] / dias
+        total = df["Salidas"] + df["Mermas"]
+        df["Tasa de merma"] = (df["Mermas"] / total.where(total > 0)).fillna(0)
+        return df.sort_values("Salidas", ascending=False)
+
+    formato = {
+        "Salidas por dia": st.column_config.NumberColumn(format="%.2f"),
+        "Tasa de merma": st.column_config.NumberColumn(format="percent"),
+    }
+
+    st.subheader("Consumo por categoria")
+    st.dataframe(tabla_consumo(df_dia, "Categoria"), use_container_width=True, column_config=formato)
+
+    st.subheader("Consumo por producto")
+    df_por_producto = tabla_consumo(df_dia, "Codigo_Producto")
+    df_por_producto.insert(0, "Nombre", df_por_producto.index.map(productos["Nombre"]))
+    df_por_producto.insert(1, "Categoria", df_por_producto.index.map(productos["Categoria"]))
+    st.dataframe(df_por_producto, use_container_width=True, column_config=formato)
+
+    st.subheader("Responsables con mas movimientos")
+    # Los totales por responsable no distinguen producto: el filtro de categorias no se les aplica
+    df_top = (df_responsables.groupby("Responsable")[["Movimientos", "Unidades", "Salidas"]].sum()
+              .sort_values("Movimientos", ascending=False).head(10))
+    st.bar_chart(df_top["Movimientos"])
+    st.dataframe(df_top, use_container_width=True)
+
+@METRICAS.cronometrar("pagina", pagina="mostrar_reposicion")
+def mostrar_reposicion():
+    """
+    Sugerencias de reposicion de todo el catalogo, calculadas en bloque (ver reposicion.py).
+    """
+    st.header("Reposicion de Stock")
+    st.caption("La demanda se estima con las Salidas de la ventana; el stock que vencera antes de venderse no cuenta como stock util.")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        ventana = st.number_input("Ventana de demanda (dias):", min_value=7, max_value=730, value=VENTANA_DEMANDA, step=1, key="reposicion_ventana")
+    with col2:
+        plazo = st.number_input("Plazo de reposicion (dias):", min_value=0, max_value=180, value=PLAZO_REPOSICION, step=1, key="reposicion_plazo")
+    with col3:
+        cobertura = st.number_input("Cobertura objetivo (dias):", min_value=1, max_value=365, value=DIAS_COBERTURA_OBJETIVO, step=1, key="reposicion_cobertura")
+
+    df = almacen.reposicion(int(ventana), int(plazo), int(cobertura))
+    if df.empty:
+        st.warning("No hay productos en el inventario.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Productos para reponer", int(df["Reponer"].sum()))
+    col2.metric("Con stock que vencera sin venderse", int(df["Vence_Antes_De_Vender"].sum()))
+    col3.metric("Unidades en riesgo de vencer", f"{df['Unidades_En_Riesgo'].sum():,.0f}")
+
+    filtro = st.radio("Mostrar:", ["Para reponer", "Vencen antes de venderse", "Todos"], horizontal=True, key="reposicion_filtro")
+    if filtro == "Para reponer":
+        df = df[df["Reponer"]]
+    elif filtro == "Vencen antes de venderse":
+        df = df[df["Vence_Antes_De_Vender"]]
+    df = df.sort_values(["Dias_Cobertura", "Demanda_Diaria"], ascending=[True, False])
+
+    columnas = ["Codigo", "Nombre", "Categoria", "Stock_Actual", "Stock_Minimo", "Demanda_Diaria", "Dias_Cobertura",
+                "Fecha_Quiebre", "Unidades_En_Riesgo", "Punto_Reorden", "Cantidad_Sugerida"]
+    st.dataframe(
+        df[columnas], use_container_width=True, hide_index=True,
+        column_config={
+            "Demanda_Diaria": st.column_config.NumberColumn("Demanda diaria", format="%.2f"),
+            "Dias_Cobertura": st.column_config.NumberColumn("Dias de cobertura", format="%.1f"),
+            "Fecha_Quiebre": st.column_config.DateColumn("Quiebre estimado", format="DD-MM-YYYY"),
+            "Unidades_En_Riesgo": st.column_config.NumberColumn("Vencen sin venderse", format="%.0f"),
+            "Punto_Reorden": st.column_config.NumberColumn("Punto de reorden", format="%.0f"),
+            "Cantidad_Sugerida": st.column_config.NumberColumn("Cantidad sugerida"),
+        })
+
+@METRICAS.cronometrar("pagina", pagina="mostrar_consolidado")
+def mostrar_consolidado():
+    """
+    Stock de todas las ubicaciones juntas, mas lo que esta en transito entre ellas (ver ubicaciones.py).
+    """
+    st.header("Stock por Ubicacion")
+    st.caption("Cada ubicacion se lee desde sus archivos; lo que otra ubicacion todavia no guardo no aparece.")
+    df = consolidado(obtener_almacen().ubicacion.raiz)
+    if df.empty:
+        st.warning("No hay ubicaciones.")
+        return
+    columnas_stock = [c for c in df.columns if c not in ("Codigo", "Nombre", "Categoria")]
+
+    columnas = st.columns(len(columnas_stock))
+    for columna, nombre in zip(columnas, columnas_stock):
+        columna.metric(nombre.replace("_", " "), f"{df[nombre].sum():,.0f}")
+
+    col_f1, col_f2 = st.columns([1, 2])
+    with col_f1:
+        categorias = ["Todas"] + sorted(df["Categoria"].dropna().unique())
+        cat_filter = st.selectbox("Filtrar por Categoria:", options=categorias, key='consolidado_categoria')
+    with col_f2:
+        search_term = st.text_input("Buscar por nombre:", placeholder="Ej: Leche Entera", key='consolidado_buscar')
+    if cat_filter != "Todas":
+        df = df[df["Categoria"] == cat_filter]
+    if search_term:
+        df = df[df["Nombre"].str.contains(search_term, case=False, regex=False)]
+
+    with METRICAS.medir("render_tabla", tabla="consolidado"):
+        st.dataframe(df, use_container_width=True, hide_index=True,
+                     column_config={"En_Transito": st.column_config.NumberColumn("En transito")})
+    METRICAS.contar("filas_mostradas", len(df), tabla="consolidado")
+
+def mostrar_panel_rendimiento():
+    """
+    Tiempos y contadores acumulados del proceso (todas las sesiones). Solo para Admin.
+    """
+    st.divider()
+    st.subheader("🛠️ Panel de Rendimiento")
+    df_duraciones, df_contadores = METRICAS.resumen()
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.write("Duracion de las operaciones")
+        st.dataframe(df_duraciones, use_container_width=True, hide_index=True,
+                     column_config={
+                         "Total (s)": st.column_config.NumberColumn(format="%.3f"),
+                         "Promedio (ms)": st.column_config.NumberColumn(format="%.1f"),
+                         "Ultima (ms)": st.column_config.NumberColumn(format="%.1f"),
+                         "Maximo (ms)": st.column_config.NumberColumn(format="%.1f"),
+                     })
+    with col2:
+        st.write("Contadores")
+        st.dataframe(df_contadores, use_container_width=True, hide_index=True)
+    st.caption(f"Las metricas tambien se escriben en formato Prometheus en '{ARCHIVO_METRICAS}'.")
 
 def mostrar_login(df_usuarios):
     col1, col_form, col3 = st.columns([1, 2, 1])
@@ -645,12 +998,12 @@ def mostrar_login(df_usuarios):
 
 # --- 4. CODIGO PRINCIPAL (MODIFICADO CON LOGICA DE LOGIN Y ROLES) ---
 
+# Los datos viven en un almacen compartido por todas las sesiones; cada sesion solo guarda su login
+almacen = obtener_almacen()
+datos_disponibles = almacen.refrescar()
+
 if 'data_loaded' not in st.session_state:
-    df_productos, df_movimientos, df_usuarios = load_data()
-    if df_productos is not None:
-        st.session_state.df_productos = df_productos
-        st.session_state.df_movimientos = df_movimientos
-        st.session_state.df_usuarios = df_usuarios 
+    if datos_disponibles:
         st.session_state.data_loaded = True
         st.session_state.logged_in = False 
         st.session_state.rol = None 
@@ -660,22 +1013,30 @@ if 'data_loaded' in st.session_state:
     
     if st.session_state.logged_in:
         
-        st.session_state.df_productos = update_statuses(st.session_state.df_productos)
-
-        product_map_name_to_id = dict(zip(st.session_state.df_productos['Nombre'], st.session_state.df_productos['Codigo']))
-        product_map_id_to_name = dict(zip(st.session_state.df_productos['Codigo'], st.session_state.df_productos['Nombre']))
+        # Los mapas y listas del catalogo salen de almacen.catalogo(), que se arma una vez por cambio
+        df_productos = almacen.actualizar_estados()
 
         st.title("Gestor de Inventario")
 
         with st.sidebar:
             st.header("Navegacion")
             
+            if almacen.ubicacion is not None:
+                st.caption(f"Ubicacion: {almacen.ubicacion.nombre}")
             st.caption(f"Usuario: {st.session_state.email}")
             st.caption(f"Rol: {st.session_state.rol}")
             st.divider()
 
+            dias_alerta = st.session_state.get('alertas_dias', DIAS_PROXIMO_VENCIMIENTO)
+            resumen = almacen.resumen_alertas(dias_alerta)
+            st.caption(f"🔴 Stock critico: {resumen['criticos']} · 🟡 Advertencia: {resumen['advertencia']}")
+            st.caption(f"🔴 Vencidos: {resumen['vencidos']} · 🟡 Vencen en {dias_alerta} dias: {resumen['por_vencer']}")
+            st.divider()
+
             menu_base = ["Inventario Actual", "Registrar Movimiento"]
-            menu_admin = ["Anadir Nuevo Producto", "Gestionar Productos"]
+            menu_admin = ["Anadir Nuevo Producto", "Gestionar Productos", "Analitica de Consumo", "Reposicion"]
+            if almacen.ubicacion is not None:
+                menu_admin.append("Stock por Ubicacion")
             
             if st.session_state.rol == "Admin":
                 menu_options = menu_base + menu_admin
@@ -700,6 +1061,9 @@ if 'data_loaded' in st.session_state:
             
             st.divider()
             
+            if st.session_state.rol == "Admin":
+                st.checkbox("🛠️ Panel de rendimiento", key="panel_rendimiento")
+            
             if st.button("Cerrar Sesion"):
                 st.session_state.logged_in = False
                 st.session_state.rol = None
@@ -707,21 +1071,34 @@ if 'data_loaded' in st.session_state:
                 st.rerun()
 
         if st.session_state.page == "Inventario Actual":
-            mostrar_inventario(st.session_state.df_productos)
+            mostrar_inventario()
             
         elif st.session_state.page == "Registrar Movimiento":
-            registrar_movimiento(
-                st.session_state.df_productos, 
-                st.session_state.df_movimientos,
-                product_map_name_to_id, 
-                product_map_id_to_name
-            )
+            registrar_movimiento()
             
         elif st.session_state.page == "Anadir Nuevo Producto":
-            anadir_nuevo_producto(st.session_state.df_productos)
+            anadir_nuevo_producto()
         
         elif st.session_state.page == "Gestionar Productos":
-            gestionar_productos(st.session_state.df_productos)
+            gestionar_productos()
+
+        elif st.session_state.page == "Analitica de Consumo":
+            mostrar_analitica(df_productos)
+
+        elif st.session_state.page == "Reposicion":
+            mostrar_reposicion()
+
+        elif st.session_state.page == "Stock por Ubicacion":
+            mostrar_consolidado()
+        
+        if st.session_state.rol == "Admin" and st.session_state.get("panel_rendimiento"):
+            mostrar_panel_rendimiento()
     
     else:
-        mostrar_login(st.session_state.df_usuarios)
\ No newline at end of file
+        mostrar_login(almacen.df_usuarios)
+
+# Las metricas se escriben cada tanto (ver metricas.py); si no se puede escribir el archivo, la app sigue igual
+try:
+    METRICAS.exportar()
+except OSError:
+    pass
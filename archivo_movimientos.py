@@ -0,0 +1,135 @@
+"""
+Archivo columnar (Parquet) del historial de movimientos, particionado por mes.
+
+    historial_movimientos/mes=2025-11/parte-000000000000-000000000008.parquet
+
+Cada parte guarda un tramo de filas del historial (posicion desde-hasta en Movimientos.csv o en
+el orden de ids de SQLite), asi se sabe hasta donde llega el archivo sin otro archivo de estado.
+Las consultas por fecha y producto se filtran con pyarrow: solo se abren las particiones de los
+meses pedidos, dentro de cada parte se saltean los grupos de filas que no coinciden y solo se
+leen las columnas pedidas.
+
+Movimientos.csv (o la tabla de SQLite) sigue siendo el registro principal; el archivo es una copia
+para consultar que se pone al dia sola (ver AlmacenDatos.historial en almacen_datos.py).
+"""
+import os
+import re
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DIRECTORIO_ARCHIVO = "historial_movimientos"
+
+# Filas nuevas que se juntan antes de escribir una parte (ademas se archiva al cambiar el dia)
+MINIMO_FILAS_PARTE = 5000
+
+_PATRON_PARTE = re.compile(r"parte-(\d+)-(\d+)\.parquet$")
+
+def _normalizar(df):
+    """
+    Tipos fijos para que todas las partes tengan el mismo esquema (fechas en ms, enteros con nulos).
+    """
+    df = df.reset_index(drop=True).copy()
+    for columna in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[columna]) or columna in ("Fecha", "Vencimiento_Lote"):
+            df[columna] = pd.to_datetime(df[columna], errors='coerce').astype("datetime64[ms]")
+        elif columna in ("Codigo_Producto", "Cantidad"):
+            df[columna] = pd.to_numeric(df[columna], errors='coerce').astype("Int64")
+        elif not pd.api.types.is_numeric_dtype(df[columna]):
+            df[columna] = df[columna].fillna("").astype(str)
+    return df
+
+class ArchivoMovimientos:
+    """
+    Partes Parquet en directorio; filas es hasta que posicion del historial esta archivado.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_ARCHIVO):
+        self.directorio = directorio
+        self.filas = self._filas_archivadas()
+        self._esquema = None
+
+    def _partes(self):
+        if not os.path.isdir(self.directorio):
+            return []
+        partes = []
+        for raiz, _, archivos in os.walk(self.directorio):
+            for nombre in archivos:
+                if _PATRON_PARTE.match(nombre):
+                    partes.append(os.path.join(raiz, nombre))
+        return partes
+
+    def _filas_archivadas(self):
+        """
+        Cantidad de filas del historial ya archivadas: el mayor 'hasta' de las partes.
+        """
+        return max((int(_PATRON_PARTE.search(parte).group(2)) for parte in self._partes()), default=0)
+
+    def vaciar(self):
+        shutil.rmtree(self.directorio, ignore_errors=True)
+        self.filas = 0
+        self._esquema = None
+
+    def sincronizar(self, df_movimientos, minimo=MINIMO_FILAS_PARTE):
+        """
+        Archiva las filas de df_movimientos que todavia no estan, una parte por mes.
+        Si el historial tiene menos filas que el archivo (fue reescrito), el archivo se rehace.
+        Devuelve la cantidad de filas agregadas.
+        """
+        if len(df_movimientos) < self.filas:
+            self.vaciar()
+        desde, hasta = self.filas, len(df_movimientos)
+        if hasta - desde < max(minimo, 1):
+            return 0
+
+        df_nuevos = df_movimientos.iloc[desde:hasta]
+        meses = df_nuevos["Fecha"].dt.to_period("M")
+        for mes, df_mes in df_nuevos.groupby(meses, sort=True, dropna=False):
+            nombre_mes = "sin-fecha" if pd.isna(mes) else mes.strftime("%Y-%m")
+            carpeta = os.path.join(self.directorio, f"mes={nombre_mes}")
+            os.makedirs(carpeta, exist_ok=True)
+            tabla = pa.Table.from_pandas(_normalizar(df_mes), preserve_index=False)
+            # Se escribe con otro nombre y se renombra: una parte a medio escribir nunca se lee
+            destino = os.path.join(carpeta, f"parte-{desde:012d}-{hasta:012d}.parquet")
+            temporal = f"{destino}.{os.getpid()}.tmp"
+            pq.write_table(tabla, temporal)
+            os.replace(temporal, destino)
+        self.filas = hasta
+        self._esquema = None
+        return hasta - desde
+
+    def leer(self, desde=None, hasta=None, codigos=None, columnas=None):
+        """
+        Movimientos archivados con Fecha entre desde y hasta (inclusive) y, si se indica, de esos codigos.
+        Los filtros se resuelven en pyarrow (particiones por mes y estadisticas de cada parte).
+        """
+        partes = self._partes()
+        if not partes:
+            return None
+        if self._esquema is None or self._esquema[0] != len(partes):
+            # Las partes viejas pueden no tener columnas agregadas despues (ej. Vencimiento_Lote)
+            esquema = pa.unify_schemas([pq.read_schema(parte) for parte in partes])
+            self._esquema = (len(partes), esquema.append(pa.field("mes", pa.string())))
+        dataset = ds.dataset(partes, schema=self._esquema[1], format="parquet",
+                             partitioning=ds.partitioning(pa.schema([pa.field("mes", pa.string())]), flavor="hive"),
+                             partition_base_dir=self.directorio)
+        filtro = None
+        condiciones = []
+        if desde is not None:
+            desde = pd.Timestamp(desde).normalize()
+            condiciones += [ds.field("mes") >= desde.strftime("%Y-%m"), ds.field("Fecha") >= desde]
+        if hasta is not None:
+            hasta = pd.Timestamp(hasta).normalize()
+            condiciones += [ds.field("mes") <= hasta.strftime("%Y-%m"), ds.field("Fecha") <= hasta]
+        if codigos is not None:
+            condiciones.append(ds.field("Codigo_Producto").isin(list(codigos)))
+        for condicion in condiciones:
+            filtro = condicion if filtro is None else filtro & condicion
+
+        if columnas is not None:
+            columnas = [c for c in columnas if c in dataset.schema.names]
+        df = dataset.to_table(columns=columnas, filter=filtro).to_pandas()
+        return df.drop(columns="mes", errors="ignore")
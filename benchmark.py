@@ -0,0 +1,299 @@
+"""
+Benchmarks de las rutas que mas pesan con inventarios grandes: carga de los CSV (load_data, parseando
+el texto y desde las instantaneas Feather), guardado (el escritor: movimiento al final de
+Movimientos.csv y reescritura de Productos.csv y Lotes.csv), estados (update_statuses), las ramas FEFO de registrar_movimiento, el historial paginado y la
+analitica (totales diarios y reposicion).
+
+Trabaja sobre una copia temporal del inventario (el original no se toca). Por cada caso informa el
+mejor tiempo de varias repeticiones, cuantas unidades (filas o movimientos) por segundo procesa y el
+pico de memoria (tracemalloc, medido en una pasada aparte para no inflar los tiempos).
+
+    # Genera un inventario sintetico (ver datos_sinteticos.py) y lo mide
+    python benchmark.py --productos 100000 --movimientos 5000000
+
+    # Mide un inventario ya generado, guarda los resultados y los compara con una corrida anterior
+    python benchmark.py --datos datos_prueba --json actual.json --comparar base.json
+
+Con --comparar el comando termina con codigo 1 si algun caso es mas lento que la base por encima
+de la tolerancia, para poder usarlo antes de publicar una version.
+"""
+import argparse
+import gc
+import json
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from datos_sinteticos import almacenamiento_en, generar
+from estados import actualizar_estados
+from historial import IndiceHistorial
+from lotes import LibroLotes, aplicar_movimiento
+from reposicion import VENTANA_DEMANDA, calcular_reposicion
+from resumen_diario import ResumenDiario
+
+# Movimientos aplicados por cada caso FEFO
+MOVIMIENTOS_FEFO = 10_000
+
+# Filas por pagina del historial (la opcion mas grande de la pagina)
+TAMANO_PAGINA = 500
+
+class Contexto:
+    """
+    Datos compartidos entre casos: el inventario cargado una vez y el directorio de trabajo.
+    """
+
+    def __init__(self, directorio, semilla=0):
+        self.directorio = directorio
+        self.rng = np.random.default_rng(semilla)
+        almacenamiento = almacenamiento_en(directorio)
+        self.df_productos = almacenamiento.leer_productos()
+        self.df_movimientos = almacenamiento.leer_movimientos()
+        self.df_lotes = almacenamiento.leer_lotes()
+        self.indice_historial = None
+        self.resumen_diario = None
+
+    def libro(self):
+        return LibroLotes.desde_dataframe(self.df_lotes)
+
+# --- CASOS ---
+# Cada caso recibe el contexto y devuelve (unidades procesadas, nombre de la unidad).
+
+def caso_leer_productos(ctx):
+    df = almacenamiento_en(ctx.directorio, instantaneas=False).leer_productos()
+    return len(df), "filas"
+
+def caso_leer_movimientos(ctx):
+    df = almacenamiento_en(ctx.directorio, instantaneas=False).leer_movimientos()
+    return len(df), "filas"
+
+def caso_cargar_lotes(ctx):
+    df_lotes = almacenamiento_en(ctx.directorio, instantaneas=False).leer_lotes()
+    LibroLotes.desde_dataframe(df_lotes)
+    return len(df_lotes), "lotes"
+
+def caso_arranque_instantaneas(ctx):
+    # El Contexto ya dejo las instantaneas al dia: es el arranque de una sesion nueva sin cambios en disco
+    almacenamiento = almacenamiento_en(ctx.directorio)
+    filas = len(almacenamiento.leer_productos()) + len(almacenamiento.leer_movimientos())
+    LibroLotes.desde_dataframe(almacenamiento.leer_lotes())
+    return filas, "filas"
+
+def caso_guardar_movimiento(ctx):
+    """
+    Una escritura del escritor en CSV: un movimiento al final y Productos.csv + Lotes.csv completos.
+    """
+    almacenamiento = almacenamiento_en(ctx.directorio)
+    almacenamiento.leer_movimientos()
+    codigo = ctx.df_productos.at[0, "Codigo"]
+    df_nuevo = pd.DataFrame({"Fecha": [pd.Timestamp.now().normalize()], "Codigo_Producto": [codigo],
+                             "Tipo": ["Ajuste"], "Cantidad": [0], "Responsable": ["benchmark"],
+                             "Motivo": ["benchmark"], "Vencimiento_Lote": [pd.NaT]})
+    almacenamiento.confirmar(ctx.df_productos, ctx.df_lotes, {codigo}, set(), df_nuevo, ctx.df_movimientos)
+    return 1, "escrituras"
+
+def caso_compactar_movimientos(ctx):
+    almacenamiento_en(ctx.directorio).guardar_movimientos(ctx.df_movimientos)
+    return len(ctx.df_movimientos), "filas"
+
+def caso_estados_completo(ctx):
+    df = ctx.df_productos.copy()
+    actualizar_estados(df)
+    return len(df), "filas"
+
+def caso_estados_incremental(ctx):
+    """
+    Recalculo despues de 100 movimientos: solo cambian esas filas.
+    """
+    df = ctx.df_productos.copy()
+    foto = actualizar_estados(df)
+    filas = ctx.rng.choice(len(df), min(100, len(df)), replace=False)
+    df.loc[filas, "Stock_Actual"] = df.loc[filas, "Stock_Actual"] + 1
+    actualizar_estados(df, foto)
+    return len(df), "filas"
+
+def _aplicar_fefo(ctx, tipo, cantidad):
+    """
+    Aplica MOVIMIENTOS_FEFO movimientos de un tipo a productos al azar, como registrar_movimiento.
+    cantidad(codigo, stock, libro) decide la cantidad de cada uno.
+    """
+    df = ctx.df_productos.copy()
+    libro = ctx.libro()
+    hoy = pd.Timestamp.now().normalize()
+    vencimiento = hoy + pd.Timedelta(days=90)
+    filas = ctx.rng.integers(0, len(df), MOVIMIENTOS_FEFO)
+    for idx in filas.tolist():
+        codigo = df.at[idx, "Codigo"]
+        valor = cantidad(codigo, df.at[idx, "Stock_Actual"], libro)
+        if valor:
+            aplicar_movimiento(df, idx, libro, tipo, valor, hoy, vencimiento)
+    return MOVIMIENTOS_FEFO, "movimientos"
+
+def caso_fefo_entrada(ctx):
+    return _aplicar_fefo(ctx, "Entrada", lambda codigo, stock, libro: 10)
+
+def caso_fefo_salida(ctx):
+    """
+    Salidas que terminan el primer lote y pasan al siguiente (la rama mas cara).
+    """
+    def cantidad(codigo, stock, libro):
+        lotes = libro.lotes(codigo)
+        primero = lotes[0][1] if lotes else 0
+        return int(min(stock, primero + 1))
+    return _aplicar_fefo(ctx, "Salida", cantidad)
+
+def caso_fefo_ajuste_negativo(ctx):
+    return _aplicar_fefo(ctx, "Ajuste", lambda codigo, stock, libro: -1 if stock > 0 else 0)
+
+def caso_fefo_ajuste_positivo(ctx):
+    return _aplicar_fefo(ctx, "Ajuste", lambda codigo, stock, libro: 5)
+
+def caso_historial_indice(ctx):
+    """
+    Armado del indice del historial (primera visita a la pagina).
+    """
+    indice = IndiceHistorial()
+    indice.actualizar(ctx.df_movimientos)
+    ctx.indice_historial = indice
+    return len(ctx.df_movimientos), "filas"
+
+def caso_historial_pagina(ctx):
+    """
+    Una pagina del historial filtrada por un mes y 20 productos, con los nombres, como la dibuja la pagina.
+    """
+    if ctx.indice_historial is None:
+        caso_historial_indice(ctx)
+    nombres = dict(zip(ctx.df_productos["Codigo"], ctx.df_productos["Nombre"]))
+    hasta = ctx.df_movimientos["Fecha"].max()
+    codigos = ctx.df_productos["Codigo"].to_numpy()[:20].tolist()
+    df_pagina, total = ctx.indice_historial.pagina(ctx.df_movimientos, 0, TAMANO_PAGINA,
+                                                   hasta - pd.Timedelta(days=30), hasta, codigos)
+    df_pagina["Nombre Producto"] = df_pagina["Codigo_Producto"].map(nombres)
+    return len(df_pagina), "filas"
+
+def caso_resumen_diario(ctx):
+    """
+    Armado de los totales diarios (primera visita a la analitica o a la reposicion).
+    """
+    resumen = ResumenDiario()
+    resumen.actualizar(ctx.df_movimientos)
+    ctx.resumen_diario = resumen
+    return len(ctx.df_movimientos), "filas"
+
+def caso_reposicion(ctx):
+    """
+    Sugerencias de reposicion de todo el catalogo con la ventana por defecto.
+    """
+    if ctx.resumen_diario is None:
+        caso_resumen_diario(ctx)
+    hoy = ctx.df_movimientos["Fecha"].max()
+    df_consumo = ctx.resumen_diario.productos(hoy - pd.Timedelta(days=VENTANA_DEMANDA - 1), hoy)
+    calcular_reposicion(ctx.df_productos, df_consumo, ctx.df_lotes, hoy, ctx.resumen_diario.primeros_movimientos())
+    return len(ctx.df_productos), "productos"
+
+CASOS = {
+    "leer_productos": caso_leer_productos,
+    "leer_movimientos": caso_leer_movimientos,
+    "cargar_lotes": caso_cargar_lotes,
+    "arranque_instantaneas": caso_arranque_instantaneas,
+    "guardar_movimiento": caso_guardar_movimiento,
+    "compactar_movimientos": caso_compactar_movimientos,
+    "estados_completo": caso_estados_completo,
+    "estados_incremental": caso_estados_incremental,
+    "fefo_entrada": caso_fefo_entrada,
+    "fefo_salida": caso_fefo_salida,
+    "fefo_ajuste_negativo": caso_fefo_ajuste_negativo,
+    "fefo_ajuste_positivo": caso_fefo_ajuste_positivo,
+    "historial_indice": caso_historial_indice,
+    "historial_pagina": caso_historial_pagina,
+    "resumen_diario": caso_resumen_diario,
+    "reposicion": caso_reposicion,
+}
+
+def medir(nombre, caso, ctx, repeticiones=3, memoria=True):
+    """
+    Mejor tiempo de repeticiones corridas y, si memoria, el pico de memoria de una corrida extra.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        gc.collect()
+        inicio = time.perf_counter()
+        unidades, unidad = caso(ctx)
+        tiempos.append(time.perf_counter() - inicio)
+    pico = None
+    if memoria:
+        gc.collect()
+        tracemalloc.start()
+        caso(ctx)
+        pico = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    segundos = min(tiempos)
+    return {"caso": nombre, "unidades": unidades, "unidad": unidad, "segundos": round(segundos, 6),
+            "por_segundo": round(unidades / segundos, 1) if segundos > 0 else None,
+            "pico_mb": None if pico is None else round(pico, 1)}
+
+def comparar(resultados, base, tolerancia):
+    """
+    Agrega la relacion con la base (tiempo actual / tiempo base) y devuelve los casos que empeoraron.
+    """
+    tiempos_base = {r["caso"]: r["segundos"] for r in base}
+    peores = []
+    for resultado in resultados:
+        anterior = tiempos_base.get(resultado["caso"])
+        resultado["vs_base"] = round(resultado["segundos"] / anterior, 2) if anterior else None
+        if resultado["vs_base"] is not None and resultado["vs_base"] > tolerancia:
+            peores.append(resultado["caso"])
+    return peores
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide carga, guardado, estados, FEFO e historial con inventarios grandes")
+    parser.add_argument("--datos", help="Directorio con un inventario ya generado (si no, se genera uno)")
+    parser.add_argument("--productos", type=int, default=100_000)
+    parser.add_argument("--movimientos", type=int, default=5_000_000)
+    parser.add_argument("--lotes", type=int, default=3)
+    parser.add_argument("--casos", nargs="+", choices=list(CASOS), help="Solo estos casos")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--sin-memoria", action="store_true", help="No medir el pico de memoria")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    parser.add_argument("--comparar", help="Resultados anteriores (--json) contra los que comparar")
+    parser.add_argument("--tolerancia", type=float, default=1.3, help="Cuantas veces mas lento que la base se acepta")
+    args = parser.parse_args()
+
+    trabajo = tempfile.mkdtemp(prefix="benchmark_inventario_")
+    try:
+        if args.datos:
+            shutil.copytree(args.datos, trabajo, dirs_exist_ok=True)
+        else:
+            print(f"Generando {args.productos} productos y {args.movimientos} movimientos...")
+            generar(trabajo, args.productos, args.movimientos, args.lotes)
+        ctx = Contexto(trabajo)
+        print(f"Inventario: {len(ctx.df_productos)} productos, {len(ctx.df_movimientos)} movimientos, {len(ctx.df_lotes)} lotes")
+
+        resultados = []
+        for nombre in args.casos or list(CASOS):
+            resultado = medir(nombre, CASOS[nombre], ctx, args.repeticiones, not args.sin_memoria)
+            print(f"  {nombre}: {resultado['segundos']:.4f} s")
+            resultados.append(resultado)
+    finally:
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    peores = []
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            peores = comparar(resultados, json.load(f), args.tolerancia)
+    print()
+    print(pd.DataFrame(resultados).set_index("caso").to_string())
+    # ru_maxrss esta en KB en Linux
+    print(f"\nPico de memoria del proceso (RSS): {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+    if peores:
+        print(f"\nMas lentos que la base (tolerancia x{args.tolerancia}): {', '.join(peores)}")
+        sys.exit(1)
@@ -0,0 +1,221 @@
+"""
+Indice de busqueda de productos por trigramas sobre Nombre, Descripcion y Categoria.
+
+Cada palabra se normaliza (minusculas, sin acentos) y se parte en trigramas con un espacio a cada
+lado: "leche" -> " le", "lec", "ech", "che", "he ". Por cada campo hay una lista invertida
+trigrama -> productos que lo contienen. Una busqueda cuenta, con numpy, cuantos trigramas de la
+consulta tiene cada producto: no hace falta que esten todos, asi que "yogrt" o "leceh" siguen
+encontrando "Yogurt" y "Leche". La ultima palabra de la consulta no lleva espacio al final,
+para que mientras se escribe ("lec") ya aparezcan los productos que empiezan asi.
+
+El indice se arma una vez y despues se actualiza producto por producto (agregar, actualizar,
+eliminar). Un producto eliminado o editado deja su entrada vieja marcada como muerta; cuando
+las muertas son demasiadas el indice se rearma.
+"""
+import functools
+import itertools
+import math
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Peso de cada campo en el puntaje
+PESOS_CAMPOS = {"Nombre": 1.0, "Categoria": 0.4, "Descripcion": 0.25}
+
+# Fraccion minima de trigramas de la consulta que debe tener algun campo del producto
+UMBRAL_SIMILITUD = 0.5
+
+# Extra por contener la consulta tal cual en el nombre, y un poco mas si el nombre empieza asi
+BONO_SUBCADENA = 1.0
+BONO_PREFIJO = 0.5
+
+_PALABRA = re.compile(r"\w+")
+
+def normalizar_texto(texto):
+    """
+    Minusculas y sin acentos ("Lácteos" -> "lacteos"). Los valores vacios (NaN) quedan en "".
+    """
+    if not isinstance(texto, str):
+        return ""
+    texto = texto.casefold()
+    if texto.isascii():
+        return texto
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+@functools.lru_cache(maxsize=65536)
+def _trigramas_palabra(palabra, abierta):
+    # Las palabras se repiten mucho entre productos (marcas, categorias): se calculan una vez
+    relleno = f" {palabra}" if abierta else f" {palabra} "
+    return frozenset(relleno[j:j + 3] for j in range(len(relleno) - 2))
+
+def trigramas(texto, prefijo=False):
+    """
+    Trigramas de las palabras de texto. Con prefijo=True la ultima palabra no se cierra con un
+    espacio (todavia se esta escribiendo).
+    """
+    palabras = _PALABRA.findall(normalizar_texto(texto))
+    resultado = set()
+    for i, palabra in enumerate(palabras):
+        resultado |= _trigramas_palabra(palabra, prefijo and i == len(palabras) - 1)
+    return resultado
+
+def _listas_invertidas(textos):
+    """
+    Trigrama -> array ordenado de las posiciones de textos que lo contienen, armado de una vez:
+    se juntan todos los pares (trigrama, posicion) y se agrupan con un solo ordenamiento.
+    """
+    memo = {}
+    claves, posiciones = [], []
+    for posicion, texto in enumerate(textos):
+        if not isinstance(texto, str):
+            texto = ""
+        lista = memo.get(texto)
+        if lista is None:
+            lista = memo[texto] = list(trigramas(texto))
+        claves.extend(lista)
+        posiciones.extend(itertools.repeat(posicion, len(lista)))
+    if not claves:
+        return {}
+    numeros, unicos = pd.factorize(pd.Series(claves, dtype=object), sort=False)
+    orden = np.argsort(numeros, kind="stable")
+    posiciones = np.asarray(posiciones, dtype=np.int64)[orden]
+    cortes = np.cumsum(np.bincount(numeros, minlength=len(unicos)))[:-1]
+    return dict(zip(unicos.tolist(), np.split(posiciones, cortes)))
+
+class IndiceBusqueda:
+    """
+    Entradas numeradas (id interno -> Codigo). Por campo y trigrama, los ids que lo contienen:
+    un array armado en reconstruir mas una lista con lo agregado despues. Las dos partes se
+    unen la primera vez que una busqueda usa ese trigrama.
+    """
+
+    def __init__(self, df_productos=None):
+        self.reconstruir(df_productos)
+
+    def reconstruir(self, df_productos=None):
+        self._codigos = []
+        self._textos = []
+        self._nombres = []
+        self._id_por_codigo = {}
+        self._vivos = np.zeros(0, dtype=bool)
+        self._base = {campo: {} for campo in PESOS_CAMPOS}
+        self._listas = {campo: {} for campo in PESOS_CAMPOS}
+        self._arrays = {campo: {} for campo in PESOS_CAMPOS}
+        self._muertos = 0
+        if df_productos is None or df_productos.empty:
+            return
+        # Las columnas que falten (archivos viejos) quedan vacias
+        df_textos = df_productos.reindex(columns=list(PESOS_CAMPOS))
+        self._codigos = df_productos["Codigo"].tolist()
+        self._textos = [dict(zip(PESOS_CAMPOS, textos)) for textos in df_textos.itertuples(index=False, name=None)]
+        self._nombres = [normalizar_texto(nombre) for nombre in df_textos["Nombre"].tolist()]
+        self._id_por_codigo = dict(zip(self._codigos, range(len(self._codigos))))
+        self._vivos = np.ones(len(self._codigos), dtype=bool)
+        for campo in PESOS_CAMPOS:
+            self._base[campo] = _listas_invertidas(df_textos[campo].tolist())
+
+    def __len__(self):
+        return len(self._id_por_codigo)
+
+    # --- Cambios ---
+
+    def agregar(self, codigo, nombre, descripcion="", categoria=""):
+        self.eliminar(codigo)
+        textos = {"Nombre": nombre, "Categoria": categoria, "Descripcion": descripcion}
+        id_interno = len(self._codigos)
+        self._codigos.append(codigo)
+        self._textos.append(textos)
+        self._nombres.append(normalizar_texto(nombre))
+        self._id_por_codigo[codigo] = id_interno
+        if id_interno >= len(self._vivos):
+            self._vivos = np.concatenate([self._vivos, np.zeros(max(len(self._vivos), 1024), dtype=bool)])
+        self._vivos[id_interno] = True
+        for campo, texto in textos.items():
+            listas, arrays = self._listas[campo], self._arrays[campo]
+            for trigrama in trigramas(texto):
+                listas.setdefault(trigrama, []).append(id_interno)
+                arrays.pop(trigrama, None)
+
+    def actualizar(self, codigo, nombre, descripcion="", categoria=""):
+        """
+        Reindexa el producto solo si cambio alguno de sus textos (un cambio de stock no lo toca).
+        """
+        textos = {"Nombre": nombre, "Categoria": categoria, "Descripcion": descripcion}
+        id_interno = self._id_por_codigo.get(codigo)
+        if id_interno is None or self._textos[id_interno] != textos:
+            self.agregar(codigo, nombre, descripcion, categoria)
+
+    def eliminar(self, codigo):
+        id_interno = self._id_por_codigo.pop(codigo, None)
+        if id_interno is None:
+            return
+        self._vivos[id_interno] = False
+        self._muertos += 1
+        if self._muertos > max(1000, len(self._id_por_codigo)):
+            ids = sorted(self._id_por_codigo.values())
+            df_vivos = pd.DataFrame([self._textos[i] for i in ids], columns=list(PESOS_CAMPOS))
+            df_vivos.insert(0, "Codigo", [self._codigos[i] for i in ids])
+            self.reconstruir(df_vivos)
+
+    # --- Consultas ---
+
+    def _ids(self, campo, trigrama):
+        arrays = self._arrays[campo]
+        if trigrama not in arrays:
+            base = self._base[campo].get(trigrama)
+            agregados = self._listas[campo].get(trigrama)
+            if agregados:
+                agregados = np.asarray(agregados, dtype=np.int64)
+                base = agregados if base is None else np.concatenate([base, agregados])
+            arrays[trigrama] = np.zeros(0, dtype=np.int64) if base is None else base
+        return arrays[trigrama]
+
+    def buscar(self, texto, limite=None):
+        """
+        Codigos de los productos que coinciden con texto, del mas parecido al menos parecido.
+        """
+        consulta = " ".join(_PALABRA.findall(normalizar_texto(texto)))
+        total = len(self._codigos)
+        if not consulta or total == 0:
+            return []
+        vivos = self._vivos[:total]
+        buscados = trigramas(texto, prefijo=True)
+
+        if not buscados:
+            # Una sola letra: los nombres con alguna palabra que empieza asi
+            inicio = f" {consulta}"
+            claves = {t for t in itertools.chain(self._base["Nombre"], self._listas["Nombre"]) if t.startswith(inicio)}
+            ids = [self._ids("Nombre", trigrama) for trigrama in claves]
+            en_nombre = np.bincount(np.concatenate(ids), minlength=total) if ids else np.zeros(total, dtype=np.int64)
+            puntaje = (en_nombre > 0).astype(np.float64)
+            candidatos = np.flatnonzero(vivos & (en_nombre > 0))
+        else:
+            minimo = len(buscados) if len(buscados) <= 3 else math.ceil(len(buscados) * UMBRAL_SIMILITUD)
+            puntaje = np.zeros(total, dtype=np.float64)
+            mejor = np.zeros(total, dtype=np.int64)
+            for campo, peso in PESOS_CAMPOS.items():
+                coincidencias = np.bincount(np.concatenate([self._ids(campo, t) for t in buscados]), minlength=total)
+                puntaje += peso * coincidencias / len(buscados)
+                np.maximum(mejor, coincidencias, out=mejor)
+                if campo == "Nombre":
+                    en_nombre = coincidencias
+            candidatos = np.flatnonzero(vivos & (mejor >= minimo))
+
+        if len(candidatos) == 0:
+            return []
+        puntaje = puntaje[candidatos]
+        # Bonos solo para los que tienen todos los trigramas en el nombre (los demas no pueden
+        # contener la consulta desde el comienzo de una palabra)
+        completos = en_nombre[candidatos] >= max(len(buscados), 1)
+        nombres = [self._nombres[i] for i in candidatos[completos].tolist()]
+        contiene = np.fromiter((consulta in nombre for nombre in nombres), dtype=bool, count=len(nombres))
+        prefijo = np.fromiter((nombre.startswith(consulta) for nombre in nombres), dtype=bool, count=len(nombres))
+        puntaje[completos] += BONO_SUBCADENA * contiene + BONO_PREFIJO * prefijo
+        # A igual puntaje, el orden en que se indexaron (stable)
+        orden = np.argsort(-puntaje, kind="stable")
+        if limite is not None:
+            orden = orden[:limite]
+        return [self._codigos[i] for i in candidatos[orden].tolist()]
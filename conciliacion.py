@@ -0,0 +1,253 @@
+"""
+Conciliacion del stock con el historial de movimientos (auditoria de integridad).
+
+El stock esperado de cada producto es su Stock_Inicial (el alta no deja movimiento) mas el neto de
+sus movimientos: Salida resta, Entrada, Ajuste y Transferencia suman (los dos ultimos traen su
+signo). El informe tiene tres partes:
+
+- Diferencias: productos cuyo Stock_Actual no es el esperado, cuyos lotes no suman el
+  Stock_Actual o cuyo Stock_Viejo_Restante no es la cantidad del lote que vence primero (0 con
+  un solo lote, ver LibroLotes.resumen). Despues de un tramo negativo los lotes pueden sumar mas
+  que el stock sin que haya un error: se informa igual, para revisarlo.
+- Huerfanos: codigos con movimientos que ya no estan en Productos (productos eliminados).
+- Negativos: tramos del historial, en el orden del archivo, en los que el stock corrido de un
+  producto quedo bajo cero (inicio, recuperacion o NaT si sigue negativo, y minimo).
+
+Todo se calcula con groupby y cumsum por producto. Con --procesos N los productos se reparten en
+N rangos contiguos de codigos con una cantidad parecida de movimientos, y cada rango se calcula en
+un proceso aparte. Un producto nunca queda en dos rangos, asi que los resultados solo se concatenan.
+Con --corregir se agregan Ajustes por la diferencia de cada producto, todos con el mismo
+Id_Transaccion (con el prefijo reservado PREFIJO_CONCILIACION) y el Motivo MOTIVO_CONCILIACION. Van solo al historial (el stock y los lotes no
+cambian): despues de corregir, el historial explica el Stock_Actual. La analitica de consumo no
+los cuenta (ver resumen_diario.py).
+
+    python conciliacion.py                         # almacenamiento configurado (o GESTOR_UBICACION)
+    python conciliacion.py --datos datos_prueba --procesos 4 --informe informe_conciliacion
+    python conciliacion.py --corregir --responsable Auditoria
+
+Termina con codigo 1 si quedan diferencias de stock sin corregir.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from importacion import MOTIVO_CONCILIACION, id_conciliacion
+
+COLUMNAS_DIFERENCIAS = ["Codigo", "Nombre", "Stock_Inicial", "Neto_Movimientos", "Stock_Esperado", "Stock_Actual",
+                        "Diferencia", "Stock_Lotes", "Diferencia_Lotes", "Stock_Viejo_Restante", "Viejo_Esperado"]
+COLUMNAS_HUERFANOS = ["Codigo_Producto", "Movimientos", "Neto", "Primera_Fecha", "Ultima_Fecha"]
+COLUMNAS_NEGATIVOS = ["Codigo_Producto", "Desde", "Hasta", "Movimientos", "Minimo", "Fila_Desde"]
+
+def _delta(df_movimientos):
+    signo = np.where(df_movimientos["Tipo"].to_numpy() == "Salida", -1, 1)
+    return df_movimientos["Cantidad"].to_numpy().astype(np.int64) * signo
+
+def conciliar_rango(df_productos, df_movimientos):
+    """
+    Stock esperado y episodios negativos de un rango de productos (se ejecuta en los procesos).
+    df_productos: Codigo y Stock_Inicial. df_movimientos: solo los de esos productos, en el orden
+    del historial, con Codigo_Producto, Fecha, Delta y Fila (posicion en el historial).
+    Devuelve (esperado por Codigo, DataFrame de COLUMNAS_NEGATIVOS).
+    """
+    inicial = pd.Series(df_productos["Stock_Inicial"].to_numpy(), index=df_productos["Codigo"].to_numpy())
+    codigos = df_movimientos["Codigo_Producto"].to_numpy()
+    delta = df_movimientos["Delta"].to_numpy()
+    neto = pd.Series(delta).groupby(codigos).sum()
+    esperado = inicial + neto.reindex(inicial.index, fill_value=0)
+
+    # Stock despues de cada movimiento y tramos consecutivos (por producto) por debajo de cero
+    corrido = inicial.reindex(codigos).to_numpy() + pd.Series(delta).groupby(codigos).cumsum().to_numpy()
+    negativo = corrido < 0
+    nuevo_producto = np.r_[True, codigos[1:] != codigos[:-1]] if len(codigos) else np.zeros(0, bool)
+    anterior = np.r_[False, negativo[:-1]] & ~nuevo_producto
+    inicio = negativo & ~anterior
+    episodio = np.cumsum(inicio)
+    # El movimiento que devuelve el stock a cero o mas cierra el episodio (tiene su mismo numero)
+    recupera = ~negativo & anterior
+
+    fechas = df_movimientos["Fecha"].to_numpy()
+    filas = df_movimientos["Fila"].to_numpy()
+    df_negativos = pd.DataFrame({"Episodio": episodio[negativo], "Codigo_Producto": codigos[negativo],
+                                 "Fecha": fechas[negativo], "Stock": corrido[negativo], "Fila": filas[negativo]})
+    df_negativos = df_negativos.groupby("Episodio").agg(
+        Codigo_Producto=("Codigo_Producto", "first"), Desde=("Fecha", "first"), Movimientos=("Stock", "size"),
+        Minimo=("Stock", "min"), Fila_Desde=("Fila", "first"))
+    hasta = pd.Series(fechas[recupera], index=episodio[recupera])
+    df_negativos["Hasta"] = hasta.reindex(df_negativos.index).to_numpy()
+    return esperado, df_negativos.reset_index(drop=True)[COLUMNAS_NEGATIVOS]
+
+def _rangos(codigos_productos, codigos_movimientos, partes):
+    """
+    Primer codigo de cada rango: partes rangos contiguos de codigos con una cantidad parecida de
+    movimientos (cada producto cuenta ademas como un movimiento, para repartir los que no tienen).
+    """
+    codigos = np.sort(codigos_productos)
+    peso = np.searchsorted(np.sort(codigos_movimientos), codigos, side="right")
+    peso = np.diff(np.r_[0, peso]) + 1
+    cortes = np.searchsorted(np.cumsum(peso), np.arange(1, partes) * peso.sum() / partes)
+    return np.unique(codigos[np.r_[0, cortes[cortes < len(codigos)]]])
+
+def _lotes(df_productos, df_lotes):
+    """
+    Stock_Lotes (suma de los lotes) y Viejo_Esperado (cantidad del lote que vence primero si hay
+    mas de uno, como LibroLotes.resumen) por Codigo, alineados con df_productos.
+    """
+    codigos = df_productos["Codigo"]
+    if df_lotes is None:
+        return pd.Series(np.nan, index=codigos.index), pd.Series(np.nan, index=codigos.index)
+    # Los lotes sin vencimiento se consumen al final
+    df_lotes = df_lotes.sort_values(["Codigo_Producto", "Fecha_Vencimiento"], na_position="last", kind="stable")
+    por_codigo = df_lotes.groupby("Codigo_Producto")["Cantidad"]
+    suma, cantidad, primero = por_codigo.sum(), por_codigo.size(), por_codigo.first()
+    viejo = primero.where(cantidad > 1, 0)
+    return codigos.map(suma).fillna(0).astype(np.int64), codigos.map(viejo).fillna(0).astype(np.int64)
+
+def conciliar(df_productos, df_movimientos, df_lotes=None, procesos=1):
+    """
+    Devuelve (diferencias, huerfanos, negativos) con COLUMNAS_DIFERENCIAS, COLUMNAS_HUERFANOS y
+    COLUMNAS_NEGATIVOS. df_lotes (COLUMNAS_LOTES de lotes.py) es opcional: sin el, las columnas
+    de lotes quedan vacias. Con procesos > 1 el calculo por producto se reparte en un pool.
+    """
+    df_productos = df_productos.assign(Stock_Inicial=pd.to_numeric(df_productos["Stock_Inicial"], errors='coerce').fillna(0)
+                                       .astype(np.int64))
+    df_mov = pd.DataFrame({
+        "Codigo_Producto": df_movimientos["Codigo_Producto"].to_numpy(),
+        "Fecha": df_movimientos["Fecha"].to_numpy(),
+        "Delta": _delta(df_movimientos),
+        "Fila": np.arange(len(df_movimientos)),
+    })
+
+    # --- Huerfanos ---
+    existe = df_mov["Codigo_Producto"].isin(df_productos["Codigo"]).to_numpy()
+    huerfanos = df_mov[~existe].groupby("Codigo_Producto").agg(
+        Movimientos=("Delta", "size"), Neto=("Delta", "sum"), Primera_Fecha=("Fecha", "min"), Ultima_Fecha=("Fecha", "max"))
+    huerfanos = huerfanos.reset_index()[COLUMNAS_HUERFANOS]
+    df_mov = df_mov[existe]
+
+    # --- Stock esperado y negativos, por rangos de productos ---
+    # Orden estable por codigo: dentro de cada producto se conserva el orden del historial
+    df_mov = df_mov.sort_values("Codigo_Producto", kind="stable")
+    productos = df_productos[["Codigo", "Stock_Inicial"]].sort_values("Codigo")
+    limites = _rangos(productos["Codigo"].to_numpy(), df_mov["Codigo_Producto"].to_numpy(), max(procesos, 1))
+    parte_producto = np.searchsorted(limites, productos["Codigo"].to_numpy(), side="right") - 1
+    parte_movimiento = np.searchsorted(limites, df_mov["Codigo_Producto"].to_numpy(), side="right") - 1
+    trozos_productos = [productos[parte_producto == i] for i in range(len(limites))]
+    trozos_movimientos = [df_mov[parte_movimiento == i] for i in range(len(limites))]
+    if procesos > 1 and len(limites) > 1:
+        with ProcessPoolExecutor(min(procesos, len(limites))) as pool:
+            resultados = list(pool.map(conciliar_rango, trozos_productos, trozos_movimientos))
+    else:
+        resultados = [conciliar_rango(p, m) for p, m in zip(trozos_productos, trozos_movimientos)]
+    esperado = pd.concat([r[0] for r in resultados])
+    negativos = pd.concat([r[1] for r in resultados], ignore_index=True).sort_values("Fila_Desde", ignore_index=True)
+
+    # --- Diferencias ---
+    stock_lotes, viejo_esperado = _lotes(df_productos, df_lotes)
+    diferencias = pd.DataFrame({
+        "Codigo": df_productos["Codigo"],
+        "Nombre": df_productos["Nombre"],
+        "Stock_Inicial": df_productos["Stock_Inicial"],
+        "Stock_Esperado": df_productos["Codigo"].map(esperado),
+        "Stock_Actual": df_productos["Stock_Actual"],
+        "Stock_Lotes": stock_lotes,
+        "Stock_Viejo_Restante": df_productos.get("Stock_Viejo_Restante", pd.Series(0, index=df_productos.index)),
+        "Viejo_Esperado": viejo_esperado,
+    })
+    diferencias["Neto_Movimientos"] = diferencias["Stock_Esperado"] - diferencias["Stock_Inicial"]
+    diferencias["Diferencia"] = diferencias["Stock_Actual"] - diferencias["Stock_Esperado"]
+    diferencias["Diferencia_Lotes"] = diferencias["Stock_Actual"] - diferencias["Stock_Lotes"]
+    con_diferencia = ((diferencias["Diferencia"] != 0) | (diferencias["Diferencia_Lotes"].fillna(0) != 0)
+                      | (diferencias["Stock_Viejo_Restante"] != diferencias["Viejo_Esperado"].fillna(diferencias["Stock_Viejo_Restante"])))
+    diferencias = diferencias[con_diferencia][COLUMNAS_DIFERENCIAS].reset_index(drop=True)
+    return diferencias, huerfanos, negativos
+
+def ajustes_de_correccion(diferencias, responsable, fecha=None):
+    """
+    Un Ajuste por cada producto con Diferencia (la cantidad que le falta al historial para llegar
+    al Stock_Actual), todos con el mismo Id_Transaccion. Columnas de Movimientos.
+    """
+    if fecha is None:
+        fecha = pd.Timestamp(datetime.now().date())
+    pendientes = diferencias[diferencias["Diferencia"] != 0]
+    return pd.DataFrame({
+        "Fecha": fecha,
+        "Codigo_Producto": pendientes["Codigo"].to_numpy(),
+        "Tipo": "Ajuste",
+        "Cantidad": pendientes["Diferencia"].to_numpy().astype(np.int64),
+        "Responsable": responsable,
+        "Motivo": MOTIVO_CONCILIACION,
+        "Vencimiento_Lote": pd.NaT,
+        "Id_Transaccion": id_conciliacion(),
+    })
+
+if __name__ == "__main__":
+    import time
+
+    from almacen_datos import AlmacenDatos
+    from almacenamiento import crear_almacenamiento
+    from datos_sinteticos import almacenamiento_en
+    from ubicaciones import Ubicacion
+
+    parser = argparse.ArgumentParser(description="Concilia el stock con el historial de movimientos")
+    parser.add_argument("--datos", help="Directorio con los CSV (por defecto, el almacenamiento configurado)")
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos para el calculo por producto")
+    parser.add_argument("--informe", help="Directorio donde escribir Diferencias.csv, Huerfanos.csv y Negativos.csv")
+    parser.add_argument("--limite", type=int, default=20, help="Filas de cada parte que se muestran")
+    parser.add_argument("--corregir", action="store_true", help="Agrega Ajustes por las diferencias de stock")
+    parser.add_argument("--responsable", default="Conciliacion", help="Responsable de los Ajustes de correccion")
+    args = parser.parse_args()
+
+    if args.datos:
+        almacenamiento = almacenamiento_en(args.datos)
+    else:
+        ubicacion = Ubicacion.actual()
+        almacenamiento = crear_almacenamiento() if ubicacion is None else ubicacion.almacenamiento()
+
+    inicio = time.perf_counter()
+    if args.corregir:
+        # Por el almacen: los Ajustes se guardan con el escritor unico y el bloqueo entre procesos,
+        # como los de la app, asi la conciliacion no se cruza con un movimiento de la app o la API
+        almacen = AlmacenDatos(almacenamiento)
+        if not almacen.refrescar():
+            sys.exit(f"No se pudieron cargar {almacenamiento.descripcion}.")
+        with almacen.escritura():
+            diferencias, huerfanos, negativos = conciliar(almacen.df_productos, almacen.df_movimientos,
+                                                          almacen.libro_lotes.a_dataframe(), args.procesos)
+            df_ajustes = ajustes_de_correccion(diferencias, args.responsable)
+            confirmacion = None
+            if not df_ajustes.empty:
+                # Sin productos tocados: solo se agregan lineas al historial (no se reescribe Productos ni Lotes)
+                confirmacion = almacen.agregar_movimientos(df_ajustes, [])
+        if confirmacion is not None:
+            confirmacion.result()
+    else:
+        diferencias, huerfanos, negativos = conciliar(almacenamiento.leer_productos(), almacenamiento.leer_movimientos(),
+                                                      almacenamiento.leer_lotes(), args.procesos)
+    duracion = time.perf_counter() - inicio
+
+    pd.set_option("display.width", 200)
+    de_stock = int((diferencias["Diferencia"] != 0).sum())
+    print(f"Conciliacion en {duracion:.2f} s ({args.procesos} proceso(s))")
+    print(f"Productos con diferencias: {len(diferencias)} (stock: {de_stock}, "
+          f"lotes: {int((diferencias['Diferencia_Lotes'].fillna(0) != 0).sum())})")
+    print(f"Codigos huerfanos: {len(huerfanos)} ({int(huerfanos['Movimientos'].sum())} movimientos)")
+    print(f"Episodios de stock negativo: {len(negativos)} (en curso: {int(negativos['Hasta'].isna().sum())})")
+    for titulo, df in (("Diferencias", diferencias), ("Huerfanos", huerfanos), ("Negativos", negativos)):
+        if args.limite > 0 and not df.empty:
+            print(f"\n{titulo}:\n{df.head(args.limite).to_string(index=False)}")
+    if args.corregir:
+        print(f"\nAjustes de correccion agregados: {len(df_ajustes)}"
+              + (f" (Id_Transaccion {df_ajustes['Id_Transaccion'].iloc[0]})" if len(df_ajustes) else ""))
+
+    if args.informe:
+        os.makedirs(args.informe, exist_ok=True)
+        for nombre, df in (("Diferencias", diferencias), ("Huerfanos", huerfanos), ("Negativos", negativos)):
+            df.to_csv(os.path.join(args.informe, f"{nombre}.csv"), sep=";", index=False, date_format="%d-%m-%Y")
+        print(f"\nInforme completo en '{args.informe}'.")
+
+    sys.exit(1 if de_stock and not args.corregir else 0)
@@ -0,0 +1,177 @@
+"""
+Generador de inventarios sinteticos con el esquema real: Productos.csv, Movimientos.csv y Lotes.csv
+separados por ';' (se escriben con AlmacenamientoCSV, igual que la app). Sirve para medir como
+escalan la carga, el guardado y las paginas (ver benchmark.py).
+
+Los datos son coherentes entre si: el stock de cada producto es su Stock_Inicial mas sus movimientos,
+nunca queda negativo en el historial, y la suma de sus lotes es el Stock_Actual.
+
+    python datos_sinteticos.py --productos 100000 --movimientos 5000000 --lotes 3 --destino datos_prueba
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import (ARCHIVO_CHECKPOINTS, ARCHIVO_LOTES, ARCHIVO_MOVIMIENTOS, ARCHIVO_PRODUCTOS,
+                            ARCHIVO_USUARIOS, AlmacenamientoCSV)
+from instantaneas import DIRECTORIO_INSTANTANEAS
+from estados import actualizar_estados
+
+CATEGORIAS = ["Lacteos", "Abarrotes", "Bebidas", "Limpieza", "Panaderia", "Congelados", "Snacks", "Higiene"]
+PRODUCTOS_BASE = ["Leche Entera", "Yogurt Batido", "Fideos Espirales", "Arroz Grado 1", "Aceite Maravilla",
+                  "Queso Gauda", "Pan de Molde", "Galletas de Chocolate", "Cafe Molido", "Te Verde",
+                  "Azucar Rubia", "Harina sin Polvos", "Jugo de Naranja", "Mantequilla", "Detergente Liquido",
+                  "Shampoo Manzanilla", "Papas Fritas", "Helado de Vainilla"]
+MARCAS = ["Colun", "Soprole", "Lider", "Carozzi", "Nestle", "Watts", "Ideal", "Costa"]
+DESCRIPCIONES = ["", "Producto nacional", "Importado", "Sin lactosa", "Formato familiar", "Bajo en sodio"]
+RESPONSABLES = ["Nestor", "Pepito", "Vendedor1", "Vendedor2", "Bodega", "Proveedor1", "Proveedor2"]
+MOTIVOS_AJUSTE = ["Merma", "Merma por rotura", "Conteo fisico", "Producto vencido"]
+
+# Orden de columnas de Productos.csv tal como lo escribe la app
+COLUMNAS_PRODUCTOS = ["Categoria", "Codigo", "Descripcion", "Estado (Stock)", "Estado (Vencimiento)",
+                      "Fecha_Entrada", "Fecha_Vencimiento", "Nombre", "Precio_Venta", "Stock_Actual",
+                      "Stock_Inicial", "Stock_Minimo", "Costo", "Stock_Viejo_Restante", "Fecha_Vencimiento_Pendiente"]
+
+def generar_productos(n, rng, hoy):
+    """
+    Catalogo de n productos (sin stock todavia: lo fija generar_movimientos). Los nombres son unicos.
+    """
+    codigos = np.arange(1, n + 1)
+    base = rng.choice(PRODUCTOS_BASE, n)
+    marca = rng.choice(MARCAS, n)
+    gramos = rng.integers(1, 20, n) * 50
+    costo = rng.integers(2, 400, n) * 10
+    return pd.DataFrame({
+        "Codigo": codigos,
+        "Nombre": [f"{b} {m} {g}g #{c}" for b, m, g, c in zip(base, marca, gramos, codigos)],
+        "Categoria": rng.choice(CATEGORIAS, n),
+        "Descripcion": rng.choice(DESCRIPCIONES, n),
+        "Stock_Minimo": rng.integers(5, 50, n),
+        "Costo": costo,
+        "Precio_Venta": (costo * rng.uniform(1.2, 1.8, n)).round(-1).astype(np.int64),
+        "Fecha_Entrada": hoy - pd.to_timedelta(rng.integers(0, 60, n), unit="D"),
+    })
+
+def generar_movimientos(df_productos, n, rng, hoy, dias=365):
+    """
+    n movimientos del ultimo ano, en orden de fecha como en el registro real. Algunos productos se
+    mueven mucho mas que otros. Completa Stock_Inicial y Stock_Actual de df_productos.
+    """
+    cantidad_productos = len(df_productos)
+    # Popularidad decreciente con el rango del producto (los primeros se venden mas)
+    peso = 1.0 / np.arange(1, cantidad_productos + 1) ** 0.7
+    codigos = df_productos["Codigo"].to_numpy()[rng.choice(cantidad_productos, n, p=peso / peso.sum())]
+    fechas = np.sort((hoy - pd.to_timedelta(rng.integers(0, dias, n), unit="D")).to_numpy())
+
+    tipos = rng.choice(np.array(["Salida", "Entrada", "Ajuste"], dtype=object), n, p=[0.6, 0.3, 0.1])
+    # Entradas y salidas parejas en promedio, para que el stock no crezca sin limite
+    cantidades = np.where(tipos == "Entrada", rng.integers(10, 50, n), rng.integers(1, 30, n))
+    # Los ajustes casi siempre son mermas
+    es_ajuste = tipos == "Ajuste"
+    cantidades = np.where(es_ajuste & (rng.random(n) < 0.8), -cantidades, cantidades)
+
+    vencimientos = pd.Series(pd.NaT, index=range(n), dtype="datetime64[ns]")
+    entradas = tipos == "Entrada"
+    vencimientos[entradas] = fechas[entradas] + pd.to_timedelta(rng.integers(30, 365, entradas.sum()), unit="D").to_numpy()
+
+    df_movimientos = pd.DataFrame({
+        "Fecha": fechas,
+        "Codigo_Producto": codigos,
+        "Tipo": tipos,
+        "Cantidad": cantidades,
+        "Responsable": rng.choice(RESPONSABLES, n),
+        "Motivo": np.where(es_ajuste, rng.choice(MOTIVOS_AJUSTE, n), ""),
+        "Vencimiento_Lote": vencimientos,
+    })
+
+    # Stock_Inicial alcanza para que ningun producto quede en negativo en ningun momento
+    delta = np.where(tipos == "Salida", -cantidades, cantidades)
+    acumulado = pd.Series(delta).groupby(codigos).cumsum()
+    minimo = acumulado.groupby(codigos).min().reindex(df_productos["Codigo"]).fillna(0).to_numpy()
+    total = pd.Series(delta).groupby(codigos).sum().reindex(df_productos["Codigo"]).fillna(0).to_numpy()
+    stock_inicial = rng.integers(0, 100, cantidad_productos) + np.maximum(0, -minimo)
+    df_productos["Stock_Inicial"] = stock_inicial.astype(np.int64)
+    df_productos["Stock_Actual"] = (stock_inicial + total).astype(np.int64)
+    return df_movimientos
+
+def generar_lotes(df_productos, lotes_por_producto, rng, hoy):
+    """
+    Reparte el Stock_Actual de cada producto en hasta lotes_por_producto lotes con vencimientos
+    distintos (algunos ya vencidos) y completa las columnas de vencimiento del producto.
+    """
+    n = len(df_productos)
+    stock = df_productos["Stock_Actual"].to_numpy()
+    pesos = rng.random((n, lotes_por_producto))
+    partes = np.floor(stock[:, None] * pesos / pesos.sum(axis=1, keepdims=True)).astype(np.int64)
+    partes[:, -1] += stock - partes.sum(axis=1)
+    dias = np.sort(rng.integers(-20, 365, (n, lotes_por_producto)), axis=1)
+    # Vencimientos distintos dentro de cada producto (los lotes con la misma fecha se unen)
+    dias = dias + np.arange(lotes_por_producto)
+
+    df_lotes = pd.DataFrame({
+        "Codigo_Producto": np.repeat(df_productos["Codigo"].to_numpy(), lotes_por_producto),
+        "Fecha_Vencimiento": hoy + pd.to_timedelta(dias.ravel(), unit="D"),
+        "Cantidad": partes.ravel(),
+    })
+    df_lotes = df_lotes[df_lotes["Cantidad"] > 0].reset_index(drop=True)
+
+    # Columnas de vencimiento del producto: primer lote (y su cantidad si hay mas de uno, como
+    # LibroLotes.resumen) y segundo lote
+    por_producto = df_lotes.groupby("Codigo_Producto")
+    primero = por_producto.nth(0).set_index("Codigo_Producto")
+    segundo = por_producto.nth(1).set_index("Codigo_Producto")
+    cantidad_lotes = por_producto.size()
+    codigos = df_productos["Codigo"]
+    df_productos["Fecha_Vencimiento"] = codigos.map(primero["Fecha_Vencimiento"]).to_numpy()
+    viejo = primero["Cantidad"].where(cantidad_lotes > 1, 0)
+    df_productos["Stock_Viejo_Restante"] = codigos.map(viejo).fillna(0).to_numpy()
+    df_productos["Fecha_Vencimiento_Pendiente"] = codigos.map(segundo["Fecha_Vencimiento"]).to_numpy()
+    return df_lotes
+
+def almacenamiento_en(directorio, instantaneas=True):
+    """
+    AlmacenamientoCSV con todos sus archivos dentro de directorio. Sin instantaneas, cada lectura
+    parsea los CSV completos.
+    """
+    return AlmacenamientoCSV(
+        archivo_productos=os.path.join(directorio, ARCHIVO_PRODUCTOS),
+        archivo_movimientos=os.path.join(directorio, ARCHIVO_MOVIMIENTOS),
+        archivo_usuarios=os.path.join(directorio, ARCHIVO_USUARIOS),
+        archivo_lotes=os.path.join(directorio, ARCHIVO_LOTES),
+        archivo_checkpoints=os.path.join(directorio, ARCHIVO_CHECKPOINTS),
+        directorio_instantaneas=os.path.join(directorio, DIRECTORIO_INSTANTANEAS) if instantaneas else None,
+    )
+
+def generar(destino, productos, movimientos, lotes_por_producto=3, semilla=0):
+    """
+    Escribe un inventario sintetico completo en el directorio destino y devuelve su AlmacenamientoCSV.
+    """
+    rng = np.random.default_rng(semilla)
+    hoy = pd.Timestamp.now().normalize()
+    os.makedirs(destino, exist_ok=True)
+
+    df_productos = generar_productos(productos, rng, hoy)
+    df_movimientos = generar_movimientos(df_productos, movimientos, rng, hoy)
+    df_lotes = generar_lotes(df_productos, lotes_por_producto, rng, hoy)
+    actualizar_estados(df_productos)
+
+    almacenamiento = almacenamiento_en(destino)
+    almacenamiento.guardar_productos(df_productos[COLUMNAS_PRODUCTOS])
+    almacenamiento._escribir_lotes(df_lotes)
+    almacenamiento.guardar_movimientos(df_movimientos)
+    almacenamiento.leer_usuarios()
+    return almacenamiento
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un inventario sintetico con el esquema real (CSV separados por ';')")
+    parser.add_argument("--productos", type=int, default=100_000)
+    parser.add_argument("--movimientos", type=int, default=5_000_000)
+    parser.add_argument("--lotes", type=int, default=3, help="Lotes por producto (como maximo)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--destino", default="datos_prueba")
+    args = parser.parse_args()
+
+    generar(args.destino, args.productos, args.movimientos, args.lotes, args.semilla)
+    print(f"Inventario sintetico en {args.destino}/: {args.productos} productos, {args.movimientos} movimientos")
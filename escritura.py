@@ -0,0 +1,209 @@
+"""
+Cola de escritura con un unico escritor.
+
+Las sesiones aplican sus cambios en memoria (bajo el lock de AlmacenDatos) y encolan que hay que
+guardarlos. Un solo hilo escritor junta todo lo que llega dentro de una ventana corta y lo guarda
+en una sola escritura, asi que con mas carga cada escritura lleva mas cambios en vez de competir
+por los archivos. Cada pedido recibe su confirmacion (un Future) cuando su lote quedo en disco.
+
+Entre procesos (la app y la API sobre los mismos datos) escribe uno a la vez: BloqueoEntreProcesos
+es un bloqueo sobre un archivo junto a los datos que AlmacenDatos.escritura toma antes de releer el
+disco y suelta recien cuando el escritor guardo lo que se encolo (ver al_vaciarse).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Tiempo que el escritor espera a que lleguen mas cambios antes de escribir (segundos)
+VENTANA_ESCRITURA = 0.02
+
+class Cambios:
+    """
+    Lo que un pedido cambio: codigos de productos modificados o agregados (fila y lotes),
+    codigos eliminados, movimientos nuevos y transferencias enviadas a otras ubicaciones
+    (pares (destino, df) que se anotan en la bandeja del destino despues de guardar).
+    """
+
+    def __init__(self, productos=(), eliminados=(), movimientos=None, transferencias=()):
+        self.productos = set(productos)
+        self.eliminados = set(eliminados)
+        self.movimientos = [] if movimientos is None else [movimientos]
+        self.transferencias = list(transferencias)
+
+    @classmethod
+    def unir(cls, lista):
+        """
+        Junta varios pedidos en uno. Un codigo puede quedar en productos y en eliminados a la vez
+        (agregado y eliminado en el mismo lote): lo resuelve quien arma la foto mirando si la fila existe.
+        """
+        union = cls()
+        for cambios in lista:
+            union.productos |= cambios.productos
+            union.eliminados |= cambios.eliminados
+            union.movimientos.extend(cambios.movimientos)
+            union.transferencias.extend(cambios.transferencias)
+        return union
+
+class ColaEscritura:
+    """
+    Hilo escritor unico. Por cada lote llama a preparar(cambios) con lock_datos tomado (debe copiar
+    lo que hay que guardar) y despues a guardar(foto) sin el lock, para no frenar a las sesiones.
+    encolar tambien se llama con lock_datos tomado: asi el lote y la foto siempre coinciden.
+    """
+
+    def __init__(self, lock_datos, preparar, guardar, ventana=VENTANA_ESCRITURA):
+        self._lock_datos = lock_datos
+        self._preparar = preparar
+        self._guardar = guardar
+        self.ventana = ventana
+        self._cola = queue.Queue()
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._ultima = None
+        self._hilo = None
+
+    def encolar(self, cambios):
+        """
+        Encola los cambios y devuelve un Future que se completa cuando quedaron en disco
+        (o con la excepcion si la escritura fallo).
+        """
+        confirmacion = Future()
+        with self._lock:
+            self._pendientes += 1
+            self._ultima = confirmacion
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._trabajar, name="escritor-inventario", daemon=True)
+                self._hilo.start()
+        self._cola.put((cambios, confirmacion))
+        return confirmacion
+
+    def al_vaciarse(self, funcion):
+        """
+        Llama a funcion cuando todo lo encolado hasta ahora quedo guardado (o fallo): enseguida si
+        no hay nada pendiente, si no desde el hilo escritor.
+        """
+        with self._lock:
+            ultima = self._ultima if self._pendientes else None
+        if ultima is None:
+            funcion()
+        else:
+            # Los lotes se guardan en orden: cuando termina el ultimo pedido terminaron todos
+            ultima.add_done_callback(lambda _: funcion())
+
+    def ocupada(self):
+        """
+        True si hay cambios encolados o escribiendose (el disco va detras de la memoria).
+        """
+        with self._lock:
+            return self._pendientes > 0
+
+    def _juntar_lote(self):
+        lote = [self._cola.get()]
+        limite = time.monotonic() + self.ventana
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _trabajar(self):
+        while True:
+            lote = self._juntar_lote()
+            try:
+                with self._lock_datos:
+                    # Lo que llego mientras se esperaba el lock entra en este mismo lote
+                    while True:
+                        try:
+                            lote.append(self._cola.get_nowait())
+                        except queue.Empty:
+                            break
+                    foto = self._preparar(Cambios.unir([cambios for cambios, _ in lote]))
+                self._guardar(foto)
+                error = None
+            except Exception as e:
+                error = e
+            # Antes de confirmar: quien reciba la confirmacion ya ve la cola libre (ver al_vaciarse)
+            with self._lock:
+                self._pendientes -= len(lote)
+            for _, confirmacion in lote:
+                if error is None:
+                    confirmacion.set_result(len(lote))
+                else:
+                    confirmacion.set_exception(error)
+
+# --- Bloqueo entre procesos ---
+
+_BLOQUEOS = {}
+_lock_bloqueos = threading.Lock()
+
+def bloqueo_de(ruta):
+    """
+    El BloqueoEntreProcesos de ruta, uno solo por proceso: dos descriptores del mismo archivo se
+    bloquearian entre si aunque sean del mismo proceso.
+    """
+    ruta = os.path.abspath(ruta)
+    with _lock_bloqueos:
+        if ruta not in _BLOQUEOS:
+            _BLOQUEOS[ruta] = BloqueoEntreProcesos(ruta)
+        return _BLOQUEOS[ruta]
+
+class BloqueoEntreProcesos:
+    """
+    Bloqueo exclusivo sobre un archivo (flock; msvcrt.locking en Windows) para todo el proceso.
+    Cuenta las tomas: el archivo se bloquea con la primera y se libera con la ultima liberacion,
+    que puede hacerla otro hilo (el escritor, cuando guardo). Mientras el proceso lo tiene, los
+    demas esperan en tomar.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._tomas = 0
+        self._archivo = None
+
+    def tomar(self):
+        with self._lock:
+            if self._tomas == 0:
+                if self._archivo is None:
+                    os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+                    self._archivo = open(self.ruta, "a+b")
+                _bloquear(self._archivo)
+            self._tomas += 1
+
+    def soltar(self):
+        with self._lock:
+            self._tomas -= 1
+            if self._tomas == 0:
+                _desbloquear(self._archivo)
+
+def _bloquear(archivo):
+    if fcntl is not None:
+        fcntl.flock(archivo.fileno(), fcntl.LOCK_EX)
+        return
+    archivo.seek(0)
+    while True:
+        try:
+            # LK_LOCK reintenta unos segundos y despues falla: se sigue esperando
+            msvcrt.locking(archivo.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
+
+def _desbloquear(archivo):
+    if fcntl is not None:
+        fcntl.flock(archivo.fileno(), fcntl.LOCK_UN)
+        return
+    archivo.seek(0)
+    msvcrt.locking(archivo.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,150 @@
+"""
+Esquema compacto en memoria de productos y movimientos.
+
+- Textos con pocos valores distintos como categorias (un diccionario de valores y un codigo chico
+  por fila): Tipo, Responsable, Motivo e Id_Transaccion en los movimientos; Categoria y los
+  estados en los productos. Motivo como categoria equivale a internar los textos: cada motivo
+  distinto se guarda una sola vez aunque se repita en miles de filas (lo mismo cada
+  Id_Transaccion, compartido por todas las lineas de un carrito).
+- Codigos de producto y cantidades de los movimientos como int32. El stock de los productos
+  queda en int64: la tabla es chica y se actualiza con operaciones vectorizadas.
+
+Se aplica en preparar_productos / preparar_movimientos (almacenamiento.py), por donde pasa toda
+lectura, asi que load_data, las lecturas incrementales y las instantaneas ya quedan compactas.
+Las filas nuevas se agregan con concatenar, que amplia las categorias en lugar de volver a texto
+(pd.concat de categorias distintas devuelve object). En disco no cambia nada: al guardar se
+escriben los mismos textos y numeros.
+
+    python esquema.py --datos datos_prueba   # memoria antes y despues de compactar
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from estados import ESTADOS_STOCK, ESTADOS_VENCIMIENTO
+from importacion import TIPO_TRANSFERENCIA, TIPOS_MOVIMIENTO
+
+# Columna -> categorias que siempre existen (en ese orden; las demas se agregan al encontrarlas).
+# "" va siempre en las columnas que se rellenan con fillna("").
+CATEGORIAS_PRODUCTO = {"Categoria": [], "Estado (Stock)": ESTADOS_STOCK, "Estado (Vencimiento)": ESTADOS_VENCIMIENTO}
+CATEGORIAS_MOVIMIENTO = {"Tipo": TIPOS_MOVIMIENTO + [TIPO_TRANSFERENCIA], "Responsable": [""], "Motivo": [""],
+                         "Id_Transaccion": [""]}
+
+ENTEROS_PRODUCTO = ["Codigo"]
+ENTEROS_MOVIMIENTO = ["Codigo_Producto", "Cantidad"]
+TIPO_ENTERO = np.int32
+
+def _categorizar(serie, fijas):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        faltantes = [c for c in fijas if c not in serie.cat.categories]
+        return serie.cat.add_categories(faltantes) if faltantes else serie
+    # astype("category") y despues reordenar las categorias (pocas) es mucho mas rapido que
+    # pasar la lista de categorias al construir
+    serie = serie.astype("category")
+    conocidas = set(fijas)
+    otras = sorted((v for v in serie.cat.categories if v not in conocidas), key=str)
+    return serie.cat.set_categories(list(fijas) + otras)
+
+def _entero_compacto(serie):
+    """
+    La serie en TIPO_ENTERO si es entera y sus valores entran; si no, sin cambios.
+    """
+    if not pd.api.types.is_integer_dtype(serie.dtype) or serie.dtype == TIPO_ENTERO:
+        return serie
+    limites = np.iinfo(TIPO_ENTERO)
+    if len(serie) and (serie.min() < limites.min or serie.max() > limites.max):
+        return serie
+    return serie.astype(TIPO_ENTERO)
+
+def _compactar(df, categorias, enteros):
+    for columna, fijas in categorias.items():
+        if columna in df.columns:
+            df[columna] = _categorizar(df[columna], fijas)
+    for columna in enteros:
+        if columna in df.columns:
+            df[columna] = _entero_compacto(df[columna])
+    return df
+
+def compactar_productos(df_productos):
+    """
+    Pasa df_productos al esquema compacto (en el lugar; tambien lo devuelve). Las columnas de
+    estado que falten se crean vacias, ya como categorias (las completa actualizar_estados).
+    """
+    for columna in ("Estado (Stock)", "Estado (Vencimiento)"):
+        if columna not in df_productos.columns:
+            df_productos[columna] = pd.Series(np.nan, index=df_productos.index, dtype=object)
+    return _compactar(df_productos, CATEGORIAS_PRODUCTO, ENTEROS_PRODUCTO)
+
+def compactar_movimientos(df_movimientos):
+    return _compactar(df_movimientos, CATEGORIAS_MOVIMIENTO, ENTEROS_MOVIMIENTO)
+
+def concatenar(df, df_nuevos):
+    """
+    pd.concat([df, df_nuevos], ignore_index=True) que conserva los tipos compactos de df: las
+    categorias se amplian con los valores nuevos y los enteros nuevos se pasan al tipo de df.
+    Las columnas de texto de df que faltan en df_nuevos (las categorias que incluyen "") se
+    completan con "", como al leerlas del archivo.
+    """
+    df_nuevos = df_nuevos.copy()
+    for columna in df.columns.difference(df_nuevos.columns):
+        tipo = df[columna].dtype
+        if isinstance(tipo, pd.CategoricalDtype) and "" in tipo.categories:
+            df_nuevos[columna] = ""
+    ampliadas = {}
+    for columna in df.columns.intersection(df_nuevos.columns):
+        tipo = df[columna].dtype
+        if isinstance(tipo, pd.CategoricalDtype):
+            valores = df_nuevos[columna].dropna().unique()
+            nuevas = [v for v in valores if v not in tipo.categories]
+            if nuevas:
+                ampliadas[columna] = df[columna].cat.add_categories(nuevas)
+                tipo = ampliadas[columna].dtype
+            df_nuevos[columna] = pd.Categorical(df_nuevos[columna], dtype=tipo)
+        elif tipo == TIPO_ENTERO and pd.api.types.is_integer_dtype(df_nuevos[columna].dtype):
+            compacta = _entero_compacto(df_nuevos[columna])
+            if compacta.dtype == TIPO_ENTERO:
+                df_nuevos[columna] = compacta
+    if ampliadas:
+        df = df.assign(**ampliadas)
+    return pd.concat([df, df_nuevos], ignore_index=True)
+
+def asignar_categoria(df, idx, columna, valor):
+    """
+    df.at[idx, columna] = valor, agregando valor a las categorias de la columna si hace falta.
+    """
+    if isinstance(df[columna].dtype, pd.CategoricalDtype) and pd.notna(valor) and valor not in df[columna].cat.categories:
+        df[columna] = df[columna].cat.add_categories([valor])
+    df.at[idx, columna] = valor
+
+def memoria_mb(df):
+    """
+    Memoria del DataFrame en MB, contando el contenido de los textos.
+    """
+    return df.memory_usage(deep=True).sum() / 2 ** 20
+
+def sin_compactar(df):
+    """
+    Copia de df con las categorias como texto y los enteros en int64: la representacion anterior
+    al esquema compacto, para comparar memoria.
+    """
+    df = df.copy()
+    for columna in df.columns:
+        tipo = df[columna].dtype
+        if isinstance(tipo, pd.CategoricalDtype):
+            df[columna] = df[columna].astype(tipo.categories.dtype)
+        elif tipo == TIPO_ENTERO:
+            df[columna] = df[columna].astype(np.int64)
+    return df
+
+if __name__ == "__main__":
+    from datos_sinteticos import almacenamiento_en
+
+    parser = argparse.ArgumentParser(description="Memoria de productos y movimientos antes y despues de compactar")
+    parser.add_argument("--datos", default=".", help="Directorio con Productos.csv y Movimientos.csv")
+    args = parser.parse_args()
+
+    almacenamiento = almacenamiento_en(args.datos, instantaneas=False)
+    for nombre, df in (("Productos", almacenamiento.leer_productos()), ("Movimientos", almacenamiento.leer_movimientos())):
+        antes, despues = memoria_mb(sin_compactar(df)), memoria_mb(df)
+        print(f"{nombre:<12} {len(df):>10} filas  {antes:10.1f} MB -> {despues:8.1f} MB  ({despues / antes:.0%})")
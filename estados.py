@@ -0,0 +1,97 @@
+"""
+Estados calculados de los productos: 'Estado (Stock)' y 'Estado (Vencimiento)'.
+
+No se guardan (ver COLUMNAS_DERIVADAS en almacenamiento.py): se recalculan en memoria, solo en
+las filas cuyas columnas de origen cambiaron desde la ultima vez.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+COLUMNAS_ESTADO = ["Stock_Actual", "Stock_Minimo", "Fecha_Vencimiento"]
+
+# Dias antes del vencimiento en que un producto pasa a "PROXIMO A VENCER"
+DIAS_PROXIMO_VENCIMIENTO = 7
+
+# Valores posibles de cada estado (son las categorias de las columnas, ver esquema.py)
+ESTADOS_STOCK = ["🔴 CRITICO", "🟡 ADVERTENCIA", "🟢 OPTIMO"]
+ESTADOS_VENCIMIENTO = ["⚪ N/A", "🔴 VENCIDO", "🟡 PROXIMO A VENCER", "🟢 OK"]
+
+def _filas_cambiadas(claves, previas, columnas):
+    cambiadas = np.zeros(len(claves), dtype=bool)
+    for columna in columnas:
+        actual = claves[columna].to_numpy()
+        previa = previas[columna].to_numpy()
+        cambiadas |= ~((actual == previa) | (pd.isna(actual) & pd.isna(previa)))
+    return pd.Series(cambiadas, index=claves.index)
+
+def actualizar_estados(df_productos, foto=None, vistas=None):
+    """
+    Calcula 'Estado (Stock)' y 'Estado (Vencimiento)' de forma vectorizada, solo en las filas necesarias.
+    foto es lo que devolvio la llamada anterior (dia y columnas de las que dependen los estados):
+    se recalculan las filas cuyo stock, stock minimo o vencimiento cambiaron, y todos los
+    vencimientos solo cuando cambia el dia. Sin foto se recalcula todo. Devuelve la foto nueva.
+    vistas (VistasAlertas, opcional) se actualiza con los productos recalculados.
+    """
+    if df_productos.empty:
+        for columna in ['Estado (Stock)', 'Estado (Vencimiento)']:
+            if columna not in df_productos.columns:
+                df_productos[columna] = ""
+        if vistas is not None:
+            vistas.vaciar()
+        return None
+
+    hoy = pd.Timestamp(datetime.now().date())
+    
+    if not pd.api.types.is_datetime64_any_dtype(df_productos['Fecha_Vencimiento']):
+        df_productos['Fecha_Vencimiento'] = pd.to_datetime(df_productos['Fecha_Vencimiento']).dt.normalize()
+    
+    claves = df_productos[COLUMNAS_ESTADO]
+    
+    if foto is None or 'Estado (Stock)' not in df_productos.columns or 'Estado (Vencimiento)' not in df_productos.columns:
+        filas_stock = slice(None)
+        filas_venc = slice(None)
+        if vistas is not None:
+            vistas.vaciar()
+    else:
+        dia_previo, previas = foto
+        if not previas.index.equals(df_productos.index):
+            previas = previas.reindex(df_productos.index)
+        filas_stock = _filas_cambiadas(claves, previas, ["Stock_Actual", "Stock_Minimo"]) | df_productos['Estado (Stock)'].isna()
+        if dia_previo != hoy:
+            filas_venc = slice(None)
+        else:
+            filas_venc = _filas_cambiadas(claves, previas, ["Fecha_Vencimiento"]) | df_productos['Estado (Vencimiento)'].isna()
+            if not filas_venc.any():
+                filas_venc = None
+        if not filas_stock.any():
+            filas_stock = None
+        if filas_stock is None and filas_venc is None:
+            return foto
+    
+    if filas_stock is not None:
+        stock = df_productos.loc[filas_stock, 'Stock_Actual']
+        minimo = df_productos.loc[filas_stock, 'Stock_Minimo']
+        df_productos.loc[filas_stock, 'Estado (Stock)'] = np.select(
+            [stock < minimo, stock < (minimo * 1.5)],
+            ESTADOS_STOCK[:2],
+            default=ESTADOS_STOCK[2]
+        )
+        if vistas is not None:
+            vistas.actualizar_stock(df_productos.loc[filas_stock, 'Codigo'].to_numpy(),
+                                    df_productos.loc[filas_stock, 'Estado (Stock)'].to_numpy())
+    
+    if filas_venc is not None:
+        fecha = df_productos.loc[filas_venc, 'Fecha_Vencimiento']
+        dias_para_vencer = (fecha - hoy).dt.days
+        df_productos.loc[filas_venc, 'Estado (Vencimiento)'] = np.select(
+            [fecha.isna(), dias_para_vencer < 0, dias_para_vencer <= DIAS_PROXIMO_VENCIMIENTO],
+            ESTADOS_VENCIMIENTO[:3],
+            default=ESTADOS_VENCIMIENTO[3]
+        )
+        if vistas is not None:
+            # El calendario no depende del dia: al cambiar el dia no hay nada que mover
+            vistas.actualizar_vencimientos(df_productos.loc[filas_venc, 'Codigo'].to_numpy(), fecha.to_numpy())
+    
+    return hoy, claves.copy()
@@ -0,0 +1,79 @@
+"""
+Indice del historial de movimientos ordenado por fecha (de la mas nueva a la mas vieja).
+
+El historial solo crece al final, asi que el orden no se recalcula: las filas nuevas se ordenan
+entre si y se intercalan en el indice existente con una busqueda binaria. Un rango de fechas es
+un tramo contiguo del indice y una pagina es un corte de ese tramo, de modo que mostrar una
+pagina solo materializa sus filas, sin copiar ni ordenar el historial completo.
+"""
+import numpy as np
+import pandas as pd
+
+_MAXIMO = np.iinfo(np.int64).max
+_MINIMO = np.iinfo(np.int64).min
+
+def _claves(fechas):
+    """
+    Clave ascendente equivalente a Fecha descendente; las fechas vacias (NaT) van al final.
+    """
+    valores = np.asarray(fechas, dtype="datetime64[ns]").view(np.int64)
+    return np.where(valores == _MINIMO, _MAXIMO, -valores)
+
+class IndiceHistorial:
+    """
+    Posiciones de df_movimientos en orden de Fecha descendente; a igual fecha, primero la ultima registrada.
+    """
+
+    def __init__(self):
+        self._posiciones = np.empty(0, dtype=np.int64)
+        self._claves = np.empty(0, dtype=np.int64)
+        self._filas = 0
+
+    def actualizar(self, df_movimientos):
+        """
+        Agrega al indice las filas nuevas de df_movimientos (las posteriores a la ultima llamada).
+        """
+        total = len(df_movimientos)
+        if total < self._filas:
+            self.__init__()
+        if total == self._filas:
+            return
+
+        posiciones = np.arange(self._filas, total, dtype=np.int64)
+        claves = _claves(df_movimientos["Fecha"].to_numpy()[self._filas:total])
+        orden = np.lexsort((-posiciones, claves))
+        posiciones, claves = posiciones[orden], claves[orden]
+
+        # side='left': a igual fecha, las filas nuevas quedan antes que las que ya estaban
+        donde = np.searchsorted(self._claves, claves, side="left")
+        self._posiciones = np.insert(self._posiciones, donde, posiciones)
+        self._claves = np.insert(self._claves, donde, claves)
+        self._filas = total
+
+    def posiciones(self, df_movimientos, desde=None, hasta=None, codigos=None):
+        """
+        Posiciones (ya ordenadas) de los movimientos entre desde y hasta y, si se indica, de esos codigos.
+        """
+        inicio, fin = 0, len(self._claves)
+        if hasta is not None:
+            inicio = np.searchsorted(self._claves, _claves([pd.Timestamp(hasta).to_datetime64()])[0], side="left")
+        if desde is not None:
+            fin = np.searchsorted(self._claves, _claves([pd.Timestamp(desde).to_datetime64()])[0], side="right")
+        posiciones = self._posiciones[inicio:fin]
+        if codigos is not None:
+            posiciones = posiciones[np.isin(df_movimientos["Codigo_Producto"].to_numpy()[posiciones], list(codigos))]
+        return posiciones
+
+    def contar(self, df_movimientos, desde=None, hasta=None, codigos=None):
+        return len(self.posiciones(df_movimientos, desde, hasta, codigos))
+
+    def pagina(self, df_movimientos, numero, tamano, desde=None, hasta=None, codigos=None, columnas=None):
+        """
+        Devuelve (filas de la pagina numero (desde 0) ya ordenadas, total de movimientos que cumplen el filtro).
+        """
+        posiciones = self.posiciones(df_movimientos, desde, hasta, codigos)
+        visibles = posiciones[numero * tamano:(numero + 1) * tamano]
+        df_pagina = df_movimientos.iloc[visibles]
+        if columnas is not None:
+            df_pagina = df_pagina[[c for c in columnas if c in df_pagina.columns]]
+        return df_pagina.reset_index(drop=True), len(posiciones)
@@ -0,0 +1,201 @@
+"""
+Importacion masiva de movimientos desde un archivo CSV (separado por ';' o ',') o XLSX.
+
+Columnas del archivo (mismos nombres que Movimientos.csv):
+- Codigo_Producto, Tipo (Entrada / Salida / Ajuste) y Cantidad: obligatorias.
+- Responsable: si falta o esta vacia se usa el responsable indicado al importar.
+- Motivo: obligatoria en los Ajustes.
+- Vencimiento_Lote: vencimiento del lote de cada Entrada (vacia = sin vencimiento).
+- Fecha: opcional, por defecto la fecha de la importacion.
+- Id_Transaccion: opcional; lo comparten los movimientos registrados juntos (ver nuevo_id_transaccion).
+  No puede empezar con PREFIJO_CONCILIACION.
+
+Todo el archivo se valida junto antes de tocar el inventario: si hay un error no se aplica nada.
+Despues los movimientos se aplican (el stock de una vez por producto, los lotes en el orden del archivo) y se guardan
+con una sola escritura.
+"""
+import io
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from lotes import sincronizar_producto, vencimiento_producto
+
+TIPOS_MOVIMIENTO = ["Entrada", "Salida", "Ajuste"]
+# Movimiento entre ubicaciones (ver ubicaciones.py): no se importa, lo arma AlmacenDatos.transferir.
+# Trae su signo como el Ajuste, asi que las cuentas de stock (Salida resta, el resto suma) no cambian.
+TIPO_TRANSFERENCIA = "Transferencia"
+# Ajustes de conciliacion.py: corrigen el historial, no son mermas ni ajustes reales. Se reconocen
+# por el prefijo de su Id_Transaccion, que no se acepta al importar (el Motivo es texto libre)
+MOTIVO_CONCILIACION = "Conciliacion de stock"
+PREFIJO_CONCILIACION = "CONCILIACION-"
+COLUMNAS_OBLIGATORIAS = ["Codigo_Producto", "Tipo", "Cantidad"]
+COLUMNAS_IMPORTADAS = ["Fecha", "Codigo_Producto", "Tipo", "Cantidad", "Responsable", "Motivo", "Vencimiento_Lote",
+                       "Id_Transaccion"]
+
+def nuevo_id_transaccion():
+    """
+    Id de un grupo de movimientos que se registran juntos (un carrito de la app): fecha y hora mas
+    un sufijo al azar, como el de las transferencias.
+    """
+    return f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+def id_conciliacion():
+    return PREFIJO_CONCILIACION + nuevo_id_transaccion()
+
+def es_conciliacion(df_movimientos):
+    """
+    Mascara de los movimientos que agrego conciliacion.py --corregir.
+    """
+    return df_movimientos["Id_Transaccion"].astype(str).str.startswith(PREFIJO_CONCILIACION)
+
+def leer_archivo_movimientos(contenido, nombre_archivo):
+    """
+    Lee el archivo subido (bytes) segun su extension. Todas las columnas se leen como texto.
+    Lanza ValueError si el formato no se puede leer.
+    """
+    if nombre_archivo.lower().endswith(".xls"):
+        raise ValueError("Los archivos .xls no se pueden importar: guardelo como .xlsx o .csv.")
+    if nombre_archivo.lower().endswith(".xlsx"):
+        try:
+            df = pd.read_excel(io.BytesIO(contenido), dtype=str)
+        except ImportError:
+            raise ValueError("Para importar archivos XLSX hay que instalar 'openpyxl' (pip install openpyxl).")
+    else:
+        # sep=None detecta si el archivo viene separado por ';' o por ','
+        df = pd.read_csv(io.BytesIO(contenido), sep=None, engine="python", dtype=str, encoding="utf-8-sig")
+    df.columns = df.columns.str.strip()
+    return df
+
+def _texto(df, columna):
+    if columna not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[columna].fillna("").astype(str).str.strip()
+
+def stock_proyectado(df_productos, codigos, delta):
+    """
+    Stock de cada producto despues de cada movimiento, en el orden dado: codigos y delta (la
+    cantidad con signo) son Series alineadas. Los codigos que no estan en df_productos dan NaN.
+    """
+    stock_inicial = codigos.map(df_productos.set_index('Codigo')['Stock_Actual'])
+    return stock_inicial + delta.groupby(codigos, sort=False).cumsum()
+
+def validar_movimientos(df_archivo, df_productos, responsable_por_defecto="", fecha_actual=None):
+    """
+    Normaliza y valida todos los movimientos del archivo contra el stock actual.
+    Devuelve (df_movimientos, errores): errores es un DataFrame con la fila del archivo y el problema.
+    El stock se proyecta fila a fila por producto, asi que una Salida puede usar lo que entra antes
+    en el mismo archivo.
+    """
+    faltantes = [c for c in COLUMNAS_OBLIGATORIAS if c not in df_archivo.columns]
+    if faltantes:
+        errores = pd.DataFrame({"Fila": [0], "Error": [f"Faltan columnas obligatorias: {', '.join(faltantes)}"]})
+        return None, errores
+
+    if fecha_actual is None:
+        fecha_actual = pd.Timestamp.now().normalize()
+
+    # Fila 2 = primera linea de datos (la 1 es el encabezado)
+    filas = pd.Series(np.arange(2, len(df_archivo) + 2), index=df_archivo.index)
+    df = pd.DataFrame(index=df_archivo.index)
+
+    fechas = pd.to_datetime(_texto(df_archivo, "Fecha").replace("", None), dayfirst=True, errors='coerce').dt.normalize()
+    df["Fecha"] = fechas.fillna(fecha_actual)
+    df["Codigo_Producto"] = pd.to_numeric(_texto(df_archivo, "Codigo_Producto"), errors='coerce')
+    # Se acepta el tipo sin importar mayusculas ("salida", "SALIDA")
+    df["Tipo"] = _texto(df_archivo, "Tipo").str.capitalize()
+    df["Cantidad"] = pd.to_numeric(_texto(df_archivo, "Cantidad"), errors='coerce')
+    df["Responsable"] = _texto(df_archivo, "Responsable").replace("", responsable_por_defecto.strip())
+    df["Motivo"] = _texto(df_archivo, "Motivo")
+    df["Id_Transaccion"] = _texto(df_archivo, "Id_Transaccion")
+    vencimientos = _texto(df_archivo, "Vencimiento_Lote")
+    df["Vencimiento_Lote"] = pd.to_datetime(vencimientos.replace("", None), dayfirst=True, errors='coerce').dt.normalize()
+
+    codigos_validos = df_productos['Codigo']
+    es_entrada = df["Tipo"] == "Entrada"
+    es_salida = df["Tipo"] == "Salida"
+    es_ajuste = df["Tipo"] == "Ajuste"
+    cantidad_entera = df["Cantidad"].notna() & (df["Cantidad"] == df["Cantidad"].round())
+
+    problemas = [
+        (df["Codigo_Producto"].isna(), "Codigo_Producto vacio o no numerico."),
+        (df["Codigo_Producto"].notna() & ~df["Codigo_Producto"].isin(codigos_validos), "El producto no existe."),
+        (~df["Tipo"].isin(TIPOS_MOVIMIENTO), "Tipo invalido (debe ser Entrada, Salida o Ajuste)."),
+        (~cantidad_entera, "Cantidad vacia o no entera."),
+        (cantidad_entera & (es_entrada | es_salida) & (df["Cantidad"] <= 0), "La cantidad debe ser mayor a cero."),
+        (cantidad_entera & es_ajuste & (df["Cantidad"] == 0), "La cantidad del ajuste no puede ser cero."),
+        (es_ajuste & (df["Motivo"] == ""), "Falta el motivo del ajuste."),
+        (df["Responsable"] == "", "Falta el responsable."),
+        ((vencimientos != "") & df["Vencimiento_Lote"].isna() & es_entrada, "Vencimiento_Lote no es una fecha valida."),
+        ((_texto(df_archivo, "Fecha") != "") & fechas.isna(), "Fecha no es una fecha valida."),
+        (df["Id_Transaccion"].str.startswith(PREFIJO_CONCILIACION), f"Id_Transaccion no puede empezar con '{PREFIJO_CONCILIACION}'."),
+    ]
+    errores = [
+        pd.DataFrame({"Fila": filas[mascara], "Error": mensaje})
+        for mascara, mensaje in problemas if mascara.any()
+    ]
+
+    # --- Stock proyectado por producto, en el orden del archivo ---
+    validas = df["Codigo_Producto"].isin(codigos_validos) & df["Tipo"].isin(TIPOS_MOVIMIENTO) & cantidad_entera
+    if validas.any():
+        signo = np.where(es_salida[validas], -1, 1)
+        delta = pd.Series(df.loc[validas, "Cantidad"].to_numpy() * signo, index=df.index[validas])
+        proyectado = stock_proyectado(df_productos, df.loc[validas, "Codigo_Producto"], delta)
+        sin_stock = es_salida[validas] & (proyectado < 0)
+        if sin_stock.any():
+            filas_sin_stock = sin_stock.index[sin_stock]
+            disponible = proyectado[filas_sin_stock] + df.loc[filas_sin_stock, "Cantidad"]
+            errores.append(pd.DataFrame({
+                "Fila": filas[filas_sin_stock],
+                "Error": [f"No hay stock suficiente. Stock disponible en ese momento: {d:g}" for d in disponible],
+            }))
+
+    if errores:
+        errores = pd.concat(errores).sort_values("Fila", kind="stable").reset_index(drop=True)
+    else:
+        errores = pd.DataFrame(columns=["Fila", "Error"])
+
+    if errores.empty:
+        df["Codigo_Producto"] = df["Codigo_Producto"].astype(df_productos['Codigo'].dtype)
+        df["Cantidad"] = df["Cantidad"].astype(np.int64)
+        df.loc[~es_entrada, "Vencimiento_Lote"] = pd.NaT
+    return df[COLUMNAS_IMPORTADAS].reset_index(drop=True), errores
+
+def aplicar_movimientos(df_productos, libro, df_movimientos):
+    """
+    Aplica movimientos ya validados: el stock de cada producto se actualiza de una vez con la suma
+    de sus movimientos y los lotes se recorren en el orden de los movimientos.
+    Devuelve los indices de df_productos tocados.
+    """
+    signo = np.where(df_movimientos["Tipo"] == "Salida", -1, 1)
+    delta = pd.Series(df_movimientos["Cantidad"].to_numpy() * signo).groupby(df_movimientos["Codigo_Producto"], sort=False).sum()
+
+    posiciones = pd.Series(df_productos.index, index=df_productos['Codigo'])
+    indices = posiciones.loc[delta.index].to_numpy()
+    df_productos.loc[indices, 'Stock_Actual'] = df_productos.loc[indices, 'Stock_Actual'].to_numpy() + delta.to_numpy()
+
+    # Fecha_Entrada = fecha de la ultima Entrada de cada producto
+    entradas = df_movimientos[df_movimientos["Tipo"] == "Entrada"]
+    if not entradas.empty:
+        ultima_entrada = entradas.groupby("Codigo_Producto", sort=False)["Fecha"].max()
+        df_productos.loc[posiciones.loc[ultima_entrada.index].to_numpy(), 'Fecha_Entrada'] = ultima_entrada.to_numpy()
+
+    # Los lotes dependen del orden (FEFO) solo dentro de cada producto: alcanza con recorrer las
+    # filas en el orden del archivo, sin agrupar
+    filas = zip(df_movimientos["Codigo_Producto"].tolist(), df_movimientos["Tipo"].tolist(),
+                df_movimientos["Cantidad"].tolist(), df_movimientos["Vencimiento_Lote"].tolist())
+    for codigo, tipo, cantidad, vencimiento in filas:
+        if tipo == "Entrada":
+            libro.agregar(codigo, cantidad, vencimiento)
+        elif tipo == "Salida":
+            libro.consumir(codigo, cantidad)
+        elif tipo == TIPO_TRANSFERENCIA:
+            libro.trasladar(codigo, cantidad, vencimiento)
+        else:
+            libro.ajustar(codigo, cantidad, vencimiento_producto(df_productos, posiciones.at[codigo], libro))
+
+    for idx in indices:
+        sincronizar_producto(df_productos, idx, libro)
+    return indices.tolist()
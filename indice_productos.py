@@ -0,0 +1,109 @@
+"""
+Indices de productos por Codigo, Nombre exacto y Nombre normalizado (sin espacios en los extremos
+y sin distinguir mayusculas). Se mantienen al agregar, editar o eliminar un producto, asi que
+buscar una fila o comprobar si un nombre ya existe cuesta O(1) en vez de recorrer df_productos.
+
+Las listas que las paginas derivan del catalogo (nombres ordenados, categorias) se arman una vez
+por version del indice en un Catalogo, y no en cada rerun de la app.
+"""
+
+def normalizar_nombre(nombre):
+    return str(nombre).strip().casefold()
+
+class IndiceProductos:
+    """
+    posicion: Codigo -> etiqueta de la fila en df_productos.
+    codigo_por_nombre / nombre_por_codigo: los mapas que usan las paginas (nombre <-> codigo).
+    codigo_por_normalizado: Nombre normalizado -> Codigo, para detectar duplicados.
+    version: sube con cada cambio (recarga, alta, edicion o baja de un producto).
+    """
+
+    def __init__(self, df_productos=None):
+        self.version = 0
+        self.posicion = {}
+        self.codigo_por_nombre = {}
+        self.nombre_por_codigo = {}
+        self.codigo_por_normalizado = {}
+        if df_productos is not None:
+            self.reconstruir(df_productos)
+
+    def reconstruir(self, df_productos):
+        self.version += 1
+        codigos = df_productos['Codigo'].tolist()
+        nombres = df_productos['Nombre'].tolist()
+        self.posicion = dict(zip(codigos, df_productos.index))
+        self.codigo_por_nombre = dict(zip(nombres, codigos))
+        self.nombre_por_codigo = dict(zip(codigos, nombres))
+        self.codigo_por_normalizado = {normalizar_nombre(nombre): codigo for nombre, codigo in zip(nombres, codigos)}
+
+    # --- Consultas ---
+
+    def fila(self, codigo):
+        """
+        Etiqueta de la fila del producto en df_productos, o None si no existe.
+        """
+        return self.posicion.get(codigo)
+
+    def fila_por_nombre(self, nombre):
+        codigo = self.codigo_por_nombre.get(nombre)
+        return None if codigo is None else self.posicion.get(codigo)
+
+    def existe_nombre(self, nombre):
+        """
+        True si ya hay un producto con ese nombre, sin importar mayusculas ni espacios en los extremos.
+        """
+        return normalizar_nombre(nombre) in self.codigo_por_normalizado
+
+    # --- Cambios ---
+
+    def _quitar_nombre(self, codigo):
+        nombre = self.nombre_por_codigo.pop(codigo, None)
+        if nombre is None:
+            return
+        # Con nombres repetidos (datos viejos) la clave puede ser de otro producto: no se toca
+        if self.codigo_por_nombre.get(nombre) == codigo:
+            del self.codigo_por_nombre[nombre]
+        normalizado = normalizar_nombre(nombre)
+        if self.codigo_por_normalizado.get(normalizado) == codigo:
+            del self.codigo_por_normalizado[normalizado]
+
+    def agregar(self, idx, codigo, nombre):
+        self.version += 1
+        self.posicion[codigo] = idx
+        self.codigo_por_nombre[nombre] = codigo
+        self.nombre_por_codigo[codigo] = nombre
+        self.codigo_por_normalizado[normalizar_nombre(nombre)] = codigo
+
+    def actualizar(self, idx, codigo, nombre):
+        """
+        Reindexa la fila idx despues de una edicion (solo cambia algo si cambio el nombre). La
+        version sube igual: la edicion pudo cambiar la categoria.
+        """
+        self.version += 1
+        if self.nombre_por_codigo.get(codigo) != nombre:
+            self._quitar_nombre(codigo)
+            self.agregar(idx, codigo, nombre)
+
+    def eliminar(self, codigo, df_productos):
+        """
+        Quita el producto. df_productos ya no tiene la fila y fue renumerado (reset_index),
+        asi que las posiciones se vuelven a tomar de ahi.
+        """
+        self.version += 1
+        self._quitar_nombre(codigo)
+        self.posicion = dict(zip(df_productos['Codigo'].tolist(), df_productos.index))
+
+class Catalogo:
+    """
+    Lo que las paginas derivan del catalogo en una version dada del indice: los nombres en el orden
+    de df_productos y ordenados, las categorias y los mapas nombre <-> codigo. No se modifica nunca
+    (si el catalogo cambia se arma otro), asi que se puede usar sin el lock del almacen.
+    """
+
+    def __init__(self, df_productos, indice):
+        self.version = indice.version
+        self.nombres = df_productos['Nombre'].tolist()
+        self.nombres_ordenados = sorted(indice.codigo_por_nombre)
+        self.categorias = sorted(df_productos['Categoria'].dropna().unique()) if 'Categoria' in df_productos.columns else []
+        self.codigo_por_nombre = dict(indice.codigo_por_nombre)
+        self.nombre_por_codigo = dict(indice.nombre_por_codigo)
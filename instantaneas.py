@@ -0,0 +1,87 @@
+"""
+Instantaneas binarias (Feather) de los CSV ya leidos y preparados, para no volver a parsearlos
+en cada arranque.
+
+    instantaneas/Productos.feather   Productos.csv despues de preparar_productos
+    instantaneas/Movimientos.feather Movimientos.csv despues de preparar_movimientos
+    instantaneas/Lotes.feather       Lotes.csv despues de preparar_lotes
+
+Cada instantanea guarda en sus metadatos la firma del CSV del que salio (tamano, fecha de
+modificacion y los ultimos bytes leidos). Si la firma no coincide, el CSV se vuelve a leer y la
+instantanea se reescribe. Movimientos.csv solo crece al final: si sus bytes hasta el tamano
+guardado siguen iguales se usa la instantanea y se parsean solo las lineas agregadas despues.
+
+Los CSV siguen siendo los datos: la carpeta se puede borrar en cualquier momento. Si una
+instantanea no se puede leer o escribir (tipos que Arrow no admite, disco lleno) se sigue sin ella.
+"""
+import json
+import logging
+import os
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from metricas import METRICAS
+
+DIRECTORIO_INSTANTANEAS = "instantaneas"
+
+# Lineas agregadas a Movimientos.csv desde la instantanea a partir de las cuales se la reescribe
+MINIMO_FILAS_NUEVAS = 5000
+
+# Cambiar si cambia lo que hacen las funciones preparar_* (invalida las instantaneas existentes)
+VERSION_INSTANTANEA = 4
+
+_CLAVE_METADATOS = b"gestor_instantanea"
+
+log = logging.getLogger(__name__)
+
+def ruta_instantanea(directorio, archivo):
+    """
+    Productos.csv -> directorio/Productos.feather
+    """
+    return os.path.join(directorio, os.path.splitext(os.path.basename(archivo))[0] + ".feather")
+
+def leer_instantanea(ruta):
+    """
+    Devuelve (df, metadatos) de la instantanea, o (None, None) si no existe, es de otra version
+    o no se puede leer.
+    """
+    try:
+        tabla = feather.read_table(ruta, memory_map=True)
+        metadatos = json.loads(tabla.schema.metadata[_CLAVE_METADATOS])
+    except FileNotFoundError:
+        return None, None
+    except (OSError, KeyError, TypeError, ValueError, pa.ArrowException) as e:
+        log.warning("Instantanea %s ilegible, se vuelve a leer el CSV: %s", ruta, e)
+        return None, None
+    if metadatos.get("version") != VERSION_INSTANTANEA:
+        return None, None
+    # Las columnas que Arrow entrega sin copiar son de solo lectura y los productos se modifican
+    # en el lugar: se copian (unos ms por millon de filas)
+    return tabla.to_pandas().copy(), metadatos
+
+def guardar_instantanea(ruta, df, **metadatos):
+    """
+    Escribe df con los metadatos dados (deben poder pasarse a JSON). Se escribe en un temporal
+    propio del proceso y se renombra, asi dos procesos nunca dejan una instantanea a medias.
+    """
+    metadatos["version"] = VERSION_INSTANTANEA
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        tabla = tabla.replace_schema_metadata({**(tabla.schema.metadata or {}),
+                                               _CLAVE_METADATOS: json.dumps(metadatos).encode()})
+        # Sin comprimir: la lectura mapea el archivo en memoria sin descomprimir nada
+        feather.write_feather(tabla, temporal, compression="uncompressed")
+        os.replace(temporal, ruta)
+    except (OSError, TypeError, ValueError, pa.ArrowException) as e:
+        log.warning("No se pudo guardar la instantanea %s: %s", ruta, e)
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return False
+    METRICAS.contar("instantaneas_guardadas", tabla=os.path.basename(ruta))
+    return True
+
+def contar_lectura(ruta, acierto):
+    METRICAS.contar("instantaneas_leidas" if acierto else "instantaneas_fallidas", tabla=os.path.basename(ruta))
@@ -0,0 +1,269 @@
+"""
+Lotes FEFO (First Expired, First Out) por producto.
+
+Cada producto tiene N lotes, cada uno con su cantidad y su fecha de vencimiento, guardados en un
+heap ordenado por vencimiento. Una "Salida" o un "Ajuste" negativo consumen desde el lote que vence
+primero: cada lote tocado cuesta O(log n), sin recorrer los demas. La Fecha_Vencimiento del producto
+es una vista del lote vivo mas proximo a vencer.
+
+Las columnas Stock_Viejo_Restante y Fecha_Vencimiento_Pendiente de Productos.csv se siguen
+llenando (cantidad del primer lote y vencimiento del segundo) para no romper el formato del archivo.
+"""
+import heapq
+
+import pandas as pd
+
+COLUMNAS_LOTES = ["Codigo_Producto", "Fecha_Vencimiento", "Cantidad"]
+
+# Los lotes sin vencimiento se consumen al final
+CLAVE_SIN_VENCIMIENTO = 2 ** 63 - 1
+
+class StockInsuficiente(ValueError):
+    def __init__(self, stock_actual):
+        super().__init__(f"Error: No hay stock suficiente. Stock actual: {stock_actual}")
+        self.stock_actual = stock_actual
+
+def _clave(fecha):
+    if pd.isna(fecha):
+        return CLAVE_SIN_VENCIMIENTO
+    return pd.Timestamp(fecha).value
+
+def _fecha_str(fecha):
+    return fecha.strftime('%d-%m-%Y') if pd.notnull(fecha) else "sin vencimiento"
+
+class LibroLotes:
+    """
+    Tabla de lotes de todos los productos.
+    Por producto: un heap de lotes [clave, cantidad, fecha] y un dict clave -> lote para unir
+    entradas con el mismo vencimiento en un solo lote. Los lotes agotados salen del heap.
+    """
+
+    def __init__(self):
+        self._heaps = {}
+        self._por_clave = {}
+        self._totales = {}
+
+    # --- Construccion ---
+
+    @classmethod
+    def desde_dataframe(cls, df_lotes):
+        libro = cls()
+        for codigo, fecha, cantidad in df_lotes[COLUMNAS_LOTES].itertuples(index=False, name=None):
+            if cantidad > 0:
+                libro.agregar(codigo, cantidad, fecha)
+        return libro
+
+    @classmethod
+    def desde_productos(cls, df_productos):
+        """
+        Migra el esquema anterior de dos lotes (Stock_Viejo_Restante / Fecha_Vencimiento_Pendiente).
+        """
+        libro = cls()
+        columnas = ["Codigo", "Stock_Actual", "Fecha_Vencimiento", "Stock_Viejo_Restante", "Fecha_Vencimiento_Pendiente"]
+        for codigo, stock, fecha, viejo, fecha_pendiente in df_productos[columnas].itertuples(index=False, name=None):
+            if pd.isna(stock) or stock <= 0:
+                continue
+            # Stock_Viejo_Restante se lee como float (tiene vacios): los lotes son enteros
+            stock, viejo = int(stock), int(viejo) if pd.notnull(viejo) else 0
+            if viejo > 0 and viejo < stock and pd.notnull(fecha_pendiente):
+                libro.agregar(codigo, viejo, fecha)
+                libro.agregar(codigo, stock - viejo, fecha_pendiente)
+            else:
+                libro.agregar(codigo, stock, fecha)
+        return libro
+
+    # --- Consultas ---
+
+    def stock(self, codigo):
+        return self._totales.get(codigo, 0)
+
+    def cantidad_lotes(self, codigo):
+        return len(self._heaps.get(codigo, ()))
+
+    def vencimiento(self, codigo):
+        """
+        Fecha del lote vivo que vence primero (NaT si no hay lotes o no vence).
+        """
+        heap = self._heaps.get(codigo)
+        return heap[0][2] if heap else pd.NaT
+
+    def resumen(self, codigo):
+        """
+        Devuelve (Fecha_Vencimiento, Stock_Viejo_Restante, Fecha_Vencimiento_Pendiente) del producto.
+        El segundo lote de un heap siempre esta en la posicion 1 o 2.
+        """
+        heap = self._heaps.get(codigo)
+        if not heap:
+            return pd.NaT, 0, pd.NaT
+        if len(heap) == 1:
+            return heap[0][2], 0, pd.NaT
+        segundo = min(heap[1:3])
+        return heap[0][2], heap[0][1], segundo[2]
+
+    def lotes(self, codigo):
+        """
+        Lotes vivos del producto ordenados por vencimiento: lista de (fecha, cantidad).
+        """
+        return [(lote[2], lote[1]) for lote in sorted(self._heaps.get(codigo, ()))]
+
+    def codigos(self):
+        return list(self._heaps)
+
+    def a_dataframe(self, codigos=None):
+        codigos = self._heaps if codigos is None else codigos
+        filas = [
+            (codigo, lote[2], lote[1])
+            for codigo in codigos
+            for lote in self._heaps.get(codigo, ())
+        ]
+        df_lotes = pd.DataFrame(filas, columns=COLUMNAS_LOTES)
+        df_lotes["Cantidad"] = df_lotes["Cantidad"].astype("int64")
+        return df_lotes
+
+    # --- Cambios ---
+
+    def agregar(self, codigo, cantidad, fecha):
+        """
+        Entrada de un lote. Si ya hay un lote con el mismo vencimiento, se suma a ese.
+        """
+        clave = _clave(fecha)
+        por_clave = self._por_clave.setdefault(codigo, {})
+        lote = por_clave.get(clave)
+        if lote is None:
+            lote = [clave, cantidad, pd.Timestamp(fecha).normalize() if pd.notnull(fecha) else pd.NaT]
+            por_clave[clave] = lote
+            heapq.heappush(self._heaps.setdefault(codigo, []), lote)
+        else:
+            lote[1] += cantidad
+        self._totales[codigo] = self._totales.get(codigo, 0) + cantidad
+
+    def consumir(self, codigo, cantidad):
+        """
+        Saca cantidad unidades empezando por el lote que vence primero.
+        Devuelve la lista de (fecha, cantidad) tomada de cada lote y lo que no se pudo cubrir.
+        """
+        heap = self._heaps.get(codigo, [])
+        consumidos = []
+        pendiente = cantidad
+        while pendiente > 0 and heap:
+            lote = heap[0]
+            tomado = min(lote[1], pendiente)
+            lote[1] -= tomado
+            pendiente -= tomado
+            consumidos.append((lote[2], tomado))
+            if lote[1] <= 0:
+                heapq.heappop(heap)
+                del self._por_clave[codigo][lote[0]]
+        self._totales[codigo] = self.stock(codigo) - (cantidad - pendiente)
+        return consumidos, pendiente
+
+    def ajustar(self, codigo, cantidad, fecha_por_defecto=pd.NaT):
+        """
+        Un ajuste positivo se suma al lote que vence primero (o crea uno si no hay);
+        uno negativo consume en orden FEFO.
+        """
+        if cantidad < 0:
+            return self.consumir(codigo, -cantidad)
+        heap = self._heaps.get(codigo)
+        if heap:
+            heap[0][1] += cantidad
+            self._totales[codigo] = self.stock(codigo) + cantidad
+        else:
+            self.agregar(codigo, cantidad, fecha_por_defecto)
+        return [], 0
+
+    def trasladar(self, codigo, cantidad, fecha):
+        """
+        Una linea de Transferencia entre ubicaciones (ver ubicaciones.py): negativa en la que envia,
+        que consume en orden FEFO; positiva en la que recibe, que agrega el lote con su vencimiento.
+        """
+        if cantidad < 0:
+            return self.consumir(codigo, -cantidad)
+        self.agregar(codigo, cantidad, fecha)
+        return [], 0
+
+    def eliminar(self, codigo):
+        self._heaps.pop(codigo, None)
+        self._por_clave.pop(codigo, None)
+        self._totales.pop(codigo, None)
+
+# --- APLICACION DE MOVIMIENTOS ---
+
+def sincronizar_producto(df_productos, idx, libro):
+    """
+    Copia a la fila del producto la vista de sus lotes (vencimiento principal y columnas FEFO).
+    Sin lotes (stock 0) el producto conserva su Fecha_Vencimiento.
+    """
+    codigo = df_productos.at[idx, 'Codigo']
+    fecha, viejo, fecha_pendiente = libro.resumen(codigo)
+    if libro.cantidad_lotes(codigo):
+        df_productos.at[idx, 'Fecha_Vencimiento'] = fecha
+    df_productos.at[idx, 'Stock_Viejo_Restante'] = viejo
+    df_productos.at[idx, 'Fecha_Vencimiento_Pendiente'] = fecha_pendiente
+
+def vencimiento_producto(df_productos, idx, libro):
+    """
+    Vencimiento de un Ajuste positivo: el del lote que vence primero o, sin lotes, la
+    Fecha_Vencimiento del producto.
+    """
+    codigo = df_productos.at[idx, 'Codigo']
+    if libro.cantidad_lotes(codigo):
+        return libro.vencimiento(codigo)
+    return df_productos.at[idx, 'Fecha_Vencimiento']
+
+def aplicar_movimiento(df_productos, idx, libro, tipo_movimiento, cantidad, fecha_actual, fecha_vencimiento_nueva=None):
+    """
+    Aplica un movimiento (Entrada, Salida o Ajuste) al producto de la fila idx y a sus lotes.
+    Devuelve (nuevo_stock, mensaje_extra). Lanza StockInsuficiente si una Salida supera el stock.
+    """
+    codigo = df_productos.at[idx, 'Codigo']
+    stock_actual = df_productos.at[idx, 'Stock_Actual']
+    fecha_venc_actual = libro.vencimiento(codigo)
+
+    nuevo_stock = stock_actual
+    mensaje_extra = ""
+
+    if tipo_movimiento == "Salida":
+        if cantidad > stock_actual:
+            raise StockInsuficiente(stock_actual)
+
+        nuevo_stock = stock_actual - cantidad
+        lotes_antes = libro.cantidad_lotes(codigo)
+        libro.consumir(codigo, cantidad)
+
+        # Si se termino el lote antiguo, la fecha pasa al siguiente lote
+        if 0 < libro.cantidad_lotes(codigo) < lotes_antes:
+            nueva_fecha_str = _fecha_str(libro.vencimiento(codigo))
+            mensaje_extra = f"🎉 ¡Se termino el lote antiguo! La fecha de vencimiento se actualizo automaticamente a: {nueva_fecha_str}"
+
+    elif tipo_movimiento == "Entrada":
+        nuevo_stock = stock_actual + cantidad
+        df_productos.at[idx, 'Fecha_Entrada'] = fecha_actual
+
+        fecha_nueva_dt = pd.to_datetime(fecha_vencimiento_nueva).normalize()
+        libro.agregar(codigo, cantidad, fecha_nueva_dt)
+
+        if stock_actual <= 0 or pd.isna(fecha_venc_actual):
+            mensaje_extra = "Stock estaba en 0. Fecha de vencimiento actualizada."
+        elif fecha_venc_actual == fecha_nueva_dt:
+            mensaje_extra = f"Se sumo al lote existente que vence el {fecha_venc_actual.strftime('%d-%m-%Y')}."
+        elif fecha_venc_actual < fecha_nueva_dt:
+            fecha_fmt = fecha_venc_actual.strftime('%d-%m-%Y')
+            _, unidades_viejas, _ = libro.resumen(codigo)
+            mensaje_extra = f"⚠️ Se mantiene fecha antigua ({fecha_fmt}). El sistema recordara cambiarla cuando vendas las {unidades_viejas} unidades viejas."
+        else:
+            mensaje_extra = "⚠️ La nueva entrada vence antes que lo que tenias. Se actualizo la fecha principal."
+
+    elif tipo_movimiento == "Ajuste":
+        nuevo_stock = stock_actual + cantidad
+        lotes_antes = libro.cantidad_lotes(codigo)
+        libro.ajustar(codigo, cantidad, vencimiento_producto(df_productos, idx, libro))
+
+        # Si el ajuste termino con el lote antiguo, la fecha pasa al siguiente lote
+        if cantidad < 0 and 0 < libro.cantidad_lotes(codigo) < lotes_antes:
+            nueva_fecha_str = _fecha_str(libro.vencimiento(codigo))
+            mensaje_extra = f"ℹ️ El ajuste afecto al lote antiguo y este se termino. Fecha actualizada a: {nueva_fecha_str}"
+
+    df_productos.at[idx, 'Stock_Actual'] = nuevo_stock
+    sincronizar_producto(df_productos, idx, libro)
+    return nuevo_stock, mensaje_extra
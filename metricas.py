@@ -0,0 +1,179 @@
+"""
+Metricas de rendimiento del proceso: duracion de las operaciones pesadas (carga, guardado, estados,
+paginas, tablas) y contadores (filas leidas, movimientos guardados, escrituras fallidas).
+
+Hay un solo registro por proceso (METRICAS), compartido por todas las sesiones igual que el almacen.
+Se ve en el panel de rendimiento de la app (solo Admin) y se escribe cada tanto en un archivo con
+formato de texto de Prometheus (variable GESTOR_METRICAS, "metricas.prom" por defecto) para que lo
+levante el recolector, por ejemplo con el textfile collector de node_exporter.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+
+ARCHIVO_METRICAS = os.environ.get("GESTOR_METRICAS", "metricas.prom")
+
+# Cada cuantos segundos se reescribe el archivo de metricas como maximo
+INTERVALO_EXPORTACION = 15
+
+# Limites (segundos) de los buckets del histograma de duraciones
+LIMITES_DURACION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIJO = "inventario"
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted(etiquetas.items()))
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _formatear_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+class _Duracion:
+    """
+    Histograma de una operacion: cantidad, suma, maximo, ultima duracion y conteo por bucket.
+    """
+
+    def __init__(self):
+        self.cantidad = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+        self.ultima = 0.0
+        self.buckets = [0] * len(LIMITES_DURACION)
+
+    def registrar(self, segundos):
+        self.cantidad += 1
+        self.suma += segundos
+        self.maximo = max(self.maximo, segundos)
+        self.ultima = segundos
+        for i, limite in enumerate(LIMITES_DURACION):
+            if segundos <= limite:
+                self.buckets[i] += 1
+
+class Metricas:
+    """
+    Registro de duraciones (por operacion y etiquetas) y contadores. Se puede usar desde cualquier hilo.
+    """
+
+    def __init__(self, archivo=ARCHIVO_METRICAS):
+        self.archivo = archivo
+        self._lock = threading.Lock()
+        self._duraciones = {}
+        self._contadores = {}
+        self._ultima_exportacion = 0.0
+
+    # --- Registro ---
+
+    def registrar(self, operacion, segundos, **etiquetas):
+        with self._lock:
+            clave = _clave(operacion, etiquetas)
+            if clave not in self._duraciones:
+                self._duraciones[clave] = _Duracion()
+            self._duraciones[clave].registrar(segundos)
+
+    @contextmanager
+    def medir(self, operacion, **etiquetas):
+        """
+        Mide la duracion del bloque. Se registra aunque el bloque termine con una excepcion
+        (por ejemplo el st.rerun() de una pagina).
+        """
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(operacion, time.perf_counter() - inicio, **etiquetas)
+
+    def cronometrar(self, operacion, **etiquetas):
+        """
+        Decorador: mide cada llamada a la funcion.
+        """
+        def decorador(funcion):
+            @wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with self.medir(operacion, **etiquetas):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def contar(self, nombre, valor=1, **etiquetas):
+        with self._lock:
+            clave = _clave(nombre, etiquetas)
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    # --- Consulta ---
+
+    def resumen(self):
+        """
+        Devuelve (duraciones, contadores) como DataFrames para el panel de rendimiento.
+        """
+        with self._lock:
+            duraciones = [
+                {"Operacion": nombre, "Etiquetas": _formatear_etiquetas(etiquetas).strip("{}"),
+                 "Llamadas": d.cantidad, "Total (s)": d.suma, "Promedio (ms)": 1000 * d.suma / d.cantidad,
+                 "Ultima (ms)": 1000 * d.ultima, "Maximo (ms)": 1000 * d.maximo}
+                for (nombre, etiquetas), d in self._duraciones.items()
+            ]
+            contadores = [
+                {"Contador": nombre, "Etiquetas": _formatear_etiquetas(etiquetas).strip("{}"), "Valor": valor}
+                for (nombre, etiquetas), valor in self._contadores.items()
+            ]
+        df_duraciones = pd.DataFrame(duraciones, columns=["Operacion", "Etiquetas", "Llamadas", "Total (s)",
+                                                          "Promedio (ms)", "Ultima (ms)", "Maximo (ms)"])
+        df_contadores = pd.DataFrame(contadores, columns=["Contador", "Etiquetas", "Valor"])
+        return (df_duraciones.sort_values("Total (s)", ascending=False, ignore_index=True),
+                df_contadores.sort_values("Contador", ignore_index=True))
+
+    def texto_prometheus(self):
+        """
+        Todas las metricas en el formato de texto de Prometheus (version 0.0.4).
+        """
+        lineas = []
+        with self._lock:
+            if self._duraciones:
+                familia = f"{PREFIJO}_operacion_segundos"
+                lineas.append(f"# HELP {familia} Duracion de las operaciones de la app (segundos).")
+                lineas.append(f"# TYPE {familia} histogram")
+                for (operacion, etiquetas), d in sorted(self._duraciones.items()):
+                    base = (("operacion", operacion),) + etiquetas
+                    for limite, cantidad in zip(LIMITES_DURACION, d.buckets):
+                        lineas.append(f"{familia}_bucket{_formatear_etiquetas(base, [('le', limite)])} {cantidad}")
+                    lineas.append(f"{familia}_bucket{_formatear_etiquetas(base, [('le', '+Inf')])} {d.cantidad}")
+                    lineas.append(f"{familia}_sum{_formatear_etiquetas(base)} {d.suma:.6f}")
+                    lineas.append(f"{familia}_count{_formatear_etiquetas(base)} {d.cantidad}")
+
+            nombres = sorted({nombre for nombre, _ in self._contadores})
+            for nombre in nombres:
+                familia = f"{PREFIJO}_{nombre}_total"
+                lineas.append(f"# TYPE {familia} counter")
+                for (otro, etiquetas), valor in sorted(self._contadores.items()):
+                    if otro == nombre:
+                        lineas.append(f"{familia}{_formatear_etiquetas(etiquetas)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+    # --- Exportacion ---
+
+    def exportar(self, forzar=False):
+        """
+        Reescribe el archivo de metricas (como mucho una vez cada INTERVALO_EXPORTACION segundos).
+        Se escribe en un temporal y se renombra: el recolector nunca lee un archivo a medias.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            if not forzar and ahora - self._ultima_exportacion < INTERVALO_EXPORTACION:
+                return False
+            self._ultima_exportacion = ahora
+        temporal = f"{self.archivo}.{threading.get_ident()}.tmp"
+        with open(temporal, "w", encoding="utf-8", newline="\n") as f:
+            f.write(self.texto_prometheus())
+        os.replace(temporal, self.archivo)
+        return True
+
+METRICAS = Metricas()
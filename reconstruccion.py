@@ -0,0 +1,223 @@
+"""
+Reconstruccion del stock a una fecha pasada ("¿que teniamos el dia 1?").
+
+El estado de partida es el Stock_Inicial de cada producto (el alta del producto no deja movimiento).
+Cada movimiento de Movimientos.csv se vuelve a aplicar con las mismas reglas FEFO (ver lotes.py).
+Para no recorrer todo el historial en cada consulta se guardan checkpoints: los lotes de todos los
+productos al cierre de cada mes. Una consulta parte del checkpoint anterior a la fecha y aplica
+solo los movimientos posteriores.
+
+Un checkpoint recuerda cuantas filas tenia el historial al crearlo (Movimientos_Hasta). Las filas
+agregadas despues con una fecha anterior (por ejemplo, una importacion atrasada) tambien se aplican,
+asi que un checkpoint nunca queda desactualizado por eso.
+
+Uso por linea de comandos (CSV o SQLite segun GESTOR_ALMACENAMIENTO):
+
+    python reconstruccion.py stock --fecha 01-10-2026
+"""
+import argparse
+import bisect
+
+import numpy as np
+import pandas as pd
+
+from importacion import TIPO_TRANSFERENCIA
+from lotes import COLUMNAS_LOTES, LibroLotes
+
+# Stock: total del producto en el checkpoint (repetido en cada lote). Puede no coincidir con la
+# suma de los lotes si un Ajuste dejo el stock en negativo.
+COLUMNAS_CHECKPOINT = ["Fecha_Checkpoint", "Movimientos_Hasta"] + COLUMNAS_LOTES + ["Stock"]
+
+def _delta(df_movimientos):
+    """
+    Efecto de cada movimiento sobre el stock: Salida resta, Entrada, Ajuste y Transferencia suman
+    (los dos ultimos traen su signo).
+    """
+    signo = np.where(df_movimientos["Tipo"].to_numpy() == "Salida", -1, 1)
+    return pd.Series(df_movimientos["Cantidad"].to_numpy() * signo, index=df_movimientos.index)
+
+def reproducir(libro, df_movimientos):
+    """
+    Aplica los movimientos (en el orden dado) a los lotes del libro.
+    """
+    columnas = ["Codigo_Producto", "Tipo", "Cantidad"]
+    tiene_lote = "Vencimiento_Lote" in df_movimientos.columns
+    vencimientos = df_movimientos["Vencimiento_Lote"] if tiene_lote else pd.Series(pd.NaT, index=df_movimientos.index)
+    for (codigo, tipo, cantidad), vencimiento in zip(df_movimientos[columnas].itertuples(index=False, name=None), vencimientos):
+        if tipo == "Entrada":
+            libro.agregar(codigo, cantidad, vencimiento)
+        elif tipo == "Salida":
+            libro.consumir(codigo, cantidad)
+        elif tipo == "Ajuste":
+            libro.ajustar(codigo, cantidad, libro.vencimiento(codigo))
+        elif tipo == TIPO_TRANSFERENCIA:
+            libro.trasladar(codigo, cantidad, vencimiento)
+    return libro
+
+class HistorialStock:
+    """
+    Checkpoints en memoria, ordenados por fecha. Cada uno: fecha de cierre, filas del historial que
+    cubria, lotes de ese momento y stock total por producto (para consultas vectorizadas).
+    """
+
+    def __init__(self, df_checkpoints=None):
+        self._fechas = []
+        self._hastas = []
+        self._lotes = []
+        self._totales = []
+        if df_checkpoints is not None and not df_checkpoints.empty:
+            for (fecha, hasta), df_lotes in df_checkpoints.groupby(["Fecha_Checkpoint", "Movimientos_Hasta"], sort=True):
+                self._agregar(fecha, int(hasta), df_lotes[COLUMNAS_LOTES + ["Stock"]].reset_index(drop=True))
+
+    def __len__(self):
+        return len(self._fechas)
+
+    def fechas(self):
+        return list(self._fechas)
+
+    def _agregar(self, fecha, hasta, df_lotes):
+        i = bisect.bisect_right(self._fechas, fecha)
+        self._fechas.insert(i, fecha)
+        self._hastas.insert(i, hasta)
+        self._lotes.insert(i, df_lotes)
+        self._totales.insert(i, df_lotes.groupby("Codigo_Producto")["Stock"].first())
+
+    def _anterior(self, fecha):
+        """
+        Posicion del ultimo checkpoint con fecha <= fecha, o -1 si no hay ninguno.
+        """
+        return bisect.bisect_right(self._fechas, fecha) - 1
+
+    def _filas_posteriores(self, i, fecha, df_movimientos):
+        """
+        Movimientos que hay que aplicar sobre el checkpoint i para llegar al cierre de fecha.
+        """
+        fechas = df_movimientos["Fecha"]
+        mascara = (fechas <= fecha).to_numpy()
+        if i >= 0:
+            posicion = np.arange(len(df_movimientos))
+            mascara = mascara & ((fechas > self._fechas[i]).to_numpy() | (posicion >= self._hastas[i]))
+        return df_movimientos[mascara]
+
+    def _base(self, i, df_productos):
+        """
+        Stock de partida por producto: el del checkpoint i, mas el Stock_Inicial de los productos
+        que no estaban en el checkpoint (sin checkpoint, el de todos).
+        """
+        iniciales = df_productos.set_index('Codigo')['Stock_Inicial'].fillna(0)
+        if i < 0:
+            return iniciales
+        totales = self._totales[i]
+        nuevos = iniciales[~iniciales.index.isin(totales.index)]
+        return pd.concat([totales, nuevos])
+
+    def stock_en_fecha(self, fecha, df_productos, df_movimientos):
+        """
+        Stock de cada producto al cierre de fecha, vectorizado: checkpoint anterior + suma de
+        los movimientos posteriores por producto. Devuelve una Series indexada por Codigo.
+        """
+        fecha = pd.Timestamp(fecha).normalize()
+        i = self._anterior(fecha)
+        base = self._base(i, df_productos)
+        posteriores = self._filas_posteriores(i, fecha, df_movimientos)
+        delta = _delta(posteriores).groupby(posteriores["Codigo_Producto"]).sum()
+        return base.add(delta, fill_value=0).rename("Stock")
+
+    def lotes_en_fecha(self, fecha, df_productos, df_movimientos, codigos=None):
+        """
+        Lotes al cierre de fecha (un LibroLotes). Con codigos solo se reconstruyen esos productos.
+        """
+        fecha = pd.Timestamp(fecha).normalize()
+        i = self._anterior(fecha)
+        libro = LibroLotes()
+        if i >= 0:
+            df_lotes = self._lotes[i]
+            if codigos is not None:
+                df_lotes = df_lotes[df_lotes["Codigo_Producto"].isin(codigos)]
+            libro = LibroLotes.desde_dataframe(df_lotes)
+            ya_estaban = set(self._lotes[i]["Codigo_Producto"])
+        else:
+            ya_estaban = set()
+
+        iniciales = df_productos[['Codigo', 'Stock_Inicial']]
+        if codigos is not None:
+            iniciales = iniciales[iniciales['Codigo'].isin(codigos)]
+        for codigo, stock_inicial in iniciales.itertuples(index=False, name=None):
+            if codigo not in ya_estaban and stock_inicial > 0:
+                libro.agregar(codigo, stock_inicial, pd.NaT)
+
+        posteriores = self._filas_posteriores(i, fecha, df_movimientos)
+        if codigos is not None:
+            posteriores = posteriores[posteriores["Codigo_Producto"].isin(codigos)]
+        # Orden cronologico; a igual fecha, el orden en que se registraron
+        posteriores = posteriores.sort_values("Fecha", kind="stable")
+        return reproducir(libro, posteriores)
+
+    def faltantes(self, df_movimientos, hoy):
+        """
+        Cierres de mes (ya terminados) que todavia no tienen checkpoint y tienen movimientos antes.
+        """
+        fechas = df_movimientos["Fecha"].dropna()
+        if fechas.empty:
+            return []
+        meses = pd.period_range(fechas.min().to_period("M"), pd.Timestamp(hoy).to_period("M"), freq="M")
+        cierres = [mes.end_time.normalize() for mes in meses[:-1]]
+        ultimo = self._fechas[-1] if self._fechas else None
+        return [cierre for cierre in cierres if ultimo is None or cierre > ultimo]
+
+    def crear(self, fecha, df_productos, df_movimientos):
+        """
+        Crea el checkpoint de fecha a partir del anterior y devuelve sus filas (COLUMNAS_CHECKPOINT) para guardarlas.
+        Los productos sin lotes quedan con una fila en cero: asi se sabe que ya existian.
+        """
+        fecha = pd.Timestamp(fecha).normalize()
+        totales = self.stock_en_fecha(fecha, df_productos, df_movimientos)
+        libro = self.lotes_en_fecha(fecha, df_productos, df_movimientos)
+        df_lotes = libro.a_dataframe()
+        codigos_con_lotes = set(df_lotes["Codigo_Producto"])
+        vacios = [c for c in totales.index if c not in codigos_con_lotes]
+        if vacios:
+            df_vacios = pd.DataFrame({"Codigo_Producto": vacios, "Fecha_Vencimiento": pd.NaT, "Cantidad": 0})
+            df_lotes = pd.concat([df_lotes, df_vacios], ignore_index=True)
+        df_lotes["Stock"] = df_lotes["Codigo_Producto"].map(totales).fillna(0)
+
+        hasta = len(df_movimientos)
+        self._agregar(fecha, hasta, df_lotes)
+        df_checkpoint = df_lotes.copy()
+        df_checkpoint.insert(0, "Movimientos_Hasta", hasta)
+        df_checkpoint.insert(0, "Fecha_Checkpoint", fecha)
+        return df_checkpoint[COLUMNAS_CHECKPOINT]
+
+    def crear_faltantes(self, df_productos, df_movimientos, hoy):
+        """
+        Crea, en orden, los checkpoints de fin de mes que faltan. Cada uno parte del anterior.
+        Devuelve las filas nuevas (o None si no faltaba ninguno).
+        """
+        nuevos = [self.crear(cierre, df_productos, df_movimientos) for cierre in self.faltantes(df_movimientos, hoy)]
+        return pd.concat(nuevos, ignore_index=True) if nuevos else None
+
+if __name__ == "__main__":
+    from almacenamiento import FORMATO_FECHA, crear_almacenamiento
+
+    parser = argparse.ArgumentParser(description="Stock a una fecha pasada a partir de checkpoints y movimientos")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_stock = sub.add_parser("stock", help="Muestra el stock de cada producto al cierre de una fecha")
+    p_stock.add_argument("--fecha", required=True, help="DD-MM-YYYY")
+    sub.add_parser("checkpoints", help="Crea los checkpoints de fin de mes que falten")
+    args = parser.parse_args()
+
+    almacenamiento = crear_almacenamiento()
+    df_productos = almacenamiento.leer_productos()
+    df_movimientos = almacenamiento.leer_movimientos()
+    historial = HistorialStock(almacenamiento.leer_checkpoints())
+    df_nuevos = historial.crear_faltantes(df_productos, df_movimientos, pd.Timestamp.now().normalize())
+    if df_nuevos is not None:
+        almacenamiento.guardar_checkpoints(df_nuevos)
+
+    if args.comando == "stock":
+        fecha = pd.to_datetime(args.fecha, format=FORMATO_FECHA)
+        stock = historial.stock_en_fecha(fecha, df_productos, df_movimientos)
+        nombres = df_productos.set_index('Codigo')['Nombre']
+        print(pd.DataFrame({"Nombre": nombres.reindex(stock.index), "Stock": stock}).to_string())
+    else:
+        print(f"Checkpoints: {len(historial)} (nuevos: {0 if df_nuevos is None else df_nuevos['Fecha_Checkpoint'].nunique()})")
@@ -0,0 +1,121 @@
+"""
+Sugerencias de reposicion para todo el catalogo a la vez, con NumPy/pandas (sin recorrer producto por producto).
+
+- Demanda diaria: promedio (y desvio) de las unidades de Salida por dia en la ventana, contando los
+  dias sin salidas. Los productos mas nuevos que la ventana se promedian desde su primer movimiento.
+- Vencimientos: los lotes se venden en orden FEFO al ritmo de la demanda; lo que no alcanza a venderse
+  antes de su fecha de vencimiento queda "en riesgo" y no cuenta como stock util.
+- Dias de cobertura: stock util / demanda diaria.
+- Punto de reorden: demanda durante el plazo de reposicion + stock de seguridad
+  (z del nivel de servicio * desvio * raiz del plazo). Nunca menor que el Stock_Minimo del producto.
+- Cantidad sugerida: lo que falta para cubrir el plazo mas los dias de cobertura objetivo, solo si el
+  stock util ya esta en el punto de reorden o por debajo.
+"""
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# Dias de historial de Salidas con los que se estima la demanda
+VENTANA_DEMANDA = 90
+
+# Dias entre que se pide y llega la reposicion
+PLAZO_REPOSICION = 7
+
+# Dias de demanda que debe cubrir el pedido, ademas del plazo
+DIAS_COBERTURA_OBJETIVO = 30
+
+# Probabilidad de no quedar sin stock durante el plazo
+NIVEL_SERVICIO = 0.95
+
+COLUMNAS_REPOSICION = ["Demanda_Diaria", "Desvio_Diario", "Stock_Util", "Unidades_En_Riesgo",
+                       "Vence_Antes_De_Vender", "Dias_Cobertura", "Fecha_Quiebre", "Stock_Seguridad",
+                       "Punto_Reorden", "Reponer", "Cantidad_Sugerida"]
+
+def demanda_diaria(df_consumo, codigos, dias):
+    """
+    Promedio y desvio de las Salidas diarias de cada codigo. df_consumo tiene una fila por dia y
+    producto con movimientos (Codigo_Producto, Salidas; ver resumen_diario.py); los dias que faltan
+    valen 0. dias es el largo de la ventana de cada producto (array alineado con codigos).
+    """
+    salidas = df_consumo.groupby("Codigo_Producto")["Salidas"]
+    suma = salidas.sum().reindex(codigos, fill_value=0).to_numpy(dtype=np.float64)
+    cuadrados = (df_consumo["Salidas"] ** 2).groupby(df_consumo["Codigo_Producto"]).sum()
+    suma_cuadrados = cuadrados.reindex(codigos, fill_value=0).to_numpy(dtype=np.float64)
+    media = suma / dias
+    varianza = np.maximum(suma_cuadrados / dias - media ** 2, 0)
+    return media, np.sqrt(varianza)
+
+def unidades_en_riesgo(df_lotes, demanda, hoy):
+    """
+    Unidades de cada producto que vencen antes de venderse, vendiendo sus lotes en orden de
+    vencimiento al ritmo de demanda (Series codigo -> unidades por dia). Devuelve una Series por codigo.
+    """
+    if df_lotes.empty:
+        return pd.Series(dtype=np.float64)
+    df = df_lotes.sort_values(["Codigo_Producto", "Fecha_Vencimiento"], na_position="last", kind="stable")
+    cantidad = df["Cantidad"].to_numpy(dtype=np.float64)
+    vendidas_antes = df.groupby("Codigo_Producto")["Cantidad"].cumsum().to_numpy(dtype=np.float64) - cantidad
+    dias_para_vencer = ((df["Fecha_Vencimiento"] - hoy).dt.days).to_numpy(dtype=np.float64)
+    sin_vencimiento = np.isnan(dias_para_vencer)
+    ritmo = df["Codigo_Producto"].map(demanda).fillna(0).to_numpy(dtype=np.float64)
+    # Lo que se vende del lote hasta su vencimiento, despues de los lotes que vencen antes.
+    # Los lotes sin vencimiento nunca quedan en riesgo.
+    vendibles = np.clip(ritmo * np.nan_to_num(np.maximum(dias_para_vencer, 0)) - vendidas_antes, 0, cantidad)
+    vendibles = np.where(sin_vencimiento, cantidad, vendibles)
+    riesgo = pd.Series(cantidad - vendibles, index=df.index)
+    return riesgo.groupby(df["Codigo_Producto"]).sum()
+
+def calcular_reposicion(df_productos, df_consumo, df_lotes, hoy, primeros_movimientos=None, ventana=VENTANA_DEMANDA,
+                        plazo=PLAZO_REPOSICION, cobertura=DIAS_COBERTURA_OBJETIVO, nivel_servicio=NIVEL_SERVICIO):
+    """
+    Agrega a una copia de df_productos (Codigo, Stock_Actual, Stock_Minimo, Fecha_Vencimiento) las
+    COLUMNAS_REPOSICION. df_consumo son los totales diarios de la ventana terminada en hoy;
+    df_lotes, los lotes vivos (COLUMNAS_LOTES de lotes.py); primeros_movimientos, la fecha del
+    primer movimiento de cada codigo (sin ella, todos se promedian sobre la ventana completa).
+    """
+    hoy = pd.Timestamp(hoy).normalize()
+    df = df_productos.copy(deep=False)
+    codigos = df["Codigo"].to_numpy()
+
+    dias = np.full(len(df), float(ventana))
+    if primeros_movimientos is not None:
+        antiguedad = (hoy - primeros_movimientos.reindex(codigos)).dt.days + 1
+        dias = np.clip(antiguedad.fillna(ventana).to_numpy(dtype=np.float64), 1, ventana)
+    media, desvio = demanda_diaria(df_consumo, codigos, dias)
+
+    # Productos con stock que no estan en el libro de lotes: un solo lote con su Fecha_Vencimiento
+    stock = pd.to_numeric(df["Stock_Actual"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    sin_lotes = (stock > 0) & ~np.isin(codigos, df_lotes["Codigo_Producto"].to_numpy())
+    if sin_lotes.any():
+        extra = pd.DataFrame({"Codigo_Producto": codigos[sin_lotes],
+                              "Fecha_Vencimiento": pd.to_datetime(df.loc[sin_lotes, "Fecha_Vencimiento"]).to_numpy(),
+                              "Cantidad": stock[sin_lotes]})
+        df_lotes = pd.concat([df_lotes, extra], ignore_index=True)
+    riesgo = unidades_en_riesgo(df_lotes, pd.Series(media, index=codigos), hoy)
+    riesgo = np.minimum(riesgo.reindex(codigos, fill_value=0).to_numpy(dtype=np.float64), np.maximum(stock, 0))
+    util = np.maximum(stock - riesgo, 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dias_cobertura = np.where(media > 0, util / media, np.inf)
+    z = NormalDist().inv_cdf(nivel_servicio)
+    seguridad = z * desvio * np.sqrt(plazo)
+    minimo = pd.to_numeric(df["Stock_Minimo"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    punto = np.maximum(np.ceil(media * plazo + seguridad), minimo)
+    objetivo = np.maximum(media * (plazo + cobertura) + seguridad, minimo)
+    reponer = (util <= punto) & ((media > 0) | (util < minimo))
+
+    df["Demanda_Diaria"] = media
+    df["Desvio_Diario"] = desvio
+    df["Stock_Util"] = util
+    df["Unidades_En_Riesgo"] = riesgo
+    df["Vence_Antes_De_Vender"] = riesgo > 0
+    df["Dias_Cobertura"] = dias_cobertura
+    # Sin demanda no hay fecha de quiebre (NaT)
+    quiebre = np.floor(np.where(np.isfinite(dias_cobertura), dias_cobertura, np.nan))
+    df["Fecha_Quiebre"] = hoy + pd.to_timedelta(quiebre, unit="D")
+    df["Stock_Seguridad"] = np.ceil(seguridad)
+    df["Punto_Reorden"] = punto
+    df["Reponer"] = reponer
+    df["Cantidad_Sugerida"] = np.where(reponer, np.ceil(np.maximum(objetivo - util, 0)), 0).astype(np.int64)
+    return df
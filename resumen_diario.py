@@ -0,0 +1,161 @@
+"""
+Resumenes diarios del historial de movimientos para la analitica de consumo.
+
+Dos tablas acumuladas, una fila por dia y clave:
+- por producto: unidades de Entrada, Salida, Ajustes positivos y mermas (ajustes negativos),
+  cantidad de movimientos y de ajustes.
+- por responsable: movimientos, unidades movidas y unidades de Salida.
+
+Como el historial solo crece al final, cada actualizacion agrupa solo las filas nuevas y las suma
+a las tablas; los graficos de meses de datos se arman desde estos totales diarios, sin volver a
+agrupar el historial completo. Los Ajustes de conciliacion (Id_Transaccion con PREFIJO_CONCILIACION)
+no se cuentan: corrigen el historial, no son consumo ni mermas.
+"""
+import numpy as np
+import pandas as pd
+
+from importacion import es_conciliacion
+
+COLUMNAS_PRODUCTO = ["Entradas", "Salidas", "Ajustes_Positivos", "Mermas", "Movimientos", "Ajustes"]
+COLUMNAS_RESPONSABLE = ["Movimientos", "Unidades", "Salidas"]
+
+_EPOCA = np.datetime64("1970-01-01", "D")
+
+def _dia(fecha):
+    """
+    Dia (entero, dias desde 1970-01-01) de una fecha.
+    """
+    return int((np.datetime64(pd.Timestamp(fecha).normalize(), "D") - _EPOCA).astype(np.int64))
+
+class _Acumulador:
+    """
+    Totales por (dia, clave) en arrays que crecen: la posicion de cada par se guarda en un dict.
+    """
+
+    def __init__(self, nombre_clave, columnas):
+        self.nombre_clave = nombre_clave
+        self.columnas = columnas
+        self._posicion = {}
+        self._dias = np.empty(0, dtype=np.int64)
+        self._claves = np.empty(0, dtype=object)
+        self._valores = np.empty((0, len(columnas)), dtype=np.float64)
+        self._filas = 0
+
+    def _crecer(self, minimo):
+        if minimo <= len(self._dias):
+            return
+        capacidad = max(minimo, 2 * len(self._dias), 1024)
+        extra = capacidad - len(self._dias)
+        self._dias = np.concatenate([self._dias, np.zeros(extra, dtype=np.int64)])
+        self._claves = np.concatenate([self._claves, np.empty(extra, dtype=object)])
+        self._valores = np.concatenate([self._valores, np.zeros((extra, len(self.columnas)))])
+
+    def sumar(self, agrupado):
+        """
+        Suma un resultado de groupby([dia, clave]).sum() (pares unicos) a los totales.
+        """
+        if agrupado.empty:
+            return
+        dias = agrupado.index.get_level_values(0).to_numpy()
+        claves = agrupado.index.get_level_values(1).to_numpy()
+        posiciones = np.empty(len(agrupado), dtype=np.int64)
+        nuevas = []
+        for i, par in enumerate(zip(dias.tolist(), claves.tolist())):
+            posicion = self._posicion.get(par)
+            if posicion is None:
+                posicion = self._posicion[par] = self._filas + len(nuevas)
+                nuevas.append(i)
+            posiciones[i] = posicion
+        if nuevas:
+            self._crecer(self._filas + len(nuevas))
+            destino = slice(self._filas, self._filas + len(nuevas))
+            self._dias[destino] = dias[nuevas]
+            self._claves[destino] = claves[nuevas]
+            self._filas += len(nuevas)
+        self._valores[posiciones] += agrupado[self.columnas].to_numpy(dtype=np.float64)
+
+    def tabla(self, desde=None, hasta=None):
+        """
+        Filas con Fecha entre desde y hasta (inclusive): Fecha, clave y columnas.
+        """
+        dias = self._dias[:self._filas]
+        mascara = np.ones(self._filas, dtype=bool)
+        if desde is not None:
+            mascara = mascara & (dias >= _dia(desde))
+        if hasta is not None:
+            mascara = mascara & (dias <= _dia(hasta))
+        df = pd.DataFrame(self._valores[:self._filas][mascara], columns=self.columnas)
+        df.insert(0, self.nombre_clave, self._claves[:self._filas][mascara])
+        df.insert(0, "Fecha", (_EPOCA + dias[mascara]).astype("datetime64[ns]"))
+        return df
+
+class ResumenDiario:
+    """
+    Totales diarios por producto y por responsable; filas es cuantas filas del historial ya se sumaron.
+    """
+
+    def __init__(self):
+        self.por_producto = _Acumulador("Codigo_Producto", COLUMNAS_PRODUCTO)
+        self.por_responsable = _Acumulador("Responsable", COLUMNAS_RESPONSABLE)
+        # codigo -> dia (entero) de su primer movimiento
+        self.primer_dia = {}
+        self.filas = 0
+
+    def actualizar(self, df_movimientos):
+        """
+        Suma las filas de df_movimientos agregadas desde la ultima llamada. Si el historial se achico
+        (fue reescrito), se vuelve a armar desde cero.
+        """
+        total = len(df_movimientos)
+        if total < self.filas:
+            self.__init__()
+        if total == self.filas:
+            return
+        self._sumar(df_movimientos.iloc[self.filas:total])
+        self.filas = total
+
+    def _sumar(self, df):
+        df = df[df["Fecha"].notna() & ~es_conciliacion(df)]
+        if df.empty:
+            return
+        dias = (df["Fecha"].to_numpy().astype("datetime64[D]") - _EPOCA).astype(np.int64)
+        tipo = df["Tipo"].to_numpy()
+        cantidad = pd.to_numeric(df["Cantidad"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        es_ajuste = tipo == "Ajuste"
+        salidas = np.where(tipo == "Salida", cantidad, 0.0)
+
+        df_producto = pd.DataFrame({
+            "Dia": dias,
+            "Codigo_Producto": df["Codigo_Producto"].to_numpy(),
+            "Entradas": np.where(tipo == "Entrada", cantidad, 0.0),
+            "Salidas": salidas,
+            "Ajustes_Positivos": np.where(es_ajuste & (cantidad > 0), cantidad, 0.0),
+            "Mermas": np.where(es_ajuste & (cantidad < 0), -cantidad, 0.0),
+            "Movimientos": 1.0,
+            "Ajustes": es_ajuste.astype(np.float64),
+        })
+        self.por_producto.sumar(df_producto.groupby(["Dia", "Codigo_Producto"], sort=False).sum())
+        for codigo, dia in df_producto.groupby("Codigo_Producto", sort=False)["Dia"].min().items():
+            self.primer_dia.setdefault(codigo, dia)
+
+        df_responsable = pd.DataFrame({
+            "Dia": dias,
+            "Responsable": df["Responsable"].fillna("").astype(str).str.strip().to_numpy(dtype=object),
+            "Movimientos": 1.0,
+            "Unidades": np.abs(cantidad),
+            "Salidas": salidas,
+        })
+        self.por_responsable.sumar(df_responsable.groupby(["Dia", "Responsable"], sort=False).sum())
+
+    def productos(self, desde=None, hasta=None):
+        return self.por_producto.tabla(desde, hasta)
+
+    def responsables(self, desde=None, hasta=None):
+        return self.por_responsable.tabla(desde, hasta)
+
+    def primeros_movimientos(self):
+        """
+        Fecha del primer movimiento de cada producto (Series codigo -> fecha).
+        """
+        dias = np.fromiter(self.primer_dia.values(), dtype=np.int64, count=len(self.primer_dia))
+        return pd.Series((_EPOCA + dias).astype("datetime64[ns]"), index=list(self.primer_dia), dtype="datetime64[ns]")
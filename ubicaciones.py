@@ -0,0 +1,399 @@
+"""
+Varias ubicaciones (depositos o sucursales), cada una con su propia particion de datos:
+
+    ubicaciones/Central/Productos.csv, Movimientos.csv, Lotes.csv, ... (o inventario.db)
+    ubicaciones/Norte/...
+
+Cada proceso (la app o la API) atiende una sola ubicacion, la de GESTOR_UBICACION: carga y escribe
+solo su carpeta, con el AlmacenDatos y el almacenamiento (CSV o SQLite) de siempre. La carpeta raiz
+se cambia con GESTOR_UBICACIONES. Sin GESTOR_UBICACION todo queda como antes, con los archivos en
+el directorio de trabajo. El catalogo se repite en cada ubicacion con su propio stock y sus lotes
+FEFO; un mismo codigo es el mismo producto en todas.
+
+Transferencias: la ubicacion que envia descuenta el stock en orden FEFO y guarda movimientos
+"Transferencia" negativos, uno por lote tocado y con su vencimiento. Ya guardados, agrega las mismas
+lineas a Transferencias.csv del destino, una bandeja a la que solo se agregan lineas. Cada proceso
+del destino lee su bandeja al refrescar y aplica lo nuevo como movimientos positivos con los lotes
+de origen. Una transferencia esta recibida cuando su Id_Transferencia aparece como Id_Transaccion de
+un movimiento Transferencia en Movimientos del destino: queda anotada en la misma escritura que el
+stock, asi que si esa escritura falla se vuelve a aplicar. Dos procesos de la misma ubicacion no la
+aplican dos veces porque la reciben dentro de AlmacenDatos.escritura (bloqueo entre procesos y
+relectura del disco).
+
+Los codigos de productos nuevos se reparten en bloques para que dos ubicaciones nunca den el mismo
+codigo a productos distintos (ver Ubicacion.siguiente_codigo).
+
+consolidado() junta el stock de todas las ubicaciones (leido desde sus instantaneas) y lo que esta
+en transito (lineas de las bandejas que su destino todavia no recibio).
+
+    python ubicaciones.py crear Central --desde .          # la primera, con los datos actuales
+    python ubicaciones.py crear Norte --catalogo Central   # otra, con el mismo catalogo y stock 0
+    python ubicaciones.py consolidado
+"""
+import argparse
+import io
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import (ARCHIVO_BD, ARCHIVO_CHECKPOINTS, ARCHIVO_LOTES, ARCHIVO_MOVIMIENTOS, ARCHIVO_PRODUCTOS,
+                            COLUMNAS_DERIVADAS, AlmacenamientoCSV, crear_almacenamiento, escribir_csv)
+from importacion import COLUMNAS_IMPORTADAS, TIPO_TRANSFERENCIA
+from lotes import LibroLotes
+
+DIRECTORIO_UBICACIONES = "ubicaciones"
+ARCHIVO_TRANSFERENCIAS = "Transferencias.csv"
+DIRECTORIO_CODIGOS = "codigos"
+
+# Codigos que reclama una ubicacion cada vez que se queda sin codigos propios
+TAMANO_BLOQUE_CODIGOS = 1000
+
+# Datos del producto que viajan con cada transferencia, para darlo de alta si el destino no lo tiene
+COLUMNAS_CATALOGO = ["Nombre", "Categoria", "Descripcion", "Stock_Minimo", "Costo", "Precio_Venta"]
+COLUMNAS_TRANSFERENCIA = ["Id_Transferencia", "Fecha", "Origen", "Codigo_Producto", "Cantidad",
+                          "Vencimiento_Lote", "Responsable"] + COLUMNAS_CATALOGO
+
+def listar_ubicaciones(raiz):
+    """
+    Nombres de las ubicaciones (carpetas de raiz), ordenados.
+    """
+    if not os.path.isdir(raiz):
+        return []
+    return sorted(e.name for e in os.scandir(raiz) if e.is_dir() and e.name != DIRECTORIO_CODIGOS)
+
+class BandejaTransferencias:
+    """
+    Transferencias.csv de una ubicacion. Las ubicaciones que envian agregan lineas al final con una
+    sola escritura; la duenia de la bandeja las lee por partes, desde donde quedo la ultima lectura.
+    """
+
+    def __init__(self, directorio):
+        self.ruta = os.path.join(directorio, ARCHIVO_TRANSFERENCIAS)
+        self._offset = 0
+
+    def _crear(self):
+        """
+        Crea la bandeja con su encabezado. Se escribe un temporal y se enlaza con el nombre final:
+        si dos procesos la crean a la vez, el encabezado queda una sola vez y antes que las lineas.
+        """
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8", newline="") as f:
+            f.write(";".join(COLUMNAS_TRANSFERENCIA) + "\n")
+        try:
+            os.link(temporal, self.ruta)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporal)
+
+    def anexar(self, df_envio):
+        texto = io.StringIO()
+        escribir_csv(texto, df_envio[COLUMNAS_TRANSFERENCIA], ["Fecha", "Vencimiento_Lote"], encabezado=False)
+        datos = texto.getvalue().encode("utf-8")
+        if not os.path.exists(self.ruta):
+            self._crear()
+        # Un solo write en modo append: las lineas de dos procesos no se mezclan
+        with open(self.ruta, "ab") as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _parsear(self, datos, encabezado):
+        df = pd.read_csv(io.BytesIO(datos), sep=";", header=0 if encabezado else None,
+                         names=None if encabezado else COLUMNAS_TRANSFERENCIA,
+                         dtype={"Id_Transferencia": str, "Origen": str, "Responsable": str, "Nombre": str,
+                                "Categoria": str, "Descripcion": str})
+        for columna in ["Fecha", "Vencimiento_Lote"]:
+            df[columna] = pd.to_datetime(df[columna], dayfirst=True, errors='coerce').dt.normalize()
+        df["Descripcion"] = df["Descripcion"].fillna("")
+        return df
+
+    def leer(self):
+        """
+        Todas las lineas de la bandeja.
+        """
+        try:
+            with open(self.ruta, "rb") as f:
+                datos = f.read()
+        except FileNotFoundError:
+            return pd.DataFrame(columns=COLUMNAS_TRANSFERENCIA)
+        return self._parsear(datos[:datos.rfind(b"\n") + 1], True)
+
+    def hay_nuevas(self):
+        """
+        True si la bandeja crecio desde la ultima lectura (sin leerla).
+        """
+        try:
+            return os.path.getsize(self.ruta) > self._offset
+        except FileNotFoundError:
+            return False
+
+    def leer_nuevas(self):
+        """
+        Lineas completas agregadas desde la ultima lectura (la primera vez, todas).
+        """
+        try:
+            tamano = os.path.getsize(self.ruta)
+        except FileNotFoundError:
+            return pd.DataFrame(columns=COLUMNAS_TRANSFERENCIA)
+        if tamano <= self._offset:
+            return pd.DataFrame(columns=COLUMNAS_TRANSFERENCIA)
+        with open(self.ruta, "rb") as f:
+            f.seek(self._offset)
+            datos = f.read(tamano - self._offset)
+        # Una linea a medio escribir se deja para la proxima lectura
+        datos = datos[:datos.rfind(b"\n") + 1]
+        if not datos:
+            return pd.DataFrame(columns=COLUMNAS_TRANSFERENCIA)
+        encabezado = self._offset == 0
+        self._offset += len(datos)
+        return self._parsear(datos, encabezado)
+
+    def releer(self):
+        """
+        La proxima leer_nuevas vuelve a leer la bandeja desde el principio.
+        """
+        self._offset = 0
+
+    def pendientes(self, recibidas):
+        """
+        Lineas de transferencias enviadas que la ubicacion todavia no recibio (en transito).
+        recibidas: ids ya recibidos (ver ids_recibidos).
+        """
+        df = self.leer()
+        return df[~df["Id_Transferencia"].isin(recibidas)]
+
+class Ubicacion:
+    """
+    Una ubicacion: su carpeta de datos, su bandeja de transferencias y el acceso a las demas.
+    """
+
+    def __init__(self, nombre, raiz=None):
+        nombre = str(nombre).strip()
+        if not nombre or nombre in (".", "..") or nombre == DIRECTORIO_CODIGOS or any(s in nombre for s in "/\\"):
+            raise ValueError(f"Nombre de ubicacion invalido: '{nombre}'.")
+        self.nombre = nombre
+        self.raiz = raiz or os.environ.get("GESTOR_UBICACIONES", DIRECTORIO_UBICACIONES)
+        self.directorio = os.path.join(self.raiz, nombre)
+        self.bandeja = BandejaTransferencias(self.directorio)
+
+    @classmethod
+    def actual(cls):
+        """
+        La ubicacion de GESTOR_UBICACION, o None si no esta definida (una sola ubicacion).
+        """
+        nombre = os.environ.get("GESTOR_UBICACION", "").strip()
+        return cls(nombre) if nombre else None
+
+    def almacenamiento(self, crear=False):
+        return crear_almacenamiento(self.directorio, crear)
+
+    def otras(self):
+        return [nombre for nombre in listar_ubicaciones(self.raiz) if nombre != self.nombre]
+
+    def bandeja_de(self, nombre):
+        return BandejaTransferencias(os.path.join(self.raiz, nombre))
+
+    # --- Codigos de productos ---
+
+    def _duenio_bloque(self, bloque):
+        try:
+            with open(os.path.join(self.raiz, DIRECTORIO_CODIGOS, str(bloque)), encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _reclamar_bloque(self, bloque):
+        directorio = os.path.join(self.raiz, DIRECTORIO_CODIGOS)
+        os.makedirs(directorio, exist_ok=True)
+        try:
+            with open(os.path.join(directorio, str(bloque)), "x", encoding="utf-8") as f:
+                f.write(self.nombre)
+        except FileExistsError:
+            return False
+        return True
+
+    def siguiente_codigo(self, codigos):
+        """
+        Codigo para un producto nuevo, unico entre todas las ubicaciones. codigos son los de esta
+        ubicacion. Se sigue con el bloque propio mas alto mientras le queden codigos; si no, se
+        reclama el primer bloque libre por encima de todos los reclamados y de los codigos existentes.
+        """
+        codigos = pd.Series(codigos, dtype=np.int64)
+        bloques = codigos // TAMANO_BLOQUE_CODIGOS
+        for bloque in sorted(bloques.unique(), reverse=True):
+            if self._duenio_bloque(bloque) == self.nombre:
+                siguiente = codigos[bloques == bloque].max() + 1
+                if siguiente // TAMANO_BLOQUE_CODIGOS == bloque:
+                    return int(siguiente)
+                break
+
+        directorio = os.path.join(self.raiz, DIRECTORIO_CODIGOS)
+        reclamados = [int(n) for n in os.listdir(directorio) if n.isdigit()] if os.path.isdir(directorio) else []
+        bloque = max(reclamados + [int(bloques.max()) if len(bloques) else 0]) + 1
+        while not self._reclamar_bloque(bloque):
+            bloque += 1
+        return bloque * TAMANO_BLOQUE_CODIGOS
+
+# --- TRANSFERENCIAS ---
+
+def nuevo_id_transferencia():
+    return f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+def motivo_envio(id_transferencia, destino):
+    return f"Transferencia a {destino} ({id_transferencia})"
+
+def motivo_recepcion(id_transferencia, origen):
+    return f"Transferencia desde {origen} ({id_transferencia})"
+
+def lineas_envio(id_transferencia, origen, df_salida, producto):
+    """
+    Lineas de bandeja de una transferencia: las filas de df_salida (movimientos negativos del
+    origen, uno por lote) en positivo, con los datos de catalogo del producto (fila de df_productos).
+    """
+    df_envio = pd.DataFrame({
+        "Id_Transferencia": id_transferencia,
+        "Fecha": df_salida["Fecha"].to_numpy(),
+        "Origen": origen,
+        "Codigo_Producto": df_salida["Codigo_Producto"].to_numpy(),
+        "Cantidad": -df_salida["Cantidad"].to_numpy(),
+        "Vencimiento_Lote": df_salida["Vencimiento_Lote"].to_numpy(),
+        "Responsable": df_salida["Responsable"].astype(str).to_numpy(),
+    })
+    for columna in COLUMNAS_CATALOGO:
+        df_envio[columna] = producto.get(columna, "")
+    return df_envio
+
+def movimientos_recibidos(df_bandeja, fecha):
+    """
+    Movimientos Transferencia positivos que registra el destino por las lineas de su bandeja.
+    Llevan como Id_Transaccion el id de la transferencia, igual que las lineas del origen.
+    """
+    motivos = [motivo_recepcion(i, o) for i, o in zip(df_bandeja["Id_Transferencia"], df_bandeja["Origen"])]
+    return pd.DataFrame({
+        "Fecha": fecha,
+        "Codigo_Producto": df_bandeja["Codigo_Producto"].to_numpy(),
+        "Tipo": TIPO_TRANSFERENCIA,
+        "Cantidad": df_bandeja["Cantidad"].to_numpy(),
+        "Responsable": df_bandeja["Responsable"].fillna("").to_numpy(),
+        "Motivo": motivos,
+        "Vencimiento_Lote": df_bandeja["Vencimiento_Lote"].to_numpy(),
+        "Id_Transaccion": df_bandeja["Id_Transferencia"].astype(str).to_numpy(),
+    })[COLUMNAS_IMPORTADAS]
+
+def ids_recibidos(df_movimientos):
+    """
+    Ids de las transferencias que ya recibio la ubicacion de df_movimientos (sus movimientos
+    Transferencia positivos).
+    """
+    recibidos = (df_movimientos["Tipo"] == TIPO_TRANSFERENCIA) & (df_movimientos["Cantidad"] > 0)
+    return set(df_movimientos.loc[recibidos, "Id_Transaccion"].astype(str))
+
+def alta_recibida(linea, fecha):
+    """
+    Fila de producto (stock 0) para un codigo que llega por transferencia y el destino no tiene.
+    """
+    return pd.DataFrame({
+        "Codigo": [linea["Codigo_Producto"]],
+        "Nombre": [linea["Nombre"]],
+        "Categoria": [linea["Categoria"]],
+        "Descripcion": [linea["Descripcion"]],
+        "Stock_Inicial": [0],
+        "Stock_Actual": [0],
+        "Stock_Minimo": [linea["Stock_Minimo"]],
+        "Fecha_Entrada": [fecha],
+        "Fecha_Vencimiento": [pd.NaT],
+        "Costo": [linea["Costo"]],
+        "Precio_Venta": [linea["Precio_Venta"]],
+    })
+
+# --- VISTA CONSOLIDADA ---
+
+def consolidado(raiz=None):
+    """
+    Una fila por producto: Codigo, Nombre, Categoria, el stock en cada ubicacion (una columna por
+    ubicacion), En_Transito (enviado y todavia no recibido) y Total.
+    """
+    raiz = raiz or os.environ.get("GESTOR_UBICACIONES", DIRECTORIO_UBICACIONES)
+    stocks, catalogos, transito = {}, [], []
+    for nombre in listar_ubicaciones(raiz):
+        ubicacion = Ubicacion(nombre, raiz)
+        almacenamiento = ubicacion.almacenamiento()
+        df = almacenamiento.leer_productos()
+        stocks[nombre] = df.set_index("Codigo")["Stock_Actual"]
+        catalogos.append(df[["Codigo", "Nombre", "Categoria"]].astype({"Categoria": str}))
+        recibidas = ids_recibidos(almacenamiento.leer_movimientos())
+        transito.append(ubicacion.bandeja.pendientes(recibidas)[["Codigo_Producto", "Cantidad"]])
+    if not stocks:
+        return pd.DataFrame(columns=["Codigo", "Nombre", "Categoria", "En_Transito", "Total"])
+
+    df = pd.concat(catalogos, ignore_index=True).drop_duplicates("Codigo").set_index("Codigo").sort_index()
+    for nombre, stock in stocks.items():
+        df[nombre] = stock.reindex(df.index).fillna(0).astype(np.int64)
+    df_transito = pd.concat(transito, ignore_index=True)
+    en_transito = df_transito["Cantidad"].astype(np.int64).groupby(df_transito["Codigo_Producto"].astype(np.int64)).sum()
+    df["En_Transito"] = en_transito.reindex(df.index, fill_value=0)
+    df["Total"] = df[list(stocks)].sum(axis=1) + df["En_Transito"]
+    return df.reset_index()
+
+# --- ALTA DE UBICACIONES ---
+
+def crear_ubicacion(nombre, raiz=None, desde=None, catalogo=None):
+    """
+    Crea la carpeta de una ubicacion nueva. desde: directorio con datos existentes que se copian
+    tal cual (para pasar una instalacion de una sola ubicacion, con la app detenida). catalogo: otra
+    ubicacion de la que se copia el catalogo, con stock 0 y sin lotes ni movimientos.
+    """
+    ubicacion = Ubicacion(nombre, raiz)
+    if os.path.exists(ubicacion.directorio):
+        raise FileExistsError(f"La ubicacion '{nombre}' ya existe.")
+    if (desde is None) == (catalogo is None):
+        raise ValueError("Hay que indicar desde o catalogo (uno solo).")
+
+    if desde is not None:
+        os.makedirs(ubicacion.directorio)
+        archivo_bd = os.path.basename(os.environ.get("GESTOR_BD", ARCHIVO_BD))
+        for archivo in (ARCHIVO_PRODUCTOS, ARCHIVO_MOVIMIENTOS, ARCHIVO_LOTES, ARCHIVO_CHECKPOINTS, archivo_bd):
+            if os.path.exists(os.path.join(desde, archivo)):
+                shutil.copy2(os.path.join(desde, archivo), ubicacion.directorio)
+        return ubicacion
+
+    df_productos = Ubicacion(catalogo, raiz).almacenamiento().leer_productos()
+    df_productos = df_productos.drop(columns=[c for c in COLUMNAS_DERIVADAS if c in df_productos.columns])
+    df_productos = df_productos.assign(Stock_Inicial=0, Stock_Actual=0, Stock_Viejo_Restante=0,
+                                       Fecha_Entrada=pd.Timestamp(datetime.now().date()),
+                                       Fecha_Vencimiento=pd.NaT, Fecha_Vencimiento_Pendiente=pd.NaT)
+    os.makedirs(ubicacion.directorio)
+    almacenamiento = ubicacion.almacenamiento(crear=True)
+    if isinstance(almacenamiento, AlmacenamientoCSV):
+        almacenamiento.guardar_productos(df_productos)
+        almacenamiento.guardar_lotes(LibroLotes())
+        df_movimientos = pd.DataFrame({c: pd.Series(dtype="datetime64[ns]" if c in ("Fecha", "Vencimiento_Lote") else object)
+                                       for c in COLUMNAS_IMPORTADAS})
+        almacenamiento.guardar_movimientos(df_movimientos)
+    else:
+        almacenamiento.confirmar(df_productos, LibroLotes().a_dataframe(), set(df_productos["Codigo"]), set(), None, None)
+    return ubicacion
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ubicaciones del inventario")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_crear = sub.add_parser("crear", help="Crea una ubicacion nueva")
+    p_crear.add_argument("nombre")
+    origen = p_crear.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--desde", help="Directorio con los datos actuales (se copian)")
+    origen.add_argument("--catalogo", help="Ubicacion de la que se copia el catalogo, con stock 0")
+    sub.add_parser("consolidado", help="Stock de todas las ubicaciones")
+    parser.add_argument("--raiz", default=None, help=f"Carpeta de las ubicaciones (por defecto GESTOR_UBICACIONES o '{DIRECTORIO_UBICACIONES}')")
+    args = parser.parse_args()
+
+    if args.comando == "crear":
+        ubicacion = crear_ubicacion(args.nombre, args.raiz, args.desde, args.catalogo)
+        print(f"Ubicacion '{ubicacion.nombre}' creada en {ubicacion.directorio}/")
+    else:
+        with pd.option_context("display.max_rows", 50, "display.width", 200):
+            print(consolidado(args.raiz))